@@ -4,7 +4,6 @@ import os
 import random
 import re
 import traceback
-import xml.etree.ElementTree as ET
 
 from System.Collections.Generic import List
 
@@ -14,6 +13,9 @@ clr.AddReference("RevitAPIUI")
 from Autodesk.Revit import DB, UI
 
 import WWP_uiUtils as ui
+from context_core import extract as context_extract
+from context_core import geometry as context_geometry
+from context_core import spatial as context_spatial
 
 
 TITLE = "Building Importer"
@@ -35,12 +37,6 @@ def _get_doc():
         return None
 
 
-def _strip_ns(tag_name):
-    if "}" in tag_name:
-        return tag_name.split("}", 1)[1]
-    return tag_name
-
-
 def _meters_to_internal(value_m):
     try:
         return DB.UnitUtils.ConvertToInternalUnits(float(value_m), DB.UnitTypeId.Meters)
@@ -203,91 +199,80 @@ def _prompt_material(doc):
     return ids[selected_indices[0]]
 
 
+def _way_record(record):
+    return {"refs": record[4], "tags": record[2]}
+
+
 def _load_osm(path):
-    tree = ET.parse(path)
-    root = tree.getroot()
+    """Stream the .osm file, keeping only what building footprints need.
 
-    nodes = {}
+    The first pass reads ways and relations: building ways, building
+    relations and untagged ways (possible multipolygon members) are kept. The
+    last pass stores just the nodes those ways reference in a flat coordinate
+    array. Returns (nodes, ways, relations, origin).
+    """
     ways = {}
+    loose_ways = {}
     relations = []
     bounds = None
 
-    for element in root:
-        element_name = _strip_ns(element.tag)
-
-        if element_name == "bounds":
-            bounds = {
-                "minlat": float(element.attrib.get("minlat", 0.0)),
-                "minlon": float(element.attrib.get("minlon", 0.0)),
-                "maxlat": float(element.attrib.get("maxlat", 0.0)),
-                "maxlon": float(element.attrib.get("maxlon", 0.0)),
-            }
+    for record in context_extract.iter_osm_xml(path, nodes=False):
+        kind = record[0]
+        if kind == "bounds":
+            bounds = {"minlat": record[1], "minlon": record[2], "maxlat": record[3], "maxlon": record[4]}
+        elif kind == "way":
+            if _is_building(record[2]):
+                ways[str(record[1])] = _way_record(record)
+            elif not record[2]:
+                loose_ways[str(record[1])] = _way_record(record)
+        elif kind == "relation" and _is_building(record[2]):
+            members = [
+                {"type": member_type, "ref": str(ref), "role": (role or "").strip().lower()}
+                for member_type, ref, role in record[4]
+            ]
+            relations.append({"id": str(record[1]), "members": members, "tags": record[2]})
+
+    member_way_ids = set(
+        member["ref"] for relation in relations for member in relation["members"] if member["type"] == "way"
+    )
+    for way_id in member_way_ids:
+        if way_id not in ways and way_id in loose_ways:
+            ways[way_id] = loose_ways[way_id]
+    loose_ways = None
+
+    missing_way_ids = member_way_ids.difference(ways)
+    if missing_way_ids:
+        for record in context_extract.iter_osm_xml(path, nodes=False, relations=False):
+            if record[0] == "way" and str(record[1]) in missing_way_ids:
+                ways[str(record[1])] = _way_record(record)
+
+    referenced = set(ref for way in ways.values() for ref in way["refs"])
+    nodes = context_extract.NodeStore()
+    total_lat = 0.0
+    total_lon = 0.0
+    node_count = 0
+    for record in context_extract.iter_osm_xml(path, ways=False, relations=False):
+        if record[0] != "node":
             continue
+        total_lat += record[2]
+        total_lon += record[3]
+        node_count += 1
+        if record[1] in referenced:
+            nodes.add(record[1], record[2], record[3])
 
-        if element_name == "node":
-            node_id = element.attrib.get("id")
-            if not node_id:
-                continue
-            nodes[node_id] = (
-                float(element.attrib.get("lat", 0.0)),
-                float(element.attrib.get("lon", 0.0)),
-            )
-            continue
+    return nodes, ways, relations, _get_projection_origin(bounds, total_lat, total_lon, node_count)
 
-        if element_name == "way":
-            way_id = element.attrib.get("id")
-            refs = []
-            tags = {}
-            for child in element:
-                child_name = _strip_ns(child.tag)
-                if child_name == "nd":
-                    refs.append(child.attrib.get("ref"))
-                elif child_name == "tag":
-                    tags[child.attrib.get("k")] = child.attrib.get("v")
-            if way_id:
-                ways[way_id] = {"refs": refs, "tags": tags}
-            continue
 
-        if element_name == "relation":
-            relation_id = element.attrib.get("id")
-            members = []
-            tags = {}
-            for child in element:
-                child_name = _strip_ns(child.tag)
-                if child_name == "member":
-                    members.append(
-                        {
-                            "type": child.attrib.get("type"),
-                            "ref": child.attrib.get("ref"),
-                            "role": (child.attrib.get("role") or "").strip().lower(),
-                        }
-                    )
-                elif child_name == "tag":
-                    tags[child.attrib.get("k")] = child.attrib.get("v")
-            if relation_id:
-                relations.append({"id": relation_id, "members": members, "tags": tags})
-
-    return nodes, ways, relations, bounds
-
-
-def _get_projection_origin(bounds, nodes):
+def _get_projection_origin(bounds, total_lat, total_lon, node_count):
     if bounds:
         return (
             (bounds["minlat"] + bounds["maxlat"]) / 2.0,
             (bounds["minlon"] + bounds["maxlon"]) / 2.0,
         )
 
-    if not nodes:
+    if not node_count:
         return 0.0, 0.0
-
-    total_lat = 0.0
-    total_lon = 0.0
-    count = 0
-    for lat, lon in nodes.values():
-        total_lat += lat
-        total_lon += lon
-        count += 1
-    return total_lat / float(count), total_lon / float(count)
+    return total_lat / float(node_count), total_lon / float(node_count)
 
 
 def _project_latlon(lat, lon, origin_lat, origin_lon):
@@ -355,34 +340,11 @@ def _assemble_rings(way_ids, ways):
         refs = [node_ref for node_ref in (way.get("refs") or []) if node_ref]
         if len(refs) < 2:
             continue
-        segments.append(list(refs))
+        segments.append(refs)
 
     rings = []
-    while segments:
-        chain = segments.pop(0)
-        progressed = True
-        while progressed and chain and chain[0] != chain[-1]:
-            progressed = False
-            for index, refs in enumerate(segments):
-                start_ref = refs[0]
-                end_ref = refs[-1]
-
-                if chain[-1] == start_ref:
-                    chain.extend(refs[1:])
-                elif chain[-1] == end_ref:
-                    chain.extend(list(reversed(refs[:-1])))
-                elif chain[0] == end_ref:
-                    chain = refs[:-1] + chain
-                elif chain[0] == start_ref:
-                    chain = list(reversed(refs[1:])) + chain
-                else:
-                    continue
-
-                segments.pop(index)
-                progressed = True
-                break
-
-        if chain and chain[0] == chain[-1] and len(set(chain[:-1])) >= 3:
+    for chain in context_geometry.stitch_segments(segments, [(refs[0], refs[-1]) for refs in segments]):
+        if chain[0] == chain[-1] and len(set(chain[:-1])) >= 3:
             rings.append(chain)
 
     return rings
@@ -412,8 +374,8 @@ def _point_in_polygon(point, polygon):
     return inside
 
 
-def _build_features(nodes, ways, relations, bounds):
-    origin_lat, origin_lon = _get_projection_origin(bounds, nodes)
+def _build_features(nodes, ways, relations, origin):
+    origin_lat, origin_lon = origin
     features = []
     relation_way_ids = set()
 
@@ -455,18 +417,23 @@ def _build_features(nodes, ways, relations, bounds):
             if projected:
                 projected_inners.append(projected)
 
-        for outer_index, outer_ring in enumerate(projected_outers):
-            assigned_inners = []
-            for inner_ring in projected_inners:
-                if _point_in_polygon(inner_ring[0], outer_ring):
-                    assigned_inners.append(inner_ring)
+        assigned_inners = [[] for _ in projected_outers]
+        outer_index = context_spatial.BoxGridIndex(
+            [context_geometry.ring_bounds(outer_ring) + (position,) for position, outer_ring in enumerate(projected_outers)]
+        )
+        for inner_ring in projected_inners:
+            first_point = inner_ring[0]
+            for position in outer_index.query_point(first_point[0], first_point[1]):
+                if _point_in_polygon(first_point, projected_outers[position]):
+                    assigned_inners[position].append(inner_ring)
 
+        for position, outer_ring in enumerate(projected_outers):
             features.append(
                 {
-                    "id": "relation/{}:{}".format(relation["id"], outer_index + 1),
+                    "id": "relation/{}:{}".format(relation["id"], position + 1),
                     "tags": tags,
                     "outer": outer_ring,
-                    "inners": assigned_inners,
+                    "inners": assigned_inners[position],
                 }
             )
 
@@ -696,8 +663,8 @@ def main():
         UI.TaskDialog.Show(TITLE, "Selected file does not exist:\n{}".format(file_path))
         return
 
-    nodes, ways, relations, bounds = _load_osm(file_path)
-    features = _build_features(nodes, ways, relations, bounds)
+    nodes, ways, relations, origin = _load_osm(file_path)
+    features = _build_features(nodes, ways, relations, origin)
     if not features:
         UI.TaskDialog.Show(TITLE, "No closed OSM building footprints were found.")
         return
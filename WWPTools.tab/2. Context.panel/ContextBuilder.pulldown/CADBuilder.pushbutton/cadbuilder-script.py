@@ -24,6 +24,9 @@ from pyrevit import DB, revit, script
 clr.AddReference("RevitAPIUI")
 from Autodesk.Revit import UI
 
+import WWP_cadUtils as cadu
+from context_core import segments as context_segments
+
 
 TITLE = "CAD Builder"
 APP_ID = "WWPTools.CADBuilder"
@@ -39,7 +42,7 @@ def _elem_id_int(eid):
     try:
         return int(eid.Value)      # Revit 2024+
     except AttributeError:
-        return int(eid.Value)  # Revit 2023-
+        return int(eid.IntegerValue)  # Revit 2023-
 
 def _load_uiutils():
     script_dir = os.path.dirname(__file__)
@@ -201,34 +204,6 @@ def _get_layer_names(import_instance):
     return []
 
 
-def _walk_geometry(geom_elem, transform):
-    for obj in geom_elem:
-        if isinstance(obj, DB.GeometryInstance):
-            next_transform = transform.Multiply(obj.Transform) if transform else obj.Transform
-            symbol_geometry = obj.SymbolGeometry
-            if symbol_geometry is None:
-                continue
-            for sub_obj in _walk_geometry(symbol_geometry, next_transform):
-                yield sub_obj
-        else:
-            yield obj, transform
-
-
-def _get_layer_name(doc, geom_obj):
-    if geom_obj is None:
-        return None
-    try:
-        graphics_style_id = geom_obj.GraphicsStyleId
-    except Exception:
-        return None
-    if graphics_style_id == DB.ElementId.InvalidElementId:
-        return None
-    graphics_style = doc.GetElement(graphics_style_id)
-    if isinstance(graphics_style, DB.GraphicsStyle) and graphics_style.GraphicsStyleCategory:
-        return graphics_style.GraphicsStyleCategory.Name
-    return None
-
-
 def _distance(point_a, point_b):
     try:
         return point_a.DistanceTo(point_b)
@@ -236,15 +211,6 @@ def _distance(point_a, point_b):
         return 0.0
 
 
-def _point_key(point, tolerance):
-    tol = tolerance or 1e-6
-    return (
-        int(round(point.X / tol)),
-        int(round(point.Y / tol)),
-        int(round(point.Z / tol)),
-    )
-
-
 def _point_key_xy(point, tolerance):
     tol = tolerance or 1e-6
     return (
@@ -325,19 +291,14 @@ def _collect_geometry(doc, import_instance, selected_layers, tolerance):
 
     geometry = import_instance.get_Geometry(options)
     if not geometry:
-        return {}, {}
+        return {}, {}, {}
 
     rings_by_layer = defaultdict(list)
     segments_by_layer = defaultdict(list)
     stats_by_layer = defaultdict(lambda: {"objects": 0, "closed": 0, "segments": 0})
 
-    for geom_obj, transform in _walk_geometry(geometry, None):
-        if geom_obj is None:
-            continue
-        layer_name = _get_layer_name(doc, geom_obj)
-        if not layer_name or layer_name not in selected_layers:
-            continue
-
+    walker = cadu.LayerWalker(doc, selected_layers)
+    for geom_obj, transform, layer_name in walker.walk(geometry):
         stats = stats_by_layer[layer_name]
         stats["objects"] += 1
 
@@ -368,79 +329,30 @@ def _collect_geometry(doc, import_instance, selected_layers, tolerance):
             segments_by_layer[layer_name].append((start_point, end_point))
             stats["segments"] += 1
 
-    return {"rings": rings_by_layer, "segments": segments_by_layer}, stats_by_layer
+    return {"rings": rings_by_layer, "segments": segments_by_layer}, stats_by_layer, walker.stats
 
 
 def _build_rings_from_segments(segments, tolerance):
-    unique_segments = []
-    seen_keys = set()
-    for start_point, end_point in segments or []:
-        if _distance(start_point, end_point) <= tolerance:
-            continue
-        start_key = _point_key(start_point, tolerance)
-        end_key = _point_key(end_point, tolerance)
-        if start_key == end_key:
-            continue
-        segment_key = tuple(sorted((start_key, end_key)))
-        if segment_key in seen_keys:
-            continue
-        seen_keys.add(segment_key)
-        unique_segments.append((start_point, end_point))
-
-    adjacency = defaultdict(list)
-    for index, (start_point, end_point) in enumerate(unique_segments):
-        adjacency[_point_key(start_point, tolerance)].append((index, True))
-        adjacency[_point_key(end_point, tolerance)].append((index, False))
-
-    used = [False] * len(unique_segments)
-    rings = []
-    discarded = 0
-
-    for index, (start_point, end_point) in enumerate(unique_segments):
-        if used[index]:
-            continue
-
-        used[index] = True
-        chain = [start_point, end_point]
-
-        while True:
-            if len(chain) >= 4 and _point_key(chain[-1], tolerance) == _point_key(chain[0], tolerance):
-                ring = _close_points(chain, tolerance)
-                if len(ring) >= 4:
-                    rings.append(ring)
-                else:
-                    discarded += 1
-                break
-
-            current_key = _point_key(chain[-1], tolerance)
-            previous_key = _point_key(chain[-2], tolerance) if len(chain) > 1 else None
-
-            forward_choice = None
-            fallback_choice = None
-            for candidate_index, use_start in adjacency.get(current_key, []):
-                if used[candidate_index]:
-                    continue
-                seg_start, seg_end = unique_segments[candidate_index]
-                next_point = seg_end if use_start else seg_start
-                next_key = _point_key(next_point, tolerance)
-                candidate = (candidate_index, next_point)
-                if previous_key is not None and next_key == previous_key:
-                    if fallback_choice is None:
-                        fallback_choice = candidate
-                    continue
-                forward_choice = candidate
-                break
-
-            chosen = forward_choice or fallback_choice
-            if chosen is None:
-                discarded += 1
-                break
-
-            candidate_index, next_point = chosen
-            used[candidate_index] = True
-            chain.append(next_point)
-
-    return rings, discarded
+    """Rings from the faces of the snapped segment graph, and the number of dangling segments dropped."""
+    segment_tuples = [((start.X, start.Y, start.Z), (end.X, end.Y, end.Z)) for start, end in segments or []]
+    rings, stats = context_segments.planar_rings(segment_tuples, tolerance)
+    return [[DB.XYZ(x_value, y_value, z_value) for x_value, y_value, z_value in ring] for ring in rings], stats["dangling"]
+
+
+def _export_segment_fixture(geometry_by_layer, tolerance, ui):
+    path = ui.uiUtils_save_file_dialog(
+        title="Export CAD Segment Fixture",
+        filter_text="JSON files (*.json)|*.json",
+        default_extension="json",
+        file_name="cad-segments.json",
+    )
+    if not path:
+        return
+    segments_by_layer = dict(
+        (layer_name, [((start.X, start.Y, start.Z), (end.X, end.Y, end.Z)) for start, end in layer_segments])
+        for layer_name, layer_segments in (geometry_by_layer.get("segments") or {}).items()
+    )
+    context_segments.write_segment_fixture(path, segments_by_layer, tolerance, units="feet")
 
 
 def _signed_area_xy(points):
@@ -663,12 +575,13 @@ def _create_mass(doc, feature, import_instance_name, tolerance):
     raise Exception("; ".join(errors[:4]))
 
 
-def _build_preview(import_instance, selected_layers, features, min_height_m, max_height_m, layer_feature_counts, discarded_counts):
+def _build_preview(import_instance, selected_layers, features, min_height_m, max_height_m, layer_feature_counts, discarded_counts, walk_stats):
     lines = [
         "CAD import: {}".format(import_instance.Name),
         "Selected layers: {}".format(", ".join(selected_layers)),
         "Detected footprints: {}".format(len(features)),
         "Random height range (m): {:.2f} - {:.2f}".format(min_height_m, max_height_m),
+        cadu.walk_stats_text(walk_stats),
         "",
         "By layer:",
     ]
@@ -780,7 +693,9 @@ def main():
 
     point_tolerance = max(doc.Application.ShortCurveTolerance, _meters_to_internal(0.01))
     min_area_internal = _meters_to_internal(1.0) * _meters_to_internal(1.0)
-    geometry_by_layer, stats_by_layer = _collect_geometry(doc, import_instance, set(selected_layers), point_tolerance)
+    geometry_by_layer, stats_by_layer, walk_stats = _collect_geometry(doc, import_instance, set(selected_layers), point_tolerance)
+    if __shiftclick__:  #pylint: disable=E0602
+        _export_segment_fixture(geometry_by_layer, point_tolerance, ui)
 
     features = []
     discarded_counts = {}
@@ -796,7 +711,7 @@ def main():
             direct_rings + segment_rings,
             point_tolerance,
             min_area_internal,
-            "cad:{}:{}"._elem_id_int(format(import_instance.Id), layer_name),
+            "cad:{}:{}".format(_elem_id_int(import_instance.Id), layer_name),
         )
         features.extend(layer_features)
         discarded_counts[layer_name] = discarded_count
@@ -813,6 +728,7 @@ def main():
                     stats.get("segments", 0),
                 )
             )
+        lines.append(cadu.walk_stats_text(walk_stats))
         _show_alert(TITLE, "\n".join(lines), ui)
         return
 
@@ -828,6 +744,7 @@ def main():
         max_height_m,
         layer_feature_counts,
         discarded_counts,
+        walk_stats,
     )
     if not ui.uiUtils_show_text_report(
         "{} - Preview".format(TITLE),
@@ -16,6 +16,13 @@ from Autodesk.Revit import DB, UI
 TITLE = "DirectShape To Mass"
 SOURCE_APP_IDS = ("WWPTools.WebContextBuilder", "WWPTools.BuildingImporter")
 MAX_FAILURES_IN_REPORT = 30
+SIGNATURE_MEASURE_DIGITS = 6
+SIGNATURE_POSITION_DIGITS = 4
+DEFAULT_PACK_FAMILY_COUNT = 8
+CONVERSION_MODE_LABELS = (
+    "One family per source element",
+    "Batch: shared families for identical shapes",
+)
 DEBUG_LOG_FILE_NAME = "DirectShapeToMass.debug.log"
 _DEBUG_LOG_BUFFER = []
 SOURCE_CATEGORIES = (
@@ -62,13 +69,17 @@ if lib_path not in sys.path:
     sys.path.append(lib_path)
 
 import WWP_uiUtils as ui
+from context_core import batching as context_batching
+from context_core import cache as context_cache
+from context_core import family_cache as context_family_cache
+from context_core import mesh as context_mesh
 
 
 def _elem_id_int(eid):
     try:
         return int(eid.Value)      # Revit 2024+
     except AttributeError:
-        return int(eid.Value)  # Revit 2023-
+        return int(eid.IntegerValue)  # Revit 2023-
 
 
 def _get_uidoc():
@@ -306,25 +317,42 @@ def _iter_category_elements(doc):
         return elements
 
 
-def _mesh_to_solid(mesh):
-    """Try to convert a DB.Mesh to a DB.Solid using TessellatedShapeBuilder."""
-    try:
-        builder = DB.TessellatedShapeBuilder()
+class _MeshSolidConverter(object):
+    """Turns DB.Mesh objects into solids through one reused TessellatedShapeBuilder.
+
+    Vertices are welded and coplanar triangles merged into polygon faces
+    (context_core.mesh) before the builder sees them; if the merged faces do
+    not close into a solid the welded triangles are tried once more.
+    """
+
+    def __init__(self, tolerance=None):
+        self.tolerance = tolerance or context_mesh.DEFAULT_WELD_TOLERANCE
+        self.builder = None
+        self.stats = {"meshes": 0, "solids": 0, "triangles": 0, "faces": 0}
+
+    def _build(self, vertices, faces):
+        if self.builder is None:
+            self.builder = DB.TessellatedShapeBuilder()
+        else:
+            self.builder.Clear()
+        builder = self.builder
+        points = [DB.XYZ(vertex[0], vertex[1], vertex[2]) for vertex in vertices]
         builder.OpenConnectedFaceSet(False)
-        for i in range(mesh.NumTriangles):
+        for face in faces:
+            loop = List[DB.XYZ]()  # type: ignore[misc]
+            for index in face:
+                loop.Add(points[index])  # type: ignore[union-attr]
             try:
-                tri = mesh.get_Triangle(i)
-                pts = List[DB.XYZ]()  # type: ignore[misc]
-                pts.Add(tri.get_Vertex(0))  # type: ignore[union-attr]
-                pts.Add(tri.get_Vertex(1))  # type: ignore[union-attr]
-                pts.Add(tri.get_Vertex(2))  # type: ignore[union-attr]
-                builder.AddFace(DB.TessellatedFace(pts, DB.ElementId.InvalidElementId))  # type: ignore[arg-type]
+                builder.AddFace(DB.TessellatedFace(loop, DB.ElementId.InvalidElementId))  # type: ignore[arg-type]
             except Exception:
                 pass
         builder.CloseConnectedFaceSet()
         builder.Target = DB.TessellatedShapeBuilderTarget.Solid  # type: ignore[misc]
         builder.Fallback = DB.TessellatedShapeBuilderFallback.Mesh  # type: ignore[misc]
+        # Build() returned the result up to Revit 2015; later versions hand it out through GetBuildResult().
         result = builder.Build()
+        if result is None:
+            result = builder.GetBuildResult()
         if result is None:
             return None
         for geo_obj in result.GetGeometricalObjects():  # type: ignore[union-attr]
@@ -334,12 +362,34 @@ def _mesh_to_solid(mesh):
                         return geo_obj
                 except Exception:
                     pass
-    except Exception:
-        pass
-    return None
+        return None
+
+    def to_solid(self, mesh):
+        self.stats["meshes"] += 1
+        try:
+            points = [(vertex.X, vertex.Y, vertex.Z) for vertex in mesh.Vertices]
+            triangles = []
+            for i in range(mesh.NumTriangles):
+                tri = mesh.get_Triangle(i)
+                triangles.append((tri.get_Index(0), tri.get_Index(1), tri.get_Index(2)))
+            vertices, welded, _ = context_mesh.weld_triangles(points, triangles, self.tolerance)
+            faces, _ = context_mesh.merge_coplanar(vertices, welded, distance_tolerance=self.tolerance)
+            self.stats["triangles"] += len(triangles)
+            self.stats["faces"] += len(faces)
+
+            solid = self._build(vertices, faces)
+            if solid is None and len(faces) < len(welded):
+                _log_debug("Merged mesh faces did not build a solid; retrying with {} welded triangles.".format(len(welded)))
+                solid = self._build(vertices, welded)
+            if solid is not None:
+                self.stats["solids"] += 1
+            return solid
+        except Exception as ex:
+            _log_debug("Mesh to solid conversion failed: {}".format(ex))
+        return None
 
 
-def _iter_solids(geometry_element):
+def _iter_solids(geometry_element, mesh_converter=None):
     solids = []
     fallback_meshes = []
     if geometry_element is None:
@@ -356,21 +406,100 @@ def _iter_solids(geometry_element):
             fallback_meshes.append(geometry_object)
         elif isinstance(geometry_object, DB.GeometryInstance):
             try:
-                solids.extend(_iter_solids(geometry_object.GetInstanceGeometry()))
+                solids.extend(_iter_solids(geometry_object.GetInstanceGeometry(), mesh_converter))
             except Exception:
                 pass
 
     # No Brep solids found - try converting any meshes to solids
-    if not solids:
+    if not solids and fallback_meshes:
+        if mesh_converter is None:
+            mesh_converter = _MeshSolidConverter()
         for mesh in fallback_meshes:
-            solid = _mesh_to_solid(mesh)
+            solid = mesh_converter.to_solid(mesh)
             if solid is not None:
                 solids.append(solid)
 
     return solids
 
 
-def _get_element_solids(element):
+class _GeometrySignatures(object):
+    """Per-run geometry signatures of solids: volume, surface area, face count and bounding box.
+
+    dedupe() drops repeats of a solid within an element with one dict lookup
+    per solid. shape_of() gives a translation-invariant signature of an
+    element's solids, so shapes repeated across elements can be found without
+    comparing geometry pairwise.
+    """
+
+    def __init__(self):
+        self._shapes = {}
+        self._shape_counts = {}
+        self.stats = {"solids": 0, "duplicate_solids": 0, "elements": 0, "repeated_elements": 0}
+
+    def _measure(self, solid):
+        bounding_box = solid.GetBoundingBox()
+        minimum = bounding_box.Transform.OfPoint(bounding_box.Min)
+        maximum = bounding_box.Transform.OfPoint(bounding_box.Max)
+        measures = (
+            round(solid.Volume, SIGNATURE_MEASURE_DIGITS),
+            round(solid.SurfaceArea, SIGNATURE_MEASURE_DIGITS),
+            solid.Faces.Size,
+            round(maximum.X - minimum.X, SIGNATURE_POSITION_DIGITS),
+            round(maximum.Y - minimum.Y, SIGNATURE_POSITION_DIGITS),
+            round(maximum.Z - minimum.Z, SIGNATURE_POSITION_DIGITS),
+        )
+        return measures, (minimum.X, minimum.Y, minimum.Z)
+
+    def dedupe(self, solids):
+        deduplicated = []
+        seen = set()
+        for solid in solids:
+            self.stats["solids"] += 1
+            try:
+                measures, minimum = self._measure(solid)
+                signature = measures + tuple(round(value, SIGNATURE_POSITION_DIGITS) for value in minimum)
+            except Exception:
+                deduplicated.append(solid)
+                continue
+            if signature in seen:
+                self.stats["duplicate_solids"] += 1
+                continue
+            seen.add(signature)
+            deduplicated.append(solid)
+        return deduplicated
+
+    def shape_of(self, element, solids):
+        """(origin, signature) for an element's solids; origin is their minimum corner, None if unmeasurable."""
+        element_id = _elem_id_int(element.Id)
+        if element_id in self._shapes:
+            return self._shapes[element_id]
+
+        try:
+            measured = [self._measure(solid) for solid in solids]
+        except Exception:
+            measured = []
+        if not measured:
+            shape = (None, ("element", element_id))
+        else:
+            origin = tuple(min(minimum[axis] for _, minimum in measured) for axis in range(3))
+            shape = (origin, tuple(sorted(
+                measures + tuple(round(minimum[axis] - origin[axis], SIGNATURE_POSITION_DIGITS) for axis in range(3))
+                for measures, minimum in measured
+            )))
+
+        self._shapes[element_id] = shape
+        self.stats["elements"] += 1
+        count = self._shape_counts.get(shape[1], 0)
+        self._shape_counts[shape[1]] = count + 1
+        if count:
+            self.stats["repeated_elements"] += 1
+        return shape
+
+    def is_repeated(self, element, solids):
+        return self._shape_counts.get(self.shape_of(element, solids)[1], 0) > 1
+
+
+def _get_element_solids(element, mesh_converter=None, signatures=None):
     options = DB.Options()
     try:
         options.IncludeNonVisibleObjects = True
@@ -378,18 +507,13 @@ def _get_element_solids(element):
         pass
 
     geometry = element.get_Geometry(options)
-    solids = _iter_solids(geometry)
+    solids = _iter_solids(geometry, mesh_converter)
     solids.sort(key=lambda solid: solid.Volume, reverse=True)
 
-    # Deduplicate solids with nearly identical volumes (same geometry instanced multiple times)
-    deduplicated = []
-    seen_volumes = []
-    for solid in solids:
-        vol = solid.Volume
-        if not any(abs(vol - v) < 1e-6 for v in seen_volumes):
-            deduplicated.append(solid)
-            seen_volumes.append(vol)
-    return deduplicated
+    # Drop solids repeated within the element (the same geometry reached twice through its instances).
+    if signatures is None:
+        signatures = _GeometrySignatures()
+    return signatures.dedupe(solids)
 
 
 def _get_candidate_elements(doc, uidoc):
@@ -557,9 +681,7 @@ def _get_solid_base_point(solids):
     return DB.XYZ(0.0, 0.0, 0.0)
 
 
-def _place_family_instance(doc, family, comment_text, placement_point=None):
-    if placement_point is None:
-        placement_point = DB.XYZ(0.0, 0.0, 0.0)
+def _get_family_symbol(doc, family):
     try:
         _log_debug("Placing family instance for family id={} name='{}'".format(_elem_id_int(family.Id), family.Name or "<unnamed>"))
     except Exception:
@@ -571,40 +693,91 @@ def _place_family_instance(doc, family, comment_text, placement_point=None):
     symbol = doc.GetElement(symbol_ids[0])
     if symbol is None:
         raise Exception("Failed to access the loaded family type.")
+    return symbol
+
+
+def _activate_symbol(doc, symbol):
+    try:
+        if hasattr(symbol, "IsActive") and not symbol.IsActive:
+            symbol.Activate()
+            doc.Regenerate()
+    except Exception:
+        pass
+
+
+def _new_family_instance(doc, symbol, placement_point, comment_text):
+    pt = placement_point
+    creation_attempts = [
+        lambda: doc.Create.NewFamilyInstance(pt, symbol, DB.Structure.StructuralType.NonStructural),
+        lambda: doc.Create.NewFamilyInstance(pt, symbol, doc.ActiveView),
+        lambda: doc.Create.NewFamilyInstance(pt, symbol, doc.GetElement(doc.ActiveView.GenLevel.Id), DB.Structure.StructuralType.NonStructural),
+    ]
+    errors = []
+    for attempt in creation_attempts:
+        try:
+            instance = attempt()
+            if instance is not None:
+                _set_comment(instance, comment_text)
+                _log_debug("Placed family instance id={}".format(_elem_id_int(instance.Id)))
+                return instance
+        except Exception as ex:
+            errors.append(str(ex))
+            _log_debug("Family placement attempt failed: {}".format(str(ex)))
+
+    raise Exception("Failed to place the generated mass family instance. {}".format("; ".join(errors[:5])))
+
+
+def _place_family_instance(doc, family, comment_text, placement_point=None):
+    if placement_point is None:
+        placement_point = DB.XYZ(0.0, 0.0, 0.0)
+    symbol = _get_family_symbol(doc, family)
 
     transaction = DB.Transaction(doc, "Place Converted Mass Family")
     started = False
     try:
         transaction.Start()
         started = True
+        _activate_symbol(doc, symbol)
+        instance = _new_family_instance(doc, symbol, placement_point, comment_text)
+        transaction.Commit()
+        return instance
+    except Exception:
+        if started:
+            try:
+                transaction.RollBack()
+            except Exception:
+                pass
+        raise
 
-        try:
-            if hasattr(symbol, "IsActive") and not symbol.IsActive:
-                symbol.Activate()
-                doc.Regenerate()
-        except Exception:
-            pass
 
-        pt = placement_point
-        creation_attempts = [
-            lambda: doc.Create.NewFamilyInstance(pt, symbol, DB.Structure.StructuralType.NonStructural),
-            lambda: doc.Create.NewFamilyInstance(pt, symbol, doc.ActiveView),
-            lambda: doc.Create.NewFamilyInstance(pt, symbol, doc.GetElement(doc.ActiveView.GenLevel.Id), DB.Structure.StructuralType.NonStructural),
-        ]
-        errors = []
-        for attempt in creation_attempts:
+def _move_to_elevation(doc, instance, placement_point):
+    """Level-based placement can drop the Z of the requested point; move the instance back up to it."""
+    try:
+        location = instance.Location
+        if isinstance(location, DB.LocationPoint) and abs(location.Point.Z - placement_point.Z) > 1e-6:
+            DB.ElementTransformUtils.MoveElement(doc, instance.Id, DB.XYZ(0.0, 0.0, placement_point.Z - location.Point.Z))
+    except Exception as ex:
+        _log_debug("Could not move instance {} to elevation {}: {}".format(_elem_id_int(instance.Id), placement_point.Z, ex))
+
+
+def _place_family_instances(doc, family, placements):
+    """Place one instance per (comment_text, point) in a single transaction; returns [(instance, error)] in order."""
+    symbol = _get_family_symbol(doc, family)
+    results = []
+    transaction = DB.Transaction(doc, "Place Converted Mass Families")
+    started = False
+    try:
+        transaction.Start()
+        started = True
+        _activate_symbol(doc, symbol)
+        for comment_text, placement_point in placements:
             try:
-                instance = attempt()
-                if instance is not None:
-                    _set_comment(instance, comment_text)
-                    transaction.Commit()
-                    _log_debug("Placed family instance id={}".format(_elem_id_int(instance.Id)))
-                    return instance
+                instance = _new_family_instance(doc, symbol, placement_point, comment_text)
+                _move_to_elevation(doc, instance, placement_point)
+                results.append((instance, None))
             except Exception as ex:
-                errors.append(str(ex))
-                _log_debug("Family placement attempt failed: {}".format(str(ex)))
-
-        raise Exception("Failed to place the generated mass family instance. {}".format("; ".join(errors[:5])))
+                results.append((None, str(ex)))
+        transaction.Commit()
     except Exception:
         if started:
             try:
@@ -612,6 +785,7 @@ def _place_family_instance(doc, family, comment_text, placement_point=None):
             except Exception:
                 pass
         raise
+    return results
 
 
 def _add_material_instance_param(family_doc, freeform_elements):
@@ -665,18 +839,7 @@ def _add_material_instance_param(family_doc, freeform_elements):
         _log_debug("No material parameter found on freeform element - association skipped.")
 
 
-def _convert_element_to_family(doc, element, solids, output_option):
-    _log_debug("Converting source element id={} type='{}' app_id='{}' app_data='{}' solids={}".format(
-        _elem_id_int(element.Id),
-        element.GetType().FullName if element is not None else "<none>",
-        (getattr(element, "ApplicationId", None) or ""),
-        (getattr(element, "ApplicationDataId", None) or ""),
-        len(solids),
-    ))
-    app = getattr(doc, "Application", None)
-    if app is None:
-        raise Exception("Unable to access the Revit application.")
-
+def _require_family_template(app, output_option):
     template_path = _find_family_template(app, output_option)
     if not template_path:
         template_root = getattr(app, "FamilyTemplatePath", None) or "<not set>"
@@ -687,9 +850,10 @@ def _convert_element_to_family(doc, element, solids, output_option):
             .format(_category_display_name(output_option["category"]), template_root, _category_display_name(output_option["category"]))
         )
     _log_debug("Using {} family template: {}".format(_category_display_name(output_option["category"]), template_path))
+    return template_path
 
-    elem_id = _elem_id_int(element.Id)
 
+def _get_source_key(doc, element):
     # Prefer IFC GUID (unique per element on IFC imports), then Exchange Name,
     # then ApplicationDataId, then type name, then fall back to element ID.
     source_key = _get_string_parameter(element, "IfcGUID")
@@ -709,11 +873,17 @@ def _convert_element_to_family(doc, element, solids, output_option):
         except Exception:
             pass
     if not source_key:
-        source_key = "Element_{}".format(elem_id)
+        source_key = "Element_{}".format(_elem_id_int(element.Id))
+    return source_key
 
-    family_prefix = output_option.get("family_prefix") or "WWP_ConvertedFamily"
-    family_name = _make_safe_name("{}_{}".format(family_prefix, source_key), "{}_{}".format(family_prefix, elem_id))
 
+def _build_family(doc, family_name, solid_entries, output_option):
+    """Create, save and load a family with one freeform per (solid, comment) entry; returns (family, family_path)."""
+    app = getattr(doc, "Application", None)
+    if app is None:
+        raise Exception("Unable to access the Revit application.")
+
+    template_path = _require_family_template(app, output_option)
     family_doc = app.NewFamilyDocument(template_path)
     if family_doc is None:
         raise Exception("Failed to open a new {} family document.".format(_category_display_name(output_option["category"])))
@@ -736,13 +906,12 @@ def _convert_element_to_family(doc, element, solids, output_option):
         if freeform_cls is None:
             raise Exception("This Revit version does not support FreeFormElement creation.")
 
-        source_comment = _get_comment(element)
         created_freeforms = []
-        for solid in solids:
+        for solid, comment_text in solid_entries:
             freeform = freeform_cls.Create(family_doc, solid)
             if freeform is None:
                 raise Exception("Revit did not create a freeform element in the {} family.".format(_category_display_name(output_option["category"])))
-            _set_comment(freeform, source_comment)
+            _set_comment(freeform, comment_text)
             created_freeforms.append(freeform)
 
         _add_material_instance_param(family_doc, created_freeforms)
@@ -774,13 +943,168 @@ def _convert_element_to_family(doc, element, solids, output_option):
         if load_error:
             raise Exception("Failed to load the generated {} family into the project. {}".format(_category_display_name(output_option["category"]), load_error))
         raise Exception("Failed to load the generated {} family into the project.".format(_category_display_name(output_option["category"])))
+    return family, family_path
 
-    comment_text = "Converted from DirectShape {}{}".format(
+
+def _converted_comment(element):
+    return "Converted from DirectShape {}{}".format(
         _elem_id_int(element.Id),
         " | {}".format(_get_comment(element)) if _get_comment(element) else "",
     )
+
+
+def _convert_element_to_family(doc, element, solids, output_option):
+    _log_debug("Converting source element id={} type='{}' app_id='{}' app_data='{}' solids={}".format(
+        _elem_id_int(element.Id),
+        element.GetType().FullName if element is not None else "<none>",
+        (getattr(element, "ApplicationId", None) or ""),
+        (getattr(element, "ApplicationDataId", None) or ""),
+        len(solids),
+    ))
+    elem_id = _elem_id_int(element.Id)
+    source_key = _get_source_key(doc, element)
+    family_prefix = output_option.get("family_prefix") or "WWP_ConvertedFamily"
+    family_name = _make_safe_name("{}_{}".format(family_prefix, source_key), "{}_{}".format(family_prefix, elem_id))
+
+    source_comment = _get_comment(element)
+    family, _ = _build_family(doc, family_name, [(solid, source_comment) for solid in solids], output_option)
+
     placement_point = _get_solid_base_point(solids)
-    return _place_family_instance(doc, family, comment_text, placement_point)
+    return _place_family_instance(doc, family, _converted_comment(element), placement_point)
+
+
+def _solid_sample_points(solids):
+    points = []
+    for solid in solids:
+        for edge in solid.Edges:
+            try:
+                for point in edge.Tessellate():
+                    points.append((point.X, point.Y, point.Z))
+            except Exception:
+                pass
+    return points
+
+
+def _group_by_shape(element_solids, signatures):
+    """[(shape key, [(element, solids, origin), ...])] in first-seen order.
+
+    Elements share a key when their solids are the same geometry up to a
+    translation; origin is each element's minimum corner. Only elements whose
+    geometry signature repeats in this run are hashed point by point.
+    """
+    groups = {}
+    order = []
+    for element, solids in element_solids:
+        origin, shape_key = None, None
+        if signatures.is_repeated(element, solids):
+            try:
+                origin, shape_key = context_family_cache.shape_key(_solid_sample_points(solids), [solid.Volume for solid in solids])
+            except Exception as ex:
+                _log_debug("Element {} shape hash failed: {}".format(_elem_id_int(element.Id), ex))
+        if shape_key is None:
+            origin = signatures.shape_of(element, solids)[0] or (0.0, 0.0, 0.0)
+            shape_key = "element/{}".format(_elem_id_int(element.Id))
+        if shape_key not in groups:
+            groups[shape_key] = []
+            order.append(shape_key)
+        groups[shape_key].append((element, solids, origin))
+    return [(shape_key, groups[shape_key]) for shape_key in order]
+
+
+def _convert_shared_shape(doc, shape_key, members, output_option):
+    """One family from the first member, moved to its origin, and an instance per member at its own origin."""
+    element, solids, origin = members[0]
+    to_local = DB.Transform.CreateTranslation(DB.XYZ(-origin[0], -origin[1], -origin[2]))
+    family_prefix = output_option.get("family_prefix") or "WWP_ConvertedFamily"
+    family_name = _make_safe_name("{}_Shape_{}".format(family_prefix, shape_key[:12]), "{}_Shape".format(family_prefix))
+    source_comment = _get_comment(element)
+    family, _ = _build_family(
+        doc,
+        family_name,
+        [(DB.SolidUtils.CreateTransformed(solid, to_local), source_comment) for solid in solids],
+        output_option,
+    )
+    _log_debug("Shared family '{}' holds shape {} for {} element(s).".format(family_name, shape_key[:12], len(members)))
+    return _place_family_instances(
+        doc,
+        family,
+        [(_converted_comment(member_element), DB.XYZ(member_origin[0], member_origin[1], member_origin[2])) for member_element, _, member_origin in members],
+    )
+
+
+def _convert_packed_shapes(doc, members, output_option):
+    """One multi-solid family in project coordinates for several distinct shapes, placed once at the origin."""
+    family_prefix = output_option.get("family_prefix") or "WWP_ConvertedFamily"
+    content_hash = context_cache.cache_key(
+        "directshape_pack",
+        [[_elem_id_int(element.Id), [round(value, 3) for value in origin]] for element, _, origin in members],
+    )
+    family_name = _make_safe_name("{}_Batch_{}_{}".format(family_prefix, len(members), content_hash[:12]), "{}_Batch".format(family_prefix))
+    solid_entries = []
+    for element, solids, _ in members:
+        source_comment = _get_comment(element)
+        solid_entries.extend((solid, source_comment) for solid in solids)
+
+    family, family_path = _build_family(doc, family_name, solid_entries, output_option)
+    context_batching.write_batch_index(
+        family_path,
+        family_name,
+        [
+            {"index": index, "element_id": _elem_id_int(element.Id), "comment": _get_comment(element)}
+            for index, (element, _, _) in enumerate(members)
+        ],
+    )
+    comment_text = "Converted from DirectShape batch | {} elements | {}.json".format(len(members), family_name)
+    results = _place_family_instances(doc, family, [(comment_text, DB.XYZ(0.0, 0.0, 0.0))])
+    instance, error = results[0]
+    if instance is None:
+        raise Exception(error)
+    return instance
+
+
+def _record_failure(failures, failed_element_ids, element, reason):
+    failures.append({"id": "element/{}".format(_elem_id_int(element.Id)), "reason": reason})
+    failed_element_ids.append(element.Id)
+
+
+def _convert_elements_in_batches(doc, element_solids, output_option, pack_family_count, signatures, failures, failed_element_ids):
+    """Shared families for repeated shapes, and the remaining distinct shapes packed into pack_family_count families.
+
+    Returns (created instances, batch stats); failures are appended per source element.
+    """
+    instances = []
+    stats = {"shapes": 0, "shared_families": 0, "shared_elements": 0, "packed_families": 0, "packed_elements": 0}
+    singles = []
+    for shape_key, members in _group_by_shape(element_solids, signatures):
+        stats["shapes"] += 1
+        if len(members) == 1:
+            singles.append(members[0])
+            continue
+        try:
+            results = _convert_shared_shape(doc, shape_key, members, output_option)
+            stats["shared_families"] += 1
+        except Exception as ex:
+            _log_debug("Shared shape {} failed: {}\n{}".format(shape_key[:12], str(ex), traceback.format_exc()))
+            results = [(None, str(ex))] * len(members)
+        for (element, _, _), (instance, error) in zip(members, results):
+            if instance is None:
+                _record_failure(failures, failed_element_ids, element, error)
+                continue
+            instances.append(instance)
+            stats["shared_elements"] += 1
+
+    ordered_singles = context_batching.spatial_order(singles, lambda member: member[2][:2])
+    for pack in context_batching.split_even(ordered_singles, pack_family_count):
+        try:
+            instances.append(_convert_packed_shapes(doc, pack, output_option))
+            stats["packed_families"] += 1
+            stats["packed_elements"] += len(pack)
+        except Exception as ex:
+            _log_debug("Packed family of {} element(s) failed: {}\n{}".format(len(pack), str(ex), traceback.format_exc()))
+            for element, _, _ in pack:
+                _record_failure(failures, failed_element_ids, element, str(ex))
+
+    return instances, stats
 
 
 def _get_solid_fill_pattern_id(doc):
@@ -825,13 +1149,46 @@ def _highlight_failed_elements(doc, failed_element_ids):
         _log_debug("Could not apply failure highlights: {}".format(ex))
 
 
-def _preview_text(scope_label, elements, output_option):
+def _prompt_pack_family_count():
+    """None when cancelled, 0 for one family per element, else the number of families for distinct shapes."""
+    selected = ui.uiUtils_select_indices(
+        list(CONVERSION_MODE_LABELS),
+        title=TITLE,
+        prompt="Select the conversion mode:",
+        multiselect=False,
+        width=420,
+        height=260,
+    )
+    if not selected:
+        return None
+    if selected[0] == 0:
+        return 0
+
+    raw_value = ui.uiUtils_prompt_text(
+        title=TITLE,
+        prompt="Number of families to pack shapes that occur once into:",
+        default_value=str(DEFAULT_PACK_FAMILY_COUNT),
+    )
+    if raw_value is None:
+        return None
+    try:
+        return max(1, int(float(raw_value.strip())))
+    except Exception:
+        return DEFAULT_PACK_FAMILY_COUNT
+
+
+def _preview_text(scope_label, elements, output_option, pack_family_count=0):
+    family_label = (output_option.get("result_label") or "family").rstrip("s").lower()
+    if pack_family_count:
+        output_text = "one shared {} per repeated shape, other shapes packed into up to {} families".format(family_label, pack_family_count)
+    else:
+        output_text = "one {} per source element".format(family_label)
     lines = [
         "Scope: {}".format(scope_label),
         "Source elements found: {}".format(len(elements)),
         "Supported categories: Mass, Generic Models",
         "Output category: {}".format(_category_display_name(output_option["category"])),
-        "Output: one {} per source element".format((output_option.get("result_label") or "family").rstrip("s").lower()),
+        "Output: {}".format(output_text),
         "Original source elements will be kept.",
         "",
         "Preview of first 20 source elements:",
@@ -854,11 +1211,32 @@ def _preview_text(scope_label, elements, output_option):
     return "\n".join(lines)
 
 
-def _summarize_results(created_count, failures, output_option):
+def _summarize_results(created_count, failures, output_option, batch_stats=None, mesh_stats=None, signature_stats=None):
     lines = [
         "{} created: {}".format(output_option.get("result_label") or "Families", created_count),
         "Failures: {}".format(len(failures)),
     ]
+    if signature_stats:
+        lines.append("Duplicate solids skipped: {} of {} | Elements repeating an earlier shape: {} of {}".format(
+            signature_stats["duplicate_solids"],
+            signature_stats["solids"],
+            signature_stats["repeated_elements"],
+            signature_stats["elements"],
+        ))
+    if mesh_stats and mesh_stats["meshes"]:
+        lines.append("Meshes converted to solids: {} of {} | {} triangles -> {} faces ({:.0f}% fewer)".format(
+            mesh_stats["solids"],
+            mesh_stats["meshes"],
+            mesh_stats["triangles"],
+            mesh_stats["faces"],
+            100.0 * (1.0 - (mesh_stats["faces"] / float(max(mesh_stats["triangles"], 1)))),
+        ))
+    if batch_stats:
+        lines.extend([
+            "Distinct shapes: {}".format(batch_stats["shapes"]),
+            "Shared families: {} ({} instances)".format(batch_stats["shared_families"], batch_stats["shared_elements"]),
+            "Packed families: {} ({} elements)".format(batch_stats["packed_families"], batch_stats["packed_elements"]),
+        ])
 
     if failures:
         lines.append("")
@@ -892,9 +1270,13 @@ def main():
     if output_option is None:
         return
 
+    pack_family_count = _prompt_pack_family_count()
+    if pack_family_count is None:
+        return
+
     if not ui.uiUtils_show_text_report(
         "{} - Preview".format(TITLE),
-        _preview_text(scope_label, elements, output_option),
+        _preview_text(scope_label, elements, output_option, pack_family_count),
         ok_text="Convert",
         cancel_text="Cancel",
         width=760,
@@ -911,27 +1293,43 @@ def main():
     # causes Revit to include the newly placed masses in subsequent elements' geometry
     # trees - producing N copies for the Nth building processed.
     element_solids = []
+    try:
+        mesh_converter = _MeshSolidConverter(doc.Application.VertexTolerance)
+    except Exception:
+        mesh_converter = _MeshSolidConverter()
+    signatures = _GeometrySignatures()
     for element in elements:
         try:
-            solids = _get_element_solids(element)
+            solids = _get_element_solids(element, mesh_converter, signatures)
             if not solids:
                 raise Exception("No valid solids were found in the source element geometry.")
             _log_debug("Element {} yielded {} solid(s).".format(_elem_id_int(element.Id), len(solids)))
+            signatures.shape_of(element, solids)
             element_solids.append((element, solids))
         except Exception as ex:
             _log_debug("Element {} solid extraction failed: {}\n{}".format(_elem_id_int(element.Id), str(ex), traceback.format_exc()))
-            failures.append({"id": "element/{}".format(_elem_id_int(element.Id)), "reason": str(ex)})
-            failed_element_ids.append(element.Id)
-
-    for element, solids in element_solids:
-        try:
-            instance = _convert_element_to_family(doc, element, solids, output_option)
-            if instance is not None:
-                created_instances.append(instance)
-        except Exception as ex:
-            _log_debug("Element {} failed: {}\n{}".format(_elem_id_int(element.Id), str(ex), traceback.format_exc()))
-            failures.append({"id": "element/{}".format(_elem_id_int(element.Id)), "reason": str(ex)})
-            failed_element_ids.append(element.Id)
+            _record_failure(failures, failed_element_ids, element, str(ex))
+
+    batch_stats = None
+    if pack_family_count:
+        created_instances, batch_stats = _convert_elements_in_batches(
+            doc,
+            element_solids,
+            output_option,
+            pack_family_count,
+            signatures,
+            failures,
+            failed_element_ids,
+        )
+    else:
+        for element, solids in element_solids:
+            try:
+                instance = _convert_element_to_family(doc, element, solids, output_option)
+                if instance is not None:
+                    created_instances.append(instance)
+            except Exception as ex:
+                _log_debug("Element {} failed: {}\n{}".format(_elem_id_int(element.Id), str(ex), traceback.format_exc()))
+                _record_failure(failures, failed_element_ids, element, str(ex))
 
     _highlight_failed_elements(doc, failed_element_ids)
 
@@ -944,7 +1342,14 @@ def main():
     except Exception:
         pass
 
-    result_text = _summarize_results(len(created_instances), failures, output_option)
+    result_text = _summarize_results(
+        len(created_instances),
+        failures,
+        output_option,
+        batch_stats,
+        mesh_converter.stats,
+        signatures.stats,
+    )
     if failures:
         log_path = _flush_debug_log()
         result_text += "\n\nDetailed debug log:\n{}".format(log_path)
@@ -1,11 +1,11 @@
 #! python3
 import clr
-import hashlib
 import json
 import math
 import os
 import re
 import sys
+import time
 import traceback
 import xml.etree.ElementTree as ET
 
@@ -32,27 +32,16 @@ DEFAULT_RADIUS_M = 500.0
 MIN_RADIUS_M = 50.0
 MAX_RADIUS_M = 2000.0
 USER_AGENT = "WWPTools.WebContextBuilder/1.0"
-OVERPASS_ENDPOINTS = [
-    "https://overpass-api.de/api/interpreter",
-    "https://overpass.kumi.systems/api/interpreter",
-    "https://overpass.osm.ch/api/interpreter",
-    "https://lz4.overpass-api.de/api/interpreter",
-    "https://z.overpass-api.de/api/interpreter",
-]
-PEDESTRIAN_HIGHWAYS = (
-    "footway",
-    "path",
-    "cycleway",
-    "pedestrian",
-    "steps",
-    "track",
-    "bridleway",
-    "corridor",
-)
 MAX_FAILURES_IN_REPORT = 30
 MAP_CLICK_SCHEME = "pyrevit-map://click"
 HRDEM_WMS_ENDPOINT = "https://datacube.services.geo.ca/ows/elevation"
 HRDEM_WMS_LAYER = "dtm"
+HRDEM_WCS_ENDPOINT = "https://datacube.services.geo.ca/ows/elevation"
+HRDEM_WCS_COVERAGE = "dtm"
+TERRAIN_SAMPLE_MAX_WORKERS = 8
+TERRAIN_SAMPLE_HOST_LIMIT = 4
+TERRAIN_CACHE_RESOLUTION_DEG = 1e-6
+TERRAIN_CACHE_MAX_ENTRIES = 500000
 TERRAIN_MIN_GRID_SPACING_M = 60.0
 TERRAIN_DENSE_SQUARE_SIZE_M = 100.0
 TERRAIN_DENSE_GRID_SPACING_M = 10.0
@@ -61,22 +50,19 @@ MAX_TERRAIN_SAMPLE_POINTS = 121
 BASE_TOTAL_TERRAIN_SAMPLE_POINTS = 260
 MAX_TOTAL_TERRAIN_SAMPLE_POINTS = 1600
 MAX_DENSE_GRID_SAMPLE_POINTS = 1521
+TERRAIN_SIMPLIFY_TOLERANCE_M = 0.25
 MIN_DENSE_AREA_M = 20.0
-MAX_BUILDING_SOLIDS_PER_MASS_FAMILY = 1
+MASS_FAMILY_LIMITS_CACHE_KEY = "batch_limits"
+BUILD_CHUNK_SIZE = 200
+BUILDING_BULK_MIN_COUNT = 1000
+BUILDING_BULK_TILE_SIZE_M = 150.0
+BUILDING_BULK_MAX_PER_SHAPE = 250
+MASS_FAMILY_TILE_SIZE_M = 150.0
 BUILDING_OUTPUT_DIRECTSHAPE = "directshape"
 BUILDING_OUTPUT_INPLACE_MASS = "inplacemass"
 BUILDING_OUTPUT_MASS_FAMILY = "massfamily"
 TERRAIN_SUBDIVISION_OFFSET_2026_M = -0.15
 CONTEXT_FLOOR_THICKNESS_M = 0.01
-CONTEXT_PALETTE = {
-    "buildings": {"name": "WWP Context - Massing", "rgb": (186, 186, 186), "transparency": 0},
-    "roads": {"name": "WWP Context - Road", "rgb": (152, 152, 152), "transparency": 0},
-    "tracks": {"name": "WWP Context - Track", "rgb": (120, 120, 120), "transparency": 0},
-    "parcels": {"name": "WWP Context - Parcel", "rgb": (255, 221, 21), "transparency": 60},
-    "parks": {"name": "WWP Context - Park", "rgb": (143, 188, 143), "transparency": 0},
-    "water": {"name": "WWP Context - Water", "rgb": (173, 216, 230), "transparency": 0},
-    "terrain": {"name": "WWP Context - Curb", "rgb": (225, 225, 225), "transparency": 0},
-}
 CACHE_VERSION = "v1"
 CACHE_ROOT = os.path.join(
     os.getenv("APPDATA") or os.path.expanduser("~"),
@@ -99,7 +85,22 @@ if lib_path not in sys.path:
     sys.path.append(lib_path)
 
 import WWP_uiUtils as ui
-from WWP_compat import Request, decode_to_text, urllib_parse, urlopen
+from WWP_compat import urllib_parse
+from context_core import batching as context_batching
+from context_core import buffer as context_buffer
+from context_core import cache as context_cache
+from context_core import classify as context_classify
+from context_core import extract as context_extract
+from context_core import family_cache as context_family_cache
+from context_core import geometry as context_geometry
+from context_core import net as context_net
+from context_core import overpass as context_overpass
+from context_core import palette as context_palette
+from context_core import pipeline as context_pipeline
+from context_core import prepare as context_prepare
+from context_core import terrain as context_terrain
+from context_core import tile_cache as context_tile_cache
+from context_core import tin as context_tin
 
 
 def _get_doc():
@@ -136,10 +137,7 @@ def _load_logo(image_control):
 
 
 def _ensure_cache_dir(bucket_name):
-    bucket_path = os.path.join(CACHE_ROOT, bucket_name)
-    if not os.path.isdir(bucket_path):
-        os.makedirs(bucket_path)
-    return bucket_path
+    return context_cache.ensure_cache_dir(CACHE_ROOT, bucket_name)
 
 
 def _ensure_settings_dir():
@@ -148,33 +146,12 @@ def _ensure_settings_dir():
     return SETTINGS_ROOT
 
 
-def _cache_key(*parts):
-    normalized = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=True)
-    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
-
-
-def _cache_file_path(bucket_name, cache_key_value, extension):
-    return os.path.join(_ensure_cache_dir(bucket_name), "{}.{}".format(cache_key_value, extension))
-
-
 def _read_cache_json(bucket_name, cache_key_value):
-    cache_path = _cache_file_path(bucket_name, cache_key_value, "json")
-    if not os.path.isfile(cache_path):
-        return None
-    try:
-        with open(cache_path, "r") as cache_file:
-            return json.load(cache_file)
-    except Exception:
-        return None
+    return context_cache.read_cache_json(CACHE_ROOT, bucket_name, cache_key_value)
 
 
 def _write_cache_json(bucket_name, cache_key_value, data):
-    cache_path = _cache_file_path(bucket_name, cache_key_value, "json")
-    try:
-        with open(cache_path, "w") as cache_file:
-            json.dump(data, cache_file, indent=2, sort_keys=True)
-    except Exception:
-        pass
+    context_cache.write_cache_json(CACHE_ROOT, bucket_name, cache_key_value, data)
 
 
 def _load_settings():
@@ -264,7 +241,7 @@ def _normalize_dense_area_m(value):
 
 
 def _reverse_geocode(lat, lon):
-    cache_key_value = _cache_key("reverse_geocode", round(float(lat), 6), round(float(lon), 6))
+    cache_key_value = context_cache.cache_key("reverse_geocode", round(float(lat), 6), round(float(lon), 6))
     cached = _read_cache_json("reverse_geocode", cache_key_value)
     if cached and cached.get("display_name"):
         return cached["display_name"]
@@ -291,7 +268,7 @@ def _build_map_html(center_lat=None, center_lon=None, radius_m=0.0, label="", zo
     label_text = json.dumps(label or "")
     min_lat = min_lon = max_lat = max_lon = None
     if has_location and radius_m and radius_m > 0:
-        min_lat, min_lon, max_lat, max_lon = _calculate_square_bounds(float(center_lat), float(center_lon), float(radius_m))
+        min_lat, min_lon, max_lat, max_lon = context_geometry.calculate_square_bounds(float(center_lat), float(center_lon), float(radius_m))
     min_lat_text = "null" if min_lat is None else "{:.8f}".format(min_lat)
     min_lon_text = "null" if min_lon is None else "{:.8f}".format(min_lon)
     max_lat_text = "null" if max_lat is None else "{:.8f}".format(max_lat)
@@ -392,22 +369,11 @@ def _render_map(browser, center_lat=None, center_lon=None, radius_m=0.0, label="
 
 
 def _http_get_text(url, timeout_sec=20):
-    request = Request(url, headers={"User-Agent": USER_AGENT})
-    response = urlopen(request, timeout=timeout_sec)
-    try:
-        return decode_to_text(response.read(), "utf-8")
-    finally:
-        response.close()
-
+    return context_net.http_get_text(url, USER_AGENT, timeout_sec)
 
-def _meters_per_degree(center_lat):
-    meters_per_degree_lat = 111320.0
-    meters_per_degree_lon = max(1e-9, meters_per_degree_lat * math.cos(math.radians(center_lat)))
-    return meters_per_degree_lat, meters_per_degree_lon
 
-
-def _sample_hrdem_elevation(lat, lon, sample_window_m=TERRAIN_SAMPLE_WINDOW_M):
-    meters_per_degree_lat, meters_per_degree_lon = _meters_per_degree(lat)
+def _fetch_hrdem_elevation(lat, lon, sample_window_m=TERRAIN_SAMPLE_WINDOW_M):
+    meters_per_degree_lat, meters_per_degree_lon = context_geometry.meters_per_degree(lat)
     delta_lat = sample_window_m / meters_per_degree_lat
     delta_lon = sample_window_m / meters_per_degree_lon
     query = urllib_parse.urlencode(
@@ -443,9 +409,43 @@ def _sample_hrdem_elevation(lat, lon, sample_window_m=TERRAIN_SAMPLE_WINDOW_M):
     return None
 
 
+def _terrain_point_namespace(sample_window_m):
+    # Version 2: earlier stores also held raster-interpolated values.
+    return context_tile_cache.namespace_id("hrdem_terrain_point", 2, HRDEM_WMS_ENDPOINT, HRDEM_WMS_LAYER, round(float(sample_window_m), 3))
+
+
+def _terrain_point_store():
+    store = context_tile_cache.open_store(
+        os.path.join(CACHE_ROOT, "terrain_points.bin"),
+        TERRAIN_CACHE_RESOLUTION_DEG,
+        TERRAIN_CACHE_MAX_ENTRIES,
+    )
+    context_tile_cache.migrate_legacy_json_cache(store, _terrain_point_namespace(TERRAIN_SAMPLE_WINDOW_M), CACHE_ROOT)
+    return store
+
+
+def _sample_hrdem_elevations(points, sample_window_m=TERRAIN_SAMPLE_WINDOW_M):
+    store = _terrain_point_store()
+    namespace = _terrain_point_namespace(sample_window_m)
+
+    try:
+        return context_terrain.sample_points(
+            points,
+            lambda lat, lon: _fetch_hrdem_elevation(lat, lon, sample_window_m),
+            lookup=lambda keys: store.get_many(namespace, keys),
+            store=lambda values: store.put_many(namespace, values),
+            fetch_raster=context_terrain.wcs_raster_fetcher(HRDEM_WCS_ENDPOINT, HRDEM_WCS_COVERAGE, _http_get_text),
+            max_workers=TERRAIN_SAMPLE_MAX_WORKERS,
+            host=context_terrain.host_of(HRDEM_WMS_ENDPOINT),
+            host_limit=TERRAIN_SAMPLE_HOST_LIMIT,
+        )
+    finally:
+        store.flush()
+
+
 def _build_terrain_grid(center_lat, center_lon, radius_m, dense_square_size_m):
     dense_square_size_m = _normalize_dense_area_m(dense_square_size_m)
-    grid_cache_key = _cache_key(
+    grid_cache_key = context_cache.cache_key(
         "terrain_grid",
         round(float(center_lat), 8),
         round(float(center_lon), 8),
@@ -457,6 +457,7 @@ def _build_terrain_grid(center_lat, center_lon, radius_m, dense_square_size_m):
         BASE_TOTAL_TERRAIN_SAMPLE_POINTS,
         MAX_TOTAL_TERRAIN_SAMPLE_POINTS,
         MAX_DENSE_GRID_SAMPLE_POINTS,
+        TERRAIN_SIMPLIFY_TOLERANCE_M,
     )
     cached_grid = _read_cache_json("terrain_grid", grid_cache_key)
     if cached_grid:
@@ -469,16 +470,21 @@ def _build_terrain_grid(center_lat, center_lon, radius_m, dense_square_size_m):
     def _sample_regular_grid(half_size_m, target_spacing_m):
         steps = max(2, int(math.ceil(half_size_m / max(1.0, target_spacing_m))))
         per_side_local = (steps * 2) + 1
-        step_lat_local = (half_size_m / float(steps)) / _meters_per_degree(center_lat)[0]
-        step_lon_local = (half_size_m / float(steps)) / _meters_per_degree(center_lat)[1]
+        step_lat_local = (half_size_m / float(steps)) / context_geometry.meters_per_degree(center_lat)[0]
+        step_lon_local = (half_size_m / float(steps)) / context_geometry.meters_per_degree(center_lat)[1]
+        grid_latlons = [
+            (center_lat + ((steps - row_index) * step_lat_local), center_lon + ((col_index - steps) * step_lon_local))
+            for row_index in range(per_side_local)
+            for col_index in range(per_side_local)
+        ]
+        grid_elevations = _sample_hrdem_elevations(grid_latlons)
         rows_local = []
         points_local = []
         for row_index in range(per_side_local):
-            lat = center_lat + ((steps - row_index) * step_lat_local)
             row_values = []
             for col_index in range(per_side_local):
-                lon = center_lon + ((col_index - steps) * step_lon_local)
-                elevation = _sample_hrdem_elevation(lat, lon)
+                lat, lon = grid_latlons[(row_index * per_side_local) + col_index]
+                elevation = grid_elevations[(row_index * per_side_local) + col_index]
                 row_values.append(elevation)
                 if elevation is not None:
                     points_local.append(
@@ -501,30 +507,6 @@ def _build_terrain_grid(center_lat, center_lon, radius_m, dense_square_size_m):
             "half_size_m": half_size_m,
         }
 
-    def _reduce_grid_points(points_local, target_count):
-        if target_count <= 0:
-            return []
-        if len(points_local) <= target_count:
-            return list(points_local)
-
-        stride = 2
-        reduced = list(points_local)
-        while stride <= 32:
-            reduced = [
-                point
-                for point in points_local
-                if (point.get("row", 0) % stride == 0) and (point.get("col", 0) % stride == 0)
-            ]
-            if len(reduced) <= target_count:
-                break
-            stride += 1
-
-        if len(reduced) > target_count:
-            step = max(1, int(math.ceil(len(reduced) / float(target_count))))
-            reduced = reduced[::step]
-
-        return reduced[:target_count]
-
     spacing_m = max(TERRAIN_MIN_GRID_SPACING_M, radius_m / 4.0)
     coarse_steps = max(2, int(math.ceil(radius_m / spacing_m)))
     while ((coarse_steps * 2) + 1) ** 2 > MAX_TERRAIN_SAMPLE_POINTS and coarse_steps > 2:
@@ -556,9 +538,12 @@ def _build_terrain_grid(center_lat, center_lon, radius_m, dense_square_size_m):
             MAX_TOTAL_TERRAIN_SAMPLE_POINTS,
             max(target_total_points, len(coarse_points) + len(dense_points)),
         )
-    remaining_slots = max(0, target_total_points - len(coarse_points))
-    dense_points = _reduce_grid_points(dense_points, remaining_slots)
     merged_points = coarse_points + dense_points
+    kept_indices, simplification = context_tin.simplify_tin(
+        [context_geometry.project_latlon(point["lat"], point["lon"], center_lat, center_lon) + (point["elevation_m"],) for point in merged_points],
+        TERRAIN_SIMPLIFY_TOLERANCE_M,
+        max_points=target_total_points,
+    )
 
     min_elevation = None
     max_elevation = None
@@ -573,6 +558,8 @@ def _build_terrain_grid(center_lat, center_lon, radius_m, dense_square_size_m):
     terrain_grid = {
         "rows": coarse_grid["rows"],
         "points": merged_points,
+        "toposolid_points": [merged_points[index] for index in kept_indices],
+        "simplification": simplification,
         "per_side": coarse_grid["per_side"],
         "steps_each_side": coarse_grid["steps_each_side"],
         "step_lat": coarse_grid["step_lat"],
@@ -590,94 +577,6 @@ def _build_terrain_grid(center_lat, center_lon, radius_m, dense_square_size_m):
     return terrain_grid
 
 
-def _terrain_nearest_elevation(terrain_grid, lat, lon):
-    nearest = None
-    nearest_dist = None
-    for point in terrain_grid.get("points") or []:
-        dist = math.hypot(point["lat"] - lat, point["lon"] - lon)
-        if nearest_dist is None or dist < nearest_dist:
-            nearest = point["elevation_m"]
-            nearest_dist = dist
-    return nearest
-
-
-def _terrain_bilinear_elevation(terrain_grid, center_lat, center_lon, lat, lon):
-    dense_half_size_m = terrain_grid.get("dense_half_size_m") or 0.0
-    grid_rows = terrain_grid["rows"]
-    step_lat = terrain_grid["step_lat"]
-    step_lon = terrain_grid["step_lon"]
-    steps_each_side = terrain_grid["steps_each_side"]
-    per_side = terrain_grid["per_side"]
-
-    if dense_half_size_m > 0.0:
-        dx_m, dy_m = _project_latlon(lat, lon, center_lat, center_lon)
-        if abs(dx_m) <= dense_half_size_m and abs(dy_m) <= dense_half_size_m:
-            dense_rows = terrain_grid.get("dense_rows")
-            if dense_rows:
-                grid_rows = dense_rows
-                step_lat = terrain_grid["dense_step_lat"]
-                step_lon = terrain_grid["dense_step_lon"]
-                steps_each_side = terrain_grid["dense_steps_each_side"]
-                per_side = terrain_grid["dense_per_side"]
-
-    max_index = per_side - 1
-    row_position = ((center_lat + (steps_each_side * step_lat)) - lat) / step_lat
-    col_position = (lon - (center_lon - (steps_each_side * step_lon))) / step_lon
-
-    row0 = int(math.floor(row_position))
-    col0 = int(math.floor(col_position))
-    row1 = min(max_index, row0 + 1)
-    col1 = min(max_index, col0 + 1)
-    row0 = max(0, min(max_index, row0))
-    col0 = max(0, min(max_index, col0))
-
-    q11 = grid_rows[row0][col0]
-    q12 = grid_rows[row0][col1]
-    q21 = grid_rows[row1][col0]
-    q22 = grid_rows[row1][col1]
-
-    if None in (q11, q12, q21, q22):
-        return _terrain_nearest_elevation(terrain_grid, lat, lon)
-
-    tx = 0.0 if col1 == col0 else max(0.0, min(1.0, col_position - col0))
-    ty = 0.0 if row1 == row0 else max(0.0, min(1.0, row_position - row0))
-    return (
-        (q11 * (1.0 - tx) * (1.0 - ty))
-        + (q12 * tx * (1.0 - ty))
-        + (q21 * (1.0 - tx) * ty)
-        + (q22 * tx * ty)
-    )
-
-
-def _latlon_ring_centroid(ring):
-    if not ring:
-        return None
-
-    points = ring[:-1] if len(ring) > 1 and _point_key(ring[0]) == _point_key(ring[-1]) else ring
-    if len(points) < 3:
-        return points[0] if points else None
-
-    area = 0.0
-    centroid_lat = 0.0
-    centroid_lon = 0.0
-    for index in range(len(points)):
-        lat1, lon1 = points[index]
-        lat2, lon2 = points[(index + 1) % len(points)]
-        cross = (lon1 * lat2) - (lon2 * lat1)
-        area += cross
-        centroid_lon += (lon1 + lon2) * cross
-        centroid_lat += (lat1 + lat2) * cross
-
-    if abs(area) <= 1e-9:
-        return (
-            sum(point[0] for point in points) / float(len(points)),
-            sum(point[1] for point in points) / float(len(points)),
-        )
-
-    area *= 0.5
-    return centroid_lat / (6.0 * area), centroid_lon / (6.0 * area)
-
-
 def _show_dialog(doc):
     xaml_path = os.path.join(script_dir, "WebContextBuilderDialog.xaml")
     if not os.path.isfile(xaml_path):
@@ -695,6 +594,8 @@ def _show_dialog(doc):
     run_button = window.FindName("RunButton")
     cancel_button = window.FindName("CancelButton")
     locate_button = window.FindName("LocateButton")
+    extract_text = window.FindName("ExtractTextBox")
+    browse_extract_button = window.FindName("BrowseExtractButton")
     logo_image = window.FindName("LogoImage")
     map_browser = window.FindName("MapBrowser")
     map_hint_text = window.FindName("MapHintText")
@@ -707,6 +608,7 @@ def _show_dialog(doc):
     parks_checkbox = window.FindName("ParksCheckBox")
     water_checkbox = window.FindName("WaterCheckBox")
     terrain_checkbox = window.FindName("TerrainCheckBox")
+    mass_family_checkbox = window.FindName("MassFamilyCheckBox")
 
     _load_logo(logo_image)
 
@@ -719,6 +621,8 @@ def _show_dialog(doc):
         radius_text.Text = str(int(saved_settings.get("radius_m") or DEFAULT_RADIUS_M))
     if dense_area_text is not None:
         dense_area_text.Text = str(int(saved_settings.get("dense_area_m") or TERRAIN_DENSE_SQUARE_SIZE_M))
+    if extract_text is not None:
+        extract_text.Text = saved_settings.get("extract_path") or ""
     if use_dense_area_checkbox is not None and "use_dense_area" in saved_settings:
         use_dense_area_checkbox.IsChecked = bool(saved_settings.get("use_dense_area"))
     if buildings_checkbox is not None and "buildings" in saved_settings:
@@ -735,6 +639,8 @@ def _show_dialog(doc):
         water_checkbox.IsChecked = bool(saved_settings.get("water"))
     if terrain_checkbox is not None and "terrain" in saved_settings:
         terrain_checkbox.IsChecked = bool(saved_settings.get("terrain"))
+    if mass_family_checkbox is not None and "mass_family" in saved_settings:
+        mass_family_checkbox.IsChecked = bool(saved_settings.get("mass_family"))
     result = {"ok": False}
     map_state = {"location": None, "label": ""}
 
@@ -822,6 +728,17 @@ def _show_dialog(doc):
         except Exception as ex:
             _set_validation("Unable to locate address: {}".format(str(ex)))
 
+    def _on_browse_extract(sender, args):
+        current_path = (extract_text.Text or "").strip()
+        selected_path = ui.uiUtils_open_file_dialog(
+            title="Select OSM Extract",
+            filter_text=context_extract.EXTRACT_FILE_FILTER,
+            initial_directory=os.path.dirname(current_path) if current_path else "",
+        )
+        if selected_path:
+            extract_text.Text = selected_path
+            _set_validation("")
+
     def _on_run(sender, args):
         address = (address_text.Text or "").strip()
         radius = _parse_radius(radius_text.Text)
@@ -838,6 +755,7 @@ def _show_dialog(doc):
             "water": bool(water_checkbox.IsChecked) if water_checkbox is not None else True,
             "terrain": bool(terrain_checkbox.IsChecked) if terrain_checkbox is not None else False,
         }
+        mass_family = bool(mass_family_checkbox.IsChecked) if mass_family_checkbox is not None else False
         if radius is None:
             _set_validation("Radius must be between {} and {} meters.".format(int(MIN_RADIUS_M), int(MAX_RADIUS_M)))
             return
@@ -850,11 +768,20 @@ def _show_dialog(doc):
         if not address and _get_project_site_location(doc) is None:
             _set_validation("Enter an address or set the project site location in Revit.")
             return
+        extract_path = (extract_text.Text or "").strip() if extract_text is not None else ""
+        if extract_path and not os.path.isfile(extract_path):
+            _set_validation("OSM extract not found: {}".format(extract_path))
+            return
+        if extract_path and context_extract.extract_format(extract_path) is None:
+            _set_validation("OSM extract must be a .osm, .osm.pbf or GeoJSON file.")
+            return
         result["ok"] = True
         result["address"] = address
         result["radius_m"] = radius
         result["dense_area_m"] = dense_area_m
         result["layers"] = layers
+        result["building_output"] = BUILDING_OUTPUT_MASS_FAMILY if mass_family else BUILDING_OUTPUT_DIRECTSHAPE
+        result["extract_path"] = extract_path
         result["location"] = map_state.get("location")
         result["location_label"] = map_state.get("label") or ""
         _save_settings(
@@ -863,6 +790,7 @@ def _show_dialog(doc):
                 "radius_m": radius,
                 "dense_area_m": dense_area_m,
                 "use_dense_area": use_dense_area,
+                "extract_path": extract_path,
                 "buildings": layers.get("buildings"),
                 "roads": layers.get("roads"),
                 "tracks": layers.get("tracks"),
@@ -870,6 +798,7 @@ def _show_dialog(doc):
                 "parks": layers.get("parks"),
                 "water": layers.get("water"),
                 "terrain": layers.get("terrain"),
+                "mass_family": mass_family,
             }
         )
         window.DialogResult = True
@@ -883,6 +812,8 @@ def _show_dialog(doc):
     cancel_button.Click += RoutedEventHandler(_on_cancel)
     if locate_button is not None:
         locate_button.Click += RoutedEventHandler(_on_locate)
+    if browse_extract_button is not None and extract_text is not None:
+        browse_extract_button.Click += RoutedEventHandler(_on_browse_extract)
     if use_dense_area_checkbox is not None:
         use_dense_area_checkbox.Checked += RoutedEventHandler(_update_dense_area_state)
         use_dense_area_checkbox.Unchecked += RoutedEventHandler(_update_dense_area_state)
@@ -914,31 +845,12 @@ def _show_dialog(doc):
 
 
 def _http_get_json(url, timeout_sec=20):
-    request = Request(url, headers={"User-Agent": USER_AGENT})
-    response = urlopen(request, timeout=timeout_sec)
-    try:
-        return json.loads(decode_to_text(response.read(), "utf-8"))
-    finally:
-        response.close()
-
-
-def _http_post_text(url, body_text, timeout_sec=20):
-    payload = urllib_parse.urlencode({"data": body_text}).encode("utf-8")
-    request = Request(
-        url,
-        data=payload,
-        headers={"User-Agent": USER_AGENT, "Content-Type": "application/x-www-form-urlencoded"},
-    )
-    response = urlopen(request, timeout=timeout_sec)
-    try:
-        return decode_to_text(response.read(), "utf-8")
-    finally:
-        response.close()
+    return context_net.http_get_json(url, USER_AGENT, timeout_sec)
 
 
 def _geocode_address(address):
     normalized_address = (address or "").strip()
-    cache_key_value = _cache_key("geocode_address", normalized_address.lower())
+    cache_key_value = context_cache.cache_key("geocode_address", normalized_address.lower())
     cached = _read_cache_json("geocode_address", cache_key_value)
     if cached and ("lat" in cached) and ("lon" in cached):
         return float(cached["lat"]), float(cached["lon"])
@@ -954,569 +866,6 @@ def _geocode_address(address):
     return lat, lon
 
 
-def _calculate_square_bounds(center_lat, center_lon, radius_m):
-    lat_rad = math.radians(center_lat)
-    meters_per_degree_lat = 111320.0
-    meters_per_degree_lon = max(1e-9, meters_per_degree_lat * math.cos(lat_rad))
-    delta_lat = radius_m / meters_per_degree_lat
-    delta_lon = radius_m / meters_per_degree_lon
-    return (
-        center_lat - delta_lat,
-        center_lon - delta_lon,
-        center_lat + delta_lat,
-        center_lon + delta_lon,
-    )
-
-
-def _build_overpass_query(center_lat, center_lon, radius_m):
-    min_lat, min_lon, max_lat, max_lon = _calculate_square_bounds(center_lat, center_lon, radius_m)
-    return """
-[out:json][timeout:90];
-(
-  way({south},{west},{north},{east})["building"];
-  relation({south},{west},{north},{east})["building"];
-  way({south},{west},{north},{east})["building:part"];
-  relation({south},{west},{north},{east})["building:part"];
-  way({south},{west},{north},{east})["highway"];
-  way({south},{west},{north},{east})["leisure"="park"];
-  relation({south},{west},{north},{east})["leisure"="park"];
-  way({south},{west},{north},{east})["landuse"~"grass|recreation_ground|village_green|greenfield"];
-  relation({south},{west},{north},{east})["landuse"~"grass|recreation_ground|village_green|greenfield"];
-  way({south},{west},{north},{east})["natural"="water"];
-  relation({south},{west},{north},{east})["natural"="water"];
-  way({south},{west},{north},{east})["water"];
-  relation({south},{west},{north},{east})["water"];
-  way({south},{west},{north},{east})["landuse"~"reservoir|basin"];
-  relation({south},{west},{north},{east})["landuse"~"reservoir|basin"];
-  way({south},{west},{north},{east})["waterway"];
-  way({south},{west},{north},{east})["railway"~"rail|light_rail|tram|subway|narrow_gauge"];
-  way({south},{west},{north},{east})["boundary"="cadastral"];
-  relation({south},{west},{north},{east})["boundary"="cadastral"];
-  way({south},{west},{north},{east})["parcel"];
-  relation({south},{west},{north},{east})["parcel"];
-);
-out body geom;
-""".strip().format(
-        south=min_lat,
-        west=min_lon,
-        north=max_lat,
-        east=max_lon,
-    )
-
-
-def _fetch_overpass_json(query):
-    cache_key_value = _cache_key("overpass_query", query)
-    cached = _read_cache_json("overpass_query", cache_key_value)
-    if cached:
-        cached["_endpoint"] = cached.get("_endpoint") or "<cache>"
-        cached["_cache_source"] = "appdata"
-        return cached
-
-    failures = []
-    empty_data = None
-    for endpoint in OVERPASS_ENDPOINTS:
-        try:
-            data = json.loads(_http_post_text(endpoint, query, timeout_sec=45))
-            if data.get("elements"):
-                data["_endpoint"] = endpoint
-                _write_cache_json("overpass_query", cache_key_value, data)
-                return data
-            if empty_data is None:
-                data["_endpoint"] = endpoint
-                empty_data = data
-        except Exception as ex:
-            failures.append("{} | {}".format(endpoint, str(ex)))
-
-    if empty_data is not None:
-        _write_cache_json("overpass_query", cache_key_value, empty_data)
-        return empty_data
-
-    raise Exception("All Overpass endpoints failed.\n{}".format("\n".join(failures[:MAX_FAILURES_IN_REPORT])))
-
-
-def _point_key(point):
-    return (round(point[0], 8), round(point[1], 8))
-
-
-def _geometry_to_points(geometry):
-    points = []
-    for item in geometry or []:
-        try:
-            points.append((float(item["lat"]), float(item["lon"])))
-        except Exception:
-            continue
-    return points
-
-
-def _close_ring(points):
-    clean = [point for point in (points or []) if point is not None]
-    if len(clean) < 3:
-        return clean
-    if _point_key(clean[0]) != _point_key(clean[-1]):
-        clean.append(clean[0])
-    return clean
-
-
-def _assemble_geometry_rings(members, role_name):
-    segments = []
-    for member in members or []:
-        if (member.get("type") or "").lower() != "way":
-            continue
-
-        role = (member.get("role") or "").strip().lower()
-        if role_name == "inner":
-            if role != "inner":
-                continue
-        elif role == "inner":
-            continue
-
-        points = _geometry_to_points(member.get("geometry"))
-        if len(points) < 2:
-            continue
-        segments.append(points)
-
-    rings = []
-    while segments:
-        chain = list(segments.pop(0))
-        progressed = True
-        while progressed and len(chain) >= 2 and _point_key(chain[0]) != _point_key(chain[-1]):
-            progressed = False
-            for index, candidate in enumerate(segments):
-                candidate_start = _point_key(candidate[0])
-                candidate_end = _point_key(candidate[-1])
-                chain_start = _point_key(chain[0])
-                chain_end = _point_key(chain[-1])
-
-                if chain_end == candidate_start:
-                    chain.extend(candidate[1:])
-                elif chain_end == candidate_end:
-                    chain.extend(list(reversed(candidate[:-1])))
-                elif chain_start == candidate_end:
-                    chain = candidate[:-1] + chain
-                elif chain_start == candidate_start:
-                    chain = list(reversed(candidate[1:])) + chain
-                else:
-                    continue
-
-                segments.pop(index)
-                progressed = True
-                break
-
-        chain = _close_ring(chain)
-        unique_points = {_point_key(point) for point in chain[:-1]} if len(chain) > 1 else set()
-        if len(chain) >= 4 and len(unique_points) >= 3:
-            rings.append(chain)
-
-    return rings
-
-
-def _point_in_ring_latlon(point, ring):
-    x = point[1]
-    y = point[0]
-    inside = False
-    for index in range(len(ring) - 1):
-        x1 = ring[index][1]
-        y1 = ring[index][0]
-        x2 = ring[index + 1][1]
-        y2 = ring[index + 1][0]
-        intersects = (y1 > y) != (y2 > y)
-        if not intersects:
-            continue
-        slope_x = ((x2 - x1) * (y - y1) / ((y2 - y1) or 1e-12)) + x1
-        if x < slope_x:
-            inside = not inside
-    return inside
-
-
-def _is_building_tag(tags):
-    for key in ("building", "building:part"):
-        value = (tags.get(key) or "").strip().lower()
-        if value and value not in ("no", "false", "0"):
-            return True
-    return False
-
-
-def _is_park_tag(tags):
-    leisure = (tags.get("leisure") or "").strip().lower()
-    landuse = (tags.get("landuse") or "").strip().lower()
-    natural = (tags.get("natural") or "").strip().lower()
-    return (
-        leisure in ("park", "garden", "playground", "recreation_ground")
-        or landuse in ("grass", "recreation_ground", "village_green", "greenfield")
-        or natural == "grassland"
-    )
-
-
-def _is_water_tag(tags):
-    natural = (tags.get("natural") or "").strip().lower()
-    landuse = (tags.get("landuse") or "").strip().lower()
-    water = (tags.get("water") or "").strip().lower()
-    waterway = (tags.get("waterway") or "").strip().lower()
-    return (
-        natural == "water"
-        or landuse in ("reservoir", "basin")
-        or bool(water)
-        or waterway == "riverbank"
-    )
-
-
-def _is_track_tag(tags):
-    railway = (tags.get("railway") or "").strip().lower()
-    return railway in ("rail", "light_rail", "tram", "subway", "narrow_gauge")
-
-
-def _is_parcel_tag(tags):
-    boundary = (tags.get("boundary") or "").strip().lower()
-    parcel = (tags.get("parcel") or "").strip().lower()
-    return boundary == "cadastral" or bool(parcel)
-
-
-def _collect_elements(elements):
-    ways = {}
-    relations = []
-    roads = []
-    tracks = []
-    waterways = []
-
-    for element in elements or []:
-        element_type = (element.get("type") or "").lower()
-        element_id = str(element.get("id"))
-        tags = element.get("tags") or {}
-
-        if element_type == "way":
-            ways[element_id] = element
-
-            highway = (tags.get("highway") or "").strip().lower()
-            if highway and highway not in PEDESTRIAN_HIGHWAYS:
-                roads.append(element)
-
-            if _is_track_tag(tags):
-                tracks.append(element)
-
-            waterway = (tags.get("waterway") or "").strip().lower()
-            if waterway and waterway not in ("dam", "weir", "dock"):
-                waterways.append(element)
-        elif element_type == "relation":
-            relations.append(element)
-
-    return ways, relations, roads, tracks, waterways
-
-
-def _build_area_features(ways, relations, predicate):
-    features = []
-    relation_way_ids = set()
-
-    for relation in relations or []:
-        tags = relation.get("tags") or {}
-        if not predicate(tags):
-            continue
-
-        members = relation.get("members") or []
-        outer_rings = _assemble_geometry_rings(members, "outer")
-        if not outer_rings:
-            continue
-
-        inner_rings = _assemble_geometry_rings(members, "inner")
-        for member in members:
-            if (member.get("type") or "").lower() == "way" and member.get("ref") is not None:
-                relation_way_ids.add(str(member.get("ref")))
-
-        for outer_index, outer_ring in enumerate(outer_rings):
-            assigned_inners = []
-            for inner_ring in inner_rings:
-                if _point_in_ring_latlon(inner_ring[0], outer_ring):
-                    assigned_inners.append(inner_ring)
-
-            features.append(
-                {
-                    "id": "relation/{}:{}".format(relation.get("id"), outer_index + 1),
-                    "tags": tags,
-                    "outer": outer_ring,
-                    "inners": assigned_inners,
-                }
-            )
-
-    for way_id, way in (ways or {}).items():
-        if way_id in relation_way_ids:
-            continue
-
-        tags = way.get("tags") or {}
-        if not predicate(tags):
-            continue
-
-        ring = _close_ring(_geometry_to_points(way.get("geometry")))
-        unique_points = {_point_key(point) for point in ring[:-1]} if len(ring) > 1 else set()
-        if len(ring) < 4 or len(unique_points) < 3:
-            continue
-
-        features.append(
-            {
-                "id": "way/{}".format(way_id),
-                "tags": tags,
-                "outer": ring,
-                "inners": [],
-            }
-        )
-
-    return features
-
-
-def _project_latlon(lat, lon, origin_lat, origin_lon):
-    earth_radius_m = 6378137.0
-    lat_rad = math.radians(lat)
-    lon_rad = math.radians(lon)
-    origin_lat_rad = math.radians(origin_lat)
-    origin_lon_rad = math.radians(origin_lon)
-    x_m = (lon_rad - origin_lon_rad) * math.cos(origin_lat_rad) * earth_radius_m
-    y_m = (lat_rad - origin_lat_rad) * earth_radius_m
-    return x_m, y_m
-
-
-def _project_ring(ring, origin_lat, origin_lon):
-    return [_project_latlon(point[0], point[1], origin_lat, origin_lon) for point in ring or []]
-
-
-def _remove_duplicate_xy(points, tolerance_m=0.05):
-    cleaned = []
-    for point in points or []:
-        if not cleaned:
-            cleaned.append(point)
-            continue
-
-        prev_x, prev_y = cleaned[-1]
-        curr_x, curr_y = point
-        if math.hypot(curr_x - prev_x, curr_y - prev_y) > tolerance_m:
-            cleaned.append(point)
-
-    if len(cleaned) > 1:
-        first_x, first_y = cleaned[0]
-        last_x, last_y = cleaned[-1]
-        if math.hypot(first_x - last_x, first_y - last_y) <= tolerance_m:
-            cleaned[-1] = cleaned[0]
-
-    return cleaned
-
-
-def _signed_area_xy(points):
-    area = 0.0
-    for index in range(len(points) - 1):
-        x1, y1 = points[index]
-        x2, y2 = points[index + 1]
-        area += (x1 * y2) - (x2 * y1)
-    return area / 2.0
-
-
-def _orient_ring(points, clockwise):
-    area = _signed_area_xy(points)
-    is_clockwise = area < 0
-    if is_clockwise != clockwise:
-        return list(reversed(points))
-    return points
-
-
-def _parse_numeric(raw_text):
-    text = (raw_text or "").strip().replace(",", ".")
-    match = re.search(r"[-+]?\d*\.?\d+", text)
-    if not match:
-        return None
-    try:
-        return float(match.group(0))
-    except Exception:
-        return None
-
-
-def _parse_height_m(tags):
-    for key in ("height", "building:height", "est_height"):
-        raw_value = tags.get(key)
-        if not raw_value:
-            continue
-
-        value = _parse_numeric(raw_value)
-        if value is None or value <= 0:
-            continue
-
-        text = raw_value.lower()
-        if "ft" in text or "feet" in text or "'" in text:
-            return value * 0.3048
-        if "mm" in text:
-            return value / 1000.0
-        if "cm" in text:
-            return value / 100.0
-        return value
-    return None
-
-
-def _parse_levels(tags):
-    for key in ("building:levels", "levels"):
-        value = _parse_numeric(tags.get(key))
-        if value is not None and value > 0:
-            return value
-    return None
-
-
-def _get_building_height_m(tags):
-    explicit_height = _parse_height_m(tags)
-    if explicit_height is not None:
-        return explicit_height, "height"
-
-    levels = _parse_levels(tags)
-    if levels is not None:
-        return ((levels - 1.0) * 2.95) + 3.25, "levels"
-
-    return 12.0, "default"
-
-
-def _road_width_m(tags):
-    explicit = _parse_numeric(tags.get("width"))
-    if explicit is not None and explicit > 0:
-        return explicit
-
-    highway = (tags.get("highway") or "").strip().lower()
-    widths = {
-        "motorway": 18.0,
-        "trunk": 14.0,
-        "primary": 12.0,
-        "secondary": 10.0,
-        "tertiary": 8.0,
-        "residential": 7.2,
-        "service": 6.0,
-        "living_street": 5.0,
-        "unclassified": 6.5,
-    }
-    return widths.get(highway, 7.0)
-
-
-def _track_width_m(tags):
-    explicit = _parse_numeric(tags.get("width"))
-    if explicit is not None and explicit > 0:
-        return explicit
-
-    railway = (tags.get("railway") or "").strip().lower()
-    widths = {
-        "rail": 5.0,
-        "light_rail": 4.0,
-        "tram": 3.5,
-        "subway": 5.0,
-        "narrow_gauge": 3.0,
-    }
-    return widths.get(railway, 4.0)
-
-
-def _waterway_width_m(tags):
-    explicit = _parse_numeric(tags.get("width"))
-    if explicit is not None and explicit > 0:
-        return explicit
-
-    waterway = (tags.get("waterway") or "").strip().lower()
-    widths = {
-        "river": 12.0,
-        "canal": 8.0,
-        "stream": 4.0,
-        "ditch": 2.5,
-        "drain": 2.5,
-    }
-    return widths.get(waterway, 5.0)
-
-
-def _normalize_vector(dx, dy):
-    length = math.hypot(dx, dy)
-    if length <= 1e-9:
-        return None
-    return dx / length, dy / length
-
-
-def _line_intersection(point_a1, point_a2, point_b1, point_b2):
-    x1, y1 = point_a1
-    x2, y2 = point_a2
-    x3, y3 = point_b1
-    x4, y4 = point_b2
-    denominator = ((x1 - x2) * (y3 - y4)) - ((y1 - y2) * (x3 - x4))
-    if abs(denominator) <= 1e-9:
-        return None
-
-    det_a = (x1 * y2) - (y1 * x2)
-    det_b = (x3 * y4) - (y3 * x4)
-    px = ((det_a * (x3 - x4)) - ((x1 - x2) * det_b)) / denominator
-    py = ((det_a * (y3 - y4)) - ((y1 - y2) * det_b)) / denominator
-    return px, py
-
-
-def _segment_normal(point_a, point_b, left_side):
-    vector = _normalize_vector(point_b[0] - point_a[0], point_b[1] - point_a[1])
-    if vector is None:
-        return None
-    ux, uy = vector
-    if left_side:
-        return -uy, ux
-    return uy, -ux
-
-
-def _offset_point(prev_point, point, next_point, half_width, left_side):
-    prev_normal = _segment_normal(prev_point, point, left_side)
-    next_normal = _segment_normal(point, next_point, left_side)
-
-    if prev_normal is None and next_normal is None:
-        return point
-    if prev_normal is None:
-        return point[0] + (next_normal[0] * half_width), point[1] + (next_normal[1] * half_width)
-    if next_normal is None:
-        return point[0] + (prev_normal[0] * half_width), point[1] + (prev_normal[1] * half_width)
-
-    prev_start = (prev_point[0] + (prev_normal[0] * half_width), prev_point[1] + (prev_normal[1] * half_width))
-    prev_end = (point[0] + (prev_normal[0] * half_width), point[1] + (prev_normal[1] * half_width))
-    next_start = (point[0] + (next_normal[0] * half_width), point[1] + (next_normal[1] * half_width))
-    next_end = (next_point[0] + (next_normal[0] * half_width), next_point[1] + (next_normal[1] * half_width))
-
-    intersection = _line_intersection(prev_start, prev_end, next_start, next_end)
-    if intersection is not None and math.hypot(intersection[0] - point[0], intersection[1] - point[1]) <= (half_width * 8.0):
-        return intersection
-
-    blended = _normalize_vector(prev_normal[0] + next_normal[0], prev_normal[1] + next_normal[1])
-    if blended is not None:
-        dot_value = max(0.2, min(1.0, (blended[0] * prev_normal[0]) + (blended[1] * prev_normal[1])))
-        scale = half_width / dot_value
-        return point[0] + (blended[0] * scale), point[1] + (blended[1] * scale)
-
-    return point[0] + (prev_normal[0] * half_width), point[1] + (prev_normal[1] * half_width)
-
-
-def _polyline_to_buffer_polygon(points, width_m):
-    clean = _remove_duplicate_xy(points, tolerance_m=0.05)
-    if len(clean) < 2:
-        return None
-
-    if clean[0] == clean[-1]:
-        clean = clean[:-1]
-    if len(clean) < 2:
-        return None
-
-    half_width = max(0.5, width_m / 2.0)
-    left_points = []
-    right_points = []
-
-    for index, point in enumerate(clean):
-        if index == 0:
-            left_normal = _segment_normal(clean[0], clean[1], True)
-            right_normal = _segment_normal(clean[0], clean[1], False)
-            left_points.append((point[0] + (left_normal[0] * half_width), point[1] + (left_normal[1] * half_width)))
-            right_points.append((point[0] + (right_normal[0] * half_width), point[1] + (right_normal[1] * half_width)))
-        elif index == len(clean) - 1:
-            left_normal = _segment_normal(clean[-2], clean[-1], True)
-            right_normal = _segment_normal(clean[-2], clean[-1], False)
-            left_points.append((point[0] + (left_normal[0] * half_width), point[1] + (left_normal[1] * half_width)))
-            right_points.append((point[0] + (right_normal[0] * half_width), point[1] + (right_normal[1] * half_width)))
-        else:
-            left_points.append(_offset_point(clean[index - 1], point, clean[index + 1], half_width, True))
-            right_points.append(_offset_point(clean[index - 1], point, clean[index + 1], half_width, False))
-
-    polygon = left_points + list(reversed(right_points))
-    polygon = _close_ring(_remove_duplicate_xy(polygon, tolerance_m=0.05))
-    unique_points = {_point_key(point) for point in polygon[:-1]} if len(polygon) > 1 else set()
-    if len(polygon) < 4 or len(unique_points) < 3:
-        return None
-    return polygon
-
-
 def _meters_to_internal(value_m):
     try:
         return DB.UnitUtils.ConvertToInternalUnits(float(value_m), DB.UnitTypeId.Meters)
@@ -1555,17 +904,11 @@ def _pick_floor_type(doc, keywords):
     return floor_types[0]
 
 
-def _xy_ring_to_curve_loop(points, clockwise, base_elevation):
-    ring = _close_ring(_remove_duplicate_xy(points, tolerance_m=0.01))
-    unique_points = {_point_key(point) for point in ring[:-1]} if len(ring) > 1 else set()
-    if len(ring) < 4 or len(unique_points) < 3:
-        return None
-
-    ordered_points = _orient_ring(ring, clockwise=clockwise)
+def _ring_to_curve_loop(ring, base_elevation):
     curve_loop = DB.CurveLoop()
-    for index in range(len(ordered_points) - 1):
-        start_point = ordered_points[index]
-        end_point = ordered_points[index + 1]
+    for index in range(len(ring) - 1):
+        start_point = ring[index]
+        end_point = ring[index + 1]
         start_xyz = DB.XYZ(_meters_to_internal(start_point[0]), _meters_to_internal(start_point[1]), base_elevation)
         end_xyz = DB.XYZ(_meters_to_internal(end_point[0]), _meters_to_internal(end_point[1]), base_elevation)
         if start_xyz.IsAlmostEqualTo(end_xyz):
@@ -1575,83 +918,49 @@ def _xy_ring_to_curve_loop(points, clockwise, base_elevation):
     return curve_loop if curve_loop.GetExactLength() > 0 else None
 
 
-def _feature_to_curve_loops(feature, origin_lat, origin_lon, base_elevation, extra_inner_rings=None):
-    outer_points = _project_ring(feature.get("outer") or [], origin_lat, origin_lon)
-    outer_loop = _xy_ring_to_curve_loop(outer_points, clockwise=False, base_elevation=base_elevation)
-    if outer_loop is None:
+def _xy_ring_to_curve_loop(points, clockwise, base_elevation):
+    ring = context_prepare.clean_ring_xy(points, clockwise)
+    if ring is None:
         return None
-
-    curve_loops = List[DB.CurveLoop]()
-    curve_loops.Add(outer_loop)
-
-    inner_rings = list(feature.get("inners") or [])
-    inner_rings.extend(extra_inner_rings or [])
-
-    for inner_ring in inner_rings:
-        inner_points = _project_ring(inner_ring, origin_lat, origin_lon)
-        inner_loop = _xy_ring_to_curve_loop(inner_points, clockwise=True, base_elevation=base_elevation)
-        if inner_loop is not None:
-            curve_loops.Add(inner_loop)
-
-    return curve_loops
-
-
-def _collect_water_hole_rings_for_feature(feature, hole_features):
-    if not feature or not hole_features:
-        return []
-
-    feature_outer = feature.get("outer") or []
-    feature_inners = list(feature.get("inners") or [])
-    accepted_holes = []
-
-    for hole_feature in hole_features:
-        hole_outer = hole_feature.get("outer") or []
-        if not hole_outer:
-            continue
-
-        centroid = _latlon_ring_centroid(hole_outer)
-        if centroid is None or not _point_in_ring_latlon(centroid, feature_outer):
-            continue
-        if any(_point_in_ring_latlon(centroid, inner_ring) for inner_ring in feature_inners):
-            continue
-        if any(_point_in_ring_latlon(centroid, accepted_ring) for accepted_ring in accepted_holes):
-            continue
-
-        accepted_holes.append(hole_outer)
-
-    return accepted_holes
+    return _ring_to_curve_loop(ring, base_elevation)
 
 
-def _polygon_to_curve_loops(outer_points, inner_rings, base_elevation):
-    outer_loop = _xy_ring_to_curve_loop(outer_points, clockwise=False, base_elevation=base_elevation)
+def _rings_to_curve_loops(rings, base_elevation):
+    """CurveLoops for prepared [outer, inner, ...] rings; None when there are no rings or the outer loop fails."""
+    if not rings:
+        return None
+    outer_loop = _ring_to_curve_loop(rings[0], base_elevation)
     if outer_loop is None:
         return None
 
     curve_loops = List[DB.CurveLoop]()
     curve_loops.Add(outer_loop)
 
-    for inner_points in inner_rings or []:
-        inner_loop = _xy_ring_to_curve_loop(inner_points, clockwise=True, base_elevation=base_elevation)
+    for ring in rings[1:]:
+        inner_loop = _ring_to_curve_loop(ring, base_elevation)
         if inner_loop is not None:
             curve_loops.Add(inner_loop)
 
     return curve_loops
 
 
-def _point_in_ring_xy(point, ring):
-    x = point[0]
-    y = point[1]
-    inside = False
-    for index in range(len(ring) - 1):
-        x1, y1 = ring[index]
-        x2, y2 = ring[index + 1]
-        intersects = (y1 > y) != (y2 > y)
-        if not intersects:
-            continue
-        slope_x = ((x2 - x1) * (y - y1) / ((y2 - y1) or 1e-12)) + x1
-        if x < slope_x:
-            inside = not inside
-    return inside
+def _way_rings(way, projected, polygon, area_allowed):
+    if area_allowed and context_classify.is_area_way(way.get("tags") or {}):
+        return context_prepare.polygon_rings_xy(context_geometry.close_ring(projected))
+    return context_prepare.polygon_rings_xy(polygon) if polygon else None
+
+
+def _project_and_buffer_ways(ways, center_lat, center_lon, width_for_tags, area_allowed=True):
+    """Project, buffer and clean a whole layer at once into (way, projected, rings, error) entries.
+
+    width_for_tags returns None to skip buffering; with area_allowed, closed
+    area ways keep their own outline instead of a buffer.
+    """
+    projected_ways = context_geometry.project_ways(ways, center_lat, center_lon)
+    widths = [width_for_tags(way.get("tags") or {}) for way in ways]
+    entries = list(zip(ways, projected_ways, context_buffer.polylines_to_buffer_polygons(projected_ways, widths)))
+    prepared = context_prepare.prepare_items(lambda entry: _way_rings(entry[0], entry[1], entry[2], area_allowed), entries)
+    return [(way, projected, rings, error) for (way, projected, _), (rings, error) in zip(entries, prepared)]
 
 
 def _pick_toposolid_type(doc, keywords=None):
@@ -1682,8 +991,8 @@ def _create_toposolid(doc, boundary_loop, terrain_grid, center_lat, center_lon,
 
     topo_points = List[DB.XYZ]()
     min_elevation_m = terrain_grid["min_elevation_m"]
-    for point in terrain_grid.get("points") or []:
-        x_m, y_m = _project_latlon(point["lat"], point["lon"], center_lat, center_lon)
+    for point in terrain_grid.get("toposolid_points") or terrain_grid.get("points") or []:
+        x_m, y_m = context_geometry.project_latlon(point["lat"], point["lon"], center_lat, center_lon)
         z_value = level.Elevation + _meters_to_internal(point["elevation_m"] - min_elevation_m)
         topo_points.Add(DB.XYZ(_meters_to_internal(x_m), _meters_to_internal(y_m), z_value))
 
@@ -1979,7 +1288,7 @@ def _apply_palette(doc, element, palette_entry, apply_view_override=True):
 
 def _ensure_palette(doc):
     palette = {}
-    for layer_name, palette_entry in CONTEXT_PALETTE.items():
+    for layer_name, palette_entry in context_palette.CONTEXT_PALETTE.items():
         layer_palette = dict(palette_entry)
         layer_palette["material_id"] = _ensure_material(
             doc,
@@ -2072,20 +1381,21 @@ def _find_mass_family_template(app):
     return candidates[0][2]
 
 
-def _create_directshape_building(doc, solid, feature_id, comment_text, palette_entry=None):
+def _create_directshape_building(doc, geometry_objects, data_id, comment_text, palette_entry=None, apply_view_override=True):
     errors = []
     for built_in_category in (DB.BuiltInCategory.OST_Mass, DB.BuiltInCategory.OST_GenericModel):
         shape = None
         try:
             shape = DB.DirectShape.CreateElement(doc, DB.ElementId(built_in_category))
             shape.ApplicationId = APP_ID
-            shape.ApplicationDataId = feature_id or "building"
+            shape.ApplicationDataId = data_id or "building"
 
             geometry = List[DB.GeometryObject]()
-            geometry.Add(solid)
+            for geometry_object in geometry_objects:
+                geometry.Add(geometry_object)
             shape.SetShape(geometry)
             _set_comment(shape, comment_text)
-            _apply_palette(doc, shape, palette_entry)
+            _apply_palette(doc, shape, palette_entry, apply_view_override=apply_view_override)
             return shape
         except Exception as ex:
             errors.append("{}: {}".format(str(built_in_category), str(ex)))
@@ -2098,41 +1408,140 @@ def _create_directshape_building(doc, solid, feature_id, comment_text, palette_e
     raise Exception("; ".join(errors))
 
 
-def _prepare_building_mass_geometry(feature, origin_lat, origin_lon, base_elevation, building_output_mode=BUILDING_OUTPUT_DIRECTSHAPE, palette_entry=None):
-    height_m, height_source = _get_building_height_m(feature.get("tags") or {})
+def _building_tile_geometry(doc, library, building_item, definitions):
+    """Geometry for one building of a tile; repeats of a footprint come from a DirectShapeLibrary definition."""
+    solid = building_item["solid"]
+    key = building_item.get("footprint_key")
+    origin_xy = building_item.get("footprint_origin_xy")
+    if library is None or key is None or origin_xy is None:
+        return [solid]
+    if key not in definitions:
+        definitions[key] = False
+        return [solid]
+
+    definition_id = definitions[key]
+    if definition_id is None:
+        return [solid]
+
+    origin = DB.XYZ(_meters_to_internal(origin_xy[0]), _meters_to_internal(origin_xy[1]), building_item["base_elevation"])
+    try:
+        if definition_id is False:
+            definition_id = "WWP_ContextBuilding_{}".format(key[:16])
+            shape_type = DB.DirectShapeType.Create(doc, definition_id, DB.ElementId(DB.BuiltInCategory.OST_Mass))
+            type_geometry = List[DB.GeometryObject]()
+            type_geometry.Add(DB.SolidUtils.CreateTransformed(solid, DB.Transform.CreateTranslation(origin.Negate())))
+            shape_type.SetShape(type_geometry)
+            library.AddDefinitionType(definition_id, shape_type.Id)
+            definitions[key] = definition_id
+        return list(DB.DirectShape.CreateGeometryInstance(doc, definition_id, DB.Transform.CreateTranslation(origin)))
+    except Exception:
+        definitions[key] = None
+        return [solid]
+
+
+def _batch_index_entries(building_items):
+    return [
+        {
+            "index": index,
+            "feature_id": building_item.get("feature_id"),
+            "comment": building_item.get("comment_text"),
+            "height_m": building_item.get("height_m"),
+        }
+        for index, building_item in enumerate(building_items)
+    ]
+
+
+def _create_directshape_building_tile(doc, building_items, tile_index, palette_entry=None, definitions=None):
+    """One DirectShape for a tile of buildings, coloured by the solids' material instead of view overrides.
+
+    The buildings it holds are listed in a JSON sidecar named in its comment,
+    as for batched mass families.
+    """
+    try:
+        library = DB.DirectShapeLibrary.GetDirectShapeLibrary(doc)
+    except Exception:
+        library = None
+    if definitions is None:
+        definitions = {}
+
+    geometry_objects = []
+    for building_item in building_items:
+        geometry_objects.extend(_building_tile_geometry(doc, library, building_item, definitions))
+    index_name = "WWP_ContextTile_{}_{}".format(
+        tile_index,
+        context_cache.cache_key("building_tile", sorted(str(building_item.get("feature_id")) for building_item in building_items))[:12],
+    )
+    context_batching.write_batch_index(
+        os.path.join(_ensure_cache_dir("building_tiles"), "{}.json".format(index_name)),
+        index_name,
+        _batch_index_entries(building_items),
+    )
+    return _create_directshape_building(
+        doc,
+        geometry_objects,
+        "tile/{}".format(tile_index),
+        "{} | Buildings tile {} | {} buildings | {}.json".format(TITLE, tile_index, len(building_items), index_name),
+        palette_entry,
+        apply_view_override=False,
+    )
+
+
+def _feature_anchor_xy(feature, origin_lat, origin_lon):
+    centroid = context_geometry.latlon_ring_centroid(feature.get("outer") or [])
+    return context_geometry.project_latlon(centroid[0], centroid[1], origin_lat, origin_lon) if centroid else None
+
+
+def _prepare_building_data(feature, origin_lat, origin_lon, base_elevation):
+    """Everything about a building that needs no Revit API: height, cleaned footprint rings and cache keys.
+
+    Runs on the prepare worker pool; _materialize_building_geometry turns the
+    result into curve loops and a solid on the API thread.
+    """
+    height_m, height_source = context_classify.get_building_height_m(feature.get("tags") or {})
     if height_m <= 0:
         raise Exception("Building height resolved to a non-positive value.")
 
-    curve_loops = _feature_to_curve_loops(feature, origin_lat, origin_lon, base_elevation)
-    if curve_loops is None or curve_loops.Count == 0:
+    rings_xy = [context_geometry.project_ring(ring, origin_lat, origin_lon) for ring in [feature.get("outer") or []] + list(feature.get("inners") or [])]
+    loop_rings = context_prepare.polygon_rings_xy(rings_xy[0], rings_xy[1:])
+    if loop_rings is None:
         raise Exception("Failed to build a valid building footprint.")
 
-    material_id = DB.ElementId.InvalidElementId
-    if building_output_mode == BUILDING_OUTPUT_DIRECTSHAPE and palette_entry:
-        material_id = palette_entry.get("material_id")
-    solid = _create_solid(curve_loops, height_m, material_id)
     feature_id = feature.get("id") or "building"
-    comment_text = "Web Context Builder | {} | {:.2f} m | {}".format(feature_id, height_m, height_source)
+    footprint_origin_xy, footprint_key = context_family_cache.footprint_key(rings_xy, height_m)
     return {
-        "solid": solid,
-        "curve_loops": curve_loops,
+        "loop_rings": loop_rings,
         "feature_id": feature_id,
-        "comment_text": comment_text,
+        "comment_text": "Web Context Builder | {} | {:.2f} m | {}".format(feature_id, height_m, height_source),
         "height_m": height_m,
         "base_elevation": base_elevation,
+        "anchor_xy": _feature_anchor_xy(feature, origin_lat, origin_lon),
+        "vertex_count": 2 * sum(len(ring) for ring in rings_xy),
+        "geometry_key": context_family_cache.geometry_key(rings_xy, height_m, base_elevation),
+        "footprint_origin_xy": footprint_origin_xy,
+        "footprint_key": footprint_key,
     }
 
 
+def _materialize_building_geometry(building_data, building_output_mode=BUILDING_OUTPUT_DIRECTSHAPE, palette_entry=None):
+    curve_loops = _rings_to_curve_loops(building_data["loop_rings"], building_data["base_elevation"])
+    if curve_loops is None or curve_loops.Count == 0:
+        raise Exception("Failed to build a valid building footprint.")
+
+    material_id = DB.ElementId.InvalidElementId
+    if building_output_mode == BUILDING_OUTPUT_DIRECTSHAPE and palette_entry:
+        material_id = palette_entry.get("material_id")
+    building_item = dict(building_data)
+    building_item["solid"] = _create_solid(curve_loops, building_data["height_m"], material_id)
+    building_item["curve_loops"] = curve_loops
+    return building_item
+
+
 def _create_inplace_mass_buildings(doc, building_items, palette_entry=None):
     return _create_mass_family_buildings(doc, building_items, palette_entry)
 
 
-def _chunk_items(items, chunk_size):
-    if not items:
-        return []
-    if chunk_size <= 0:
-        return [list(items)]
-    return [list(items[index:index + chunk_size]) for index in range(0, len(items), chunk_size)]
+def _building_item_vertex_count(building_item):
+    return building_item.get("vertex_count") or 1
 
 
 def _create_family_freeform(family_doc, building_item):
@@ -2152,10 +1561,7 @@ def _create_family_freeform(family_doc, building_item):
     return freeform
 
 
-def _create_mass_family_chunk(doc, building_items, palette_entry=None, batch_index=0, batch_count=1):
-    if not building_items:
-        raise Exception("No building solids were provided for family creation.")
-
+def _build_mass_family_file(doc, building_items, family_name, load_stats=None):
     app = getattr(doc, "Application", None)
     if app is None:
         raise Exception("Unable to access the Revit application.")
@@ -2170,18 +1576,11 @@ def _create_mass_family_chunk(doc, building_items, palette_entry=None, batch_ind
             .format(template_root)
         )
 
-    if batch_count > 1:
-        family_name_seed = "WWP_ContextMass_Batch_{}_part_{:02d}_of_{:02d}".format(len(building_items), batch_index + 1, batch_count)
-    else:
-        family_name_seed = "WWP_ContextMass_Batch_{}".format(len(building_items))
-    family_name = _make_safe_name(family_name_seed, "WWP_ContextMass_Batch")
     family_doc = app.NewFamilyDocument(template_path)
     if family_doc is None:
         raise Exception("Failed to open a new mass family document from template.")
 
-    cache_dir = _ensure_cache_dir("generated_mass_families")
-    family_path = os.path.join(cache_dir, "{}.rfa".format(family_name))
-    family = None
+    family_path = os.path.join(_ensure_cache_dir("generated_mass_families"), "{}.rfa".format(family_name))
     family_transaction = None
 
     try:
@@ -2202,14 +1601,18 @@ def _create_mass_family_chunk(doc, building_items, palette_entry=None, batch_ind
         family_transaction.Commit()
         family_transaction = None
 
+        save_started = time.time()
         save_options = DB.SaveAsOptions()
         save_options.OverwriteExistingFile = True
         family_doc.SaveAs(family_path, save_options)
 
-        try:
-            family = family_doc.LoadFamily(doc, _OverwriteFamilyLoadOptions())
-        except Exception:
-            family = None
+        if load_stats is not None:
+            load_stats["elapsed_sec"] = time.time() - save_started
+            try:
+                load_stats["file_bytes"] = os.path.getsize(family_path)
+            except Exception:
+                pass
+        context_batching.write_batch_index(family_path, family_name, _batch_index_entries(building_items))
     except Exception:
         if family_transaction is not None:
             try:
@@ -2223,22 +1626,52 @@ def _create_mass_family_chunk(doc, building_items, palette_entry=None, batch_ind
         except Exception:
             pass
 
-    if not isinstance(family, DB.Family):
-        family = None
+    return family_path
 
-    if family is None:
-        try:
-            families = list(DB.FilteredElementCollector(doc).OfClass(DB.Family))
-            for candidate in families:
-                if candidate.Name == family_name:
-                    family = candidate
-                    break
-        except Exception:
-            family = None
 
-    if family is None:
-        raise Exception("Failed to load the generated mass family into the project.")
+def _find_family_by_name(doc, family_name):
+    try:
+        for candidate in DB.FilteredElementCollector(doc).OfClass(DB.Family):
+            if candidate.Name == family_name:
+                return candidate
+    except Exception:
+        pass
+    return None
+
 
+def _load_mass_family_file(doc, family_path):
+    options = _OverwriteFamilyLoadOptions()
+    load_attempts = [
+        lambda: doc.LoadFamily(family_path, options),
+        lambda: doc.LoadFamily(family_path, options, None),
+    ]
+    transaction = None
+    try:
+        if not doc.IsModifiable:
+            transaction = DB.Transaction(doc, "Load Web Context Builder Mass")
+            transaction.Start()
+        for attempt in load_attempts:
+            try:
+                result = attempt()
+            except Exception:
+                continue
+            # Out-parameter overloads come back as (loaded, family).
+            family = result[-1] if isinstance(result, tuple) else None
+            if isinstance(family, DB.Family):
+                if transaction is not None:
+                    transaction.Commit()
+                    transaction = None
+                return family
+        return None
+    finally:
+        if transaction is not None:
+            try:
+                transaction.RollBack()
+            except Exception:
+                pass
+
+
+def _place_mass_family(doc, family, family_name, palette_entry=None):
     symbol_ids = list(family.GetFamilySymbolIds())
     if not symbol_ids:
         raise Exception("The generated mass family contains no types.")
@@ -2264,7 +1697,7 @@ def _create_mass_family_chunk(doc, building_items, palette_entry=None, batch_ind
         try:
             instance = attempt()
             if instance is not None:
-                _set_comment(instance, "Web Context Builder | Batched mass family | {} buildings".format(len(building_items)))
+                _set_comment(instance, "Web Context Builder | Batched mass family | {}.json".format(family_name))
                 _apply_palette(doc, instance, palette_entry)
                 return instance
         except Exception as ex:
@@ -2273,39 +1706,134 @@ def _create_mass_family_chunk(doc, building_items, palette_entry=None, batch_ind
     raise Exception("Failed to place the generated mass family instance. {}".format("; ".join(errors[:5])))
 
 
-def _create_mass_family_buildings(doc, building_items, palette_entry=None):
-    batches = _chunk_items(building_items, MAX_BUILDING_SOLIDS_PER_MASS_FAMILY)
-    if not batches:
+def _create_mass_family_chunk(doc, building_items, family_prefix, palette_entry=None, load_stats=None):
+    if not building_items:
         raise Exception("No building solids were provided for family creation.")
+    if load_stats is None:
+        load_stats = {}
+
+    content_hash = context_family_cache.group_content_hash([building_item.get("geometry_key") or "" for building_item in building_items], palette_entry)
+    family_name = _make_safe_name("{}_{}".format(family_prefix, content_hash[:12]), "WWP_ContextMass")
+
+    # A family named after its content hash is the same geometry wherever it came from.
+    family = _find_family_by_name(doc, family_name)
+    family_path = os.path.join(_ensure_cache_dir("generated_mass_families"), "{}.rfa".format(family_name))
+    if family is None:
+        family_path = _build_mass_family_file(doc, building_items, family_name, load_stats)
+        load_started = time.time()
+        family = _load_mass_family_file(doc, family_path)
+        if load_stats.get("elapsed_sec") is not None:
+            load_stats["elapsed_sec"] += time.time() - load_started
+
+    if family is None:
+        raise Exception("Failed to load the generated mass family into the project.")
+    return _place_mass_family(doc, family, family_name, palette_entry), content_hash, family_path, family_name
+
+
+def _load_cached_mass_families(doc, family_paths):
+    """(family_name, family) for every cached file, or None when any of them fails to load."""
+    families = []
+    for family_path in family_paths or []:
+        family_name = os.path.splitext(os.path.basename(family_path))[0]
+        family = _find_family_by_name(doc, family_name) or _load_mass_family_file(doc, family_path)
+        if family is None:
+            return None
+        families.append((family_name, family))
+    return families or None
+
+
+def _load_mass_family_limits():
+    return context_batching.BatchLimits.from_dict(_read_cache_json("mass_family_batching", MASS_FAMILY_LIMITS_CACHE_KEY))
+
+
+def _save_mass_family_state(limits, manifest):
+    _write_cache_json("mass_family_batching", MASS_FAMILY_LIMITS_CACHE_KEY, limits.to_dict())
+    manifest.evict()
+    manifest.save()
+
+
+def _create_mass_family_buildings(doc, building_items, palette_entry=None, limits=None, manifest=None, failures=None):
+    """Place a group of buildings, normally one spatial tile, as batched mass families.
+
+    The group is cached under the content hash of its buildings, so a later
+    run over the same tile reloads its families whatever batch sizes are
+    current. Otherwise batch sizes adapt to the save and load times measured
+    here and on previous runs. Callers placing several groups pass shared
+    limits and manifest and save them once at the end. Errors are raised
+    together, or recorded per building in failures when given.
+    """
+    if not building_items:
+        raise Exception("No building solids were provided for family creation.")
+
+    owns_state = limits is None or manifest is None
+    if limits is None:
+        limits = _load_mass_family_limits()
+    if manifest is None:
+        manifest = context_family_cache.FamilyManifest(_ensure_cache_dir("generated_mass_families"))
+    geometry_keys = [building_item.get("geometry_key") for building_item in building_items]
+    cacheable = all(geometry_keys)
+    group_hash = context_family_cache.group_content_hash(geometry_keys, palette_entry) if cacheable else None
 
     instances = []
     errors = []
-    batch_count = len(batches)
-    for batch_index, batch_items in enumerate(batches):
-        try:
-            instance = _create_mass_family_chunk(
-                doc,
-                batch_items,
-                palette_entry,
-                batch_index=batch_index,
-                batch_count=batch_count,
-            )
-            if instance is not None:
+    cached_families = _load_cached_mass_families(doc, manifest.lookup(group_hash)) if cacheable else None
+    if cached_families:
+        for family_name, family in cached_families:
+            try:
+                instances.append(_place_mass_family(doc, family, family_name, palette_entry))
+            except Exception as ex:
+                errors.append("{}: {}".format(family_name, str(ex)))
+        if errors and failures is not None:
+            for building_item in building_items:
+                failures.append({"id": building_item["feature_id"], "reason": errors[0]})
+    else:
+        family_prefix = "WWP_ContextMass_{}".format(group_hash[:12]) if group_hash else "WWP_ContextMass"
+        built_families = []
+        ordered_items = context_batching.spatial_order(building_items, lambda item: item.get("anchor_xy"))
+        for batch_index, batch_items in enumerate(context_batching.iter_batches(ordered_items, limits, _building_item_vertex_count)):
+            load_stats = {}
+            try:
+                instance, content_hash, family_path, family_name = _create_mass_family_chunk(
+                    doc,
+                    batch_items,
+                    family_prefix,
+                    palette_entry,
+                    load_stats=load_stats,
+                )
                 instances.append(instance)
-        except Exception as ex:
-            errors.append("batch {} of {}: {}".format(batch_index + 1, batch_count, str(ex)))
+                built_families.append((content_hash, family_path, family_name))
+            except Exception as ex:
+                errors.append("batch {}: {}".format(batch_index + 1, str(ex)))
+                if failures is not None:
+                    for building_item in batch_items:
+                        failures.append({"id": building_item["feature_id"], "reason": str(ex)})
+            if load_stats.get("elapsed_sec"):
+                limits.record(
+                    len(batch_items),
+                    sum(_building_item_vertex_count(item) for item in batch_items),
+                    load_stats["elapsed_sec"],
+                    load_stats.get("file_bytes"),
+                )
+        if cacheable and not errors:
+            manifest.add(group_hash, [family_path for _, family_path, _ in built_families], [family_name for _, _, family_name in built_families])
+        else:
+            # The group cannot be reused as a whole; file its families singly so eviction still sees them.
+            for content_hash, family_path, family_name in built_families:
+                manifest.add(content_hash, [family_path], [family_name])
 
-    if errors:
+    if owns_state:
+        _save_mass_family_state(limits, manifest)
+    if errors and failures is None:
         raise Exception("Failed to create one or more mass family batches. {}".format("; ".join(errors[:5])))
 
     return instances
 
 
-def _create_building_mass(doc, feature, origin_lat, origin_lon, base_elevation, palette_entry=None, building_output_mode=BUILDING_OUTPUT_DIRECTSHAPE):
-    building_item = _prepare_building_mass_geometry(feature, origin_lat, origin_lon, base_elevation, building_output_mode, palette_entry)
+def _create_building_mass(doc, building_data, palette_entry=None, building_output_mode=BUILDING_OUTPUT_DIRECTSHAPE):
+    building_item = _materialize_building_geometry(building_data, building_output_mode, palette_entry)
     return _create_directshape_building(
         doc,
-        building_item["solid"],
+        [building_item["solid"]],
         building_item["feature_id"],
         building_item["comment_text"],
         palette_entry,
@@ -2350,22 +1878,6 @@ def _get_floor_type_total_width(compound):
     return _meters_to_internal(CONTEXT_FLOOR_THICKNESS_M)
 
 
-def _context_floor_type_specs():
-    return (
-        ("WWP CONTEXT - ROAD", "roads"),
-        ("WWP CONTEXT - TRACK", "tracks"),
-        ("WWP CONTEXT - PARCEL", "parcels"),
-        ("WWP CONTEXT - PARK", "parks"),
-        ("WWP CONTEXT - WATER", "water"),
-    )
-
-
-def _legacy_floor_type_suffix(type_name):
-    if not type_name or " - " not in type_name:
-        return None
-    return " - WWP " + type_name.split(" - ")[-1].title()
-
-
 def _apply_compound_material_ids(compound, material_id):
     if compound is None or material_id is None or _is_invalid_element_id(material_id):
         return compound
@@ -2448,7 +1960,7 @@ def _repair_existing_context_floor_types(doc, palette):
         return
 
     target_specs = {}
-    for type_name, palette_key in _context_floor_type_specs():
+    for type_name, palette_key in context_palette.CONTEXT_FLOOR_TYPE_SPECS:
         palette_entry = (palette or {}).get(palette_key)
         material_id = (palette_entry or {}).get("material_id")
         if material_id is None or _is_invalid_element_id(material_id):
@@ -2456,7 +1968,7 @@ def _repair_existing_context_floor_types(doc, palette):
         target_specs[type_name] = {
             "palette_key": palette_key,
             "material_id": material_id,
-            "legacy_suffix": _legacy_floor_type_suffix(type_name),
+            "legacy_suffix": context_palette.legacy_floor_type_suffix(type_name),
         }
 
     if not target_specs:
@@ -2505,7 +2017,7 @@ def _get_materialized_floor_type(doc, base_floor_type, palette_entry, type_name)
         return base_floor_type
 
     floor_type = None
-    legacy_suffix = _legacy_floor_type_suffix(type_name)
+    legacy_suffix = context_palette.legacy_floor_type_suffix(type_name)
     try:
         for candidate in DB.FilteredElementCollector(doc).OfClass(DB.FloorType):
             candidate_name = candidate.Name
@@ -2585,8 +2097,42 @@ def _summarize_data(address_label, radius_m, dense_area_m, endpoint, selected_la
     return "\n".join(lines)
 
 
-def _summarize_results(created_counts, failures):
-    lines = [
+def _open_progress_bar():
+    try:
+        from pyrevit import forms
+
+        progress_bar = forms.ProgressBar(step=1, title="{} - Building".format(TITLE), cancellable=True)
+        return progress_bar.__enter__()
+    except Exception:
+        return None
+
+
+def _close_progress_bar(progress_bar):
+    if progress_bar is None:
+        return
+    try:
+        progress_bar.__exit__(None, None, None)
+    except Exception:
+        pass
+
+
+def _summarize_results(created_counts, failures, pipeline=None, terrain_grid=None):
+    lines = []
+    if pipeline is not None and pipeline.status == context_pipeline.STATUS_CANCELLED:
+        lines.append("Cancelled - kept completed layers: {}".format(", ".join(pipeline.completed_layers) or "none"))
+        lines.append("")
+    elif pipeline is not None and pipeline.status == context_pipeline.STATUS_FAILED:
+        lines.append("Stopped at {} layer (rolled back): {}".format(pipeline.failed_layer, pipeline.error))
+        lines.append("Kept completed layers: {}".format(", ".join(pipeline.completed_layers) or "none"))
+        lines.append("")
+    if pipeline is not None and pipeline.rolled_back:
+        lines.append("Rolled back {} layer: {} created elements and {} failures discarded".format(
+            pipeline.rolled_back["layer"],
+            pipeline.rolled_back["created"],
+            pipeline.rolled_back["failures"],
+        ))
+        lines.append("")
+    lines += [
         "Terrain created: {}".format(created_counts.get("terrain", 0)),
         "Buildings created: {}".format(created_counts.get("buildings", 0)),
         "Road elements created: {}".format(created_counts.get("roads", 0)),
@@ -2597,33 +2143,37 @@ def _summarize_results(created_counts, failures):
         "Failures: {}".format(len(failures)),
     ]
 
+    simplification = (terrain_grid or {}).get("simplification")
+    if simplification and created_counts.get("terrain"):
+        lines.append(
+            "Terrain points: {} of {} kept | max deviation {:.2f}m | mean deviation {:.2f}m".format(
+                simplification.get("output_count", 0),
+                simplification.get("input_count", 0),
+                simplification.get("max_deviation_m", 0.0),
+                simplification.get("mean_deviation_m", 0.0),
+            )
+        )
+
     if failures:
         lines.append("")
         lines.append("Failures (first {}):".format(MAX_FAILURES_IN_REPORT))
         for failure in failures[:MAX_FAILURES_IN_REPORT]:
             lines.append("{} | {}".format(failure["id"], failure["reason"]))
 
-    return "\n".join(lines)
-
-
-def _project_way_points(way, origin_lat, origin_lon):
-    points = _geometry_to_points(way.get("geometry"))
-    projected = [_project_latlon(point[0], point[1], origin_lat, origin_lon) for point in points]
-    return _remove_duplicate_xy(projected, tolerance_m=0.05)
-
+    if pipeline is not None and pipeline.error_trace:
+        lines.append("")
+        lines.append(pipeline.error_trace)
 
-def _is_area_way(tags):
-    area_value = (tags.get("area") or "").strip().lower()
-    return area_value in ("yes", "1", "true") or bool(tags.get("area:highway"))
+    return "\n".join(lines)
 
 
 def _build_terrain_boundary_loop(center_lat, center_lon, radius_m, base_elevation):
-    min_lat, min_lon, max_lat, max_lon = _calculate_square_bounds(center_lat, center_lon, radius_m)
+    min_lat, min_lon, max_lat, max_lon = context_geometry.calculate_square_bounds(center_lat, center_lon, radius_m)
     boundary_points = [
-        _project_latlon(min_lat, min_lon, center_lat, center_lon),
-        _project_latlon(min_lat, max_lon, center_lat, center_lon),
-        _project_latlon(max_lat, max_lon, center_lat, center_lon),
-        _project_latlon(max_lat, min_lon, center_lat, center_lon),
+        context_geometry.project_latlon(min_lat, min_lon, center_lat, center_lon),
+        context_geometry.project_latlon(min_lat, max_lon, center_lat, center_lon),
+        context_geometry.project_latlon(max_lat, max_lon, center_lat, center_lon),
+        context_geometry.project_latlon(max_lat, min_lon, center_lat, center_lon),
     ]
     boundary_points.append(boundary_points[0])
     return _xy_ring_to_curve_loop(boundary_points, clockwise=False, base_elevation=base_elevation)
@@ -2645,6 +2195,8 @@ def main():
     if dense_area_m is None:
         dense_area_m = TERRAIN_DENSE_SQUARE_SIZE_M
     selected_layers = user_inputs.get("layers") or {}
+    building_output_mode = user_inputs.get("building_output") or BUILDING_OUTPUT_DIRECTSHAPE
+    extract_path = user_inputs.get("extract_path") or ""
     selected_location = user_inputs.get("location")
     selected_location_label = user_inputs.get("location_label") or ""
     terrain_enabled = bool(selected_layers.get("terrain"))
@@ -2664,27 +2216,29 @@ def main():
         center_lat, center_lon = location
         address_label = "Project site location ({:.6f}, {:.6f})".format(center_lat, center_lon)
 
-    query = _build_overpass_query(center_lat, center_lon, radius_m)
-    overpass_data = _fetch_overpass_json(query)
-    elements = overpass_data.get("elements") or []
-    if not elements and not terrain_enabled:
+    if extract_path:
+        try:
+            overpass_layers = context_extract.load_extract_layers(extract_path, center_lat, center_lon, radius_m, selected_layers)
+        except Exception as ex:
+            UI.TaskDialog.Show(TITLE, "Could not read OSM extract {}:\n{}".format(extract_path, ex))
+            return
+    else:
+        overpass_layers = context_overpass.fetch_overpass_tiles(center_lat, center_lon, radius_m, selected_layers, USER_AGENT, CACHE_ROOT)
+    if not overpass_layers.element_count and not terrain_enabled:
         UI.TaskDialog.Show(TITLE, "No OSM context data was returned for the selected location.")
         return
 
-    ways, relations, roads, tracks, waterways = _collect_elements(elements)
-    building_features = _build_area_features(ways, relations, _is_building_tag) if selected_layers.get("buildings") else []
-    parcel_features = _build_area_features(ways, relations, _is_parcel_tag) if selected_layers.get("parcels") else []
-    park_features = _build_area_features(ways, relations, _is_park_tag) if selected_layers.get("parks") else []
-    water_features = _build_area_features(ways, relations, _is_water_tag) if selected_layers.get("water") else []
-    roads = roads if selected_layers.get("roads") else []
-    tracks = tracks if selected_layers.get("tracks") else []
-    waterways = waterways if selected_layers.get("water") else []
+    ways, relations, roads, tracks, waterways = overpass_layers.layers()
+    building_features = context_classify.build_area_features(ways, relations, context_classify.is_building_tag) if selected_layers.get("buildings") else []
+    parcel_features = context_classify.build_area_features(ways, relations, context_classify.is_parcel_tag) if selected_layers.get("parcels") else []
+    park_features = context_classify.build_area_features(ways, relations, context_classify.is_park_tag) if selected_layers.get("parks") else []
+    water_features = context_classify.build_area_features(ways, relations, context_classify.is_water_tag) if selected_layers.get("water") else []
 
     preview_text = _summarize_data(
         address_label,
         radius_m,
         dense_area_m,
-        overpass_data.get("_endpoint"),
+        overpass_layers.endpoint,
         selected_layers,
         building_features,
         roads,
@@ -2730,277 +2284,268 @@ def main():
             UI.TaskDialog.Show(TITLE, "HRDEM terrain sampling failed:\n{}".format(str(ex)))
             return
 
-    created_counts = {"terrain": 0, "buildings": 0, "roads": 0, "tracks": 0, "parcels": 0, "parks": 0, "water": 0}
-    failures = []
     base_elevation = base_level.Elevation
-    terrain_toposolid = None
+    failures = []
+    state = {"palette": {}, "terrain_toposolid": None}
+
+    building_base_elevations = [None] * len(building_features)
+    if terrain_enabled and terrain_grid is not None:
+        building_base_elevations = context_terrain.grid_bilinear_elevations(
+            terrain_grid,
+            center_lat,
+            center_lon,
+            [context_geometry.latlon_ring_centroid(feature.get("outer") or []) for feature in building_features],
+        )
 
-    transaction = DB.Transaction(doc, TITLE)
-    started = False
-    try:
-        transaction.Start()
-        started = True
+    def _prepare_types(_item):
         palette = _ensure_palette(doc)
         _repair_existing_context_floor_types(doc, palette)
-        road_floor_type = _get_materialized_floor_type(doc, road_floor_type, palette.get("roads"), "WWP CONTEXT - ROAD") if road_floor_type is not None else None
-        track_floor_type = _get_materialized_floor_type(doc, track_floor_type, palette.get("tracks"), "WWP CONTEXT - TRACK") if track_floor_type is not None else None
-        parcel_floor_type = _get_materialized_floor_type(doc, parcel_floor_type, palette.get("parcels"), "WWP CONTEXT - PARCEL") if parcel_floor_type is not None else None
-        park_floor_type = _get_materialized_floor_type(doc, park_floor_type, palette.get("parks"), "WWP CONTEXT - PARK") if park_floor_type is not None else None
-        water_floor_type = _get_materialized_floor_type(doc, water_floor_type, palette.get("water"), "WWP CONTEXT - WATER") if water_floor_type is not None else None
-
-        if terrain_enabled:
-            boundary_loop = _build_terrain_boundary_loop(center_lat, center_lon, radius_m, base_elevation)
-            if boundary_loop is None:
-                raise Exception("Failed to build a terrain boundary profile.")
-            terrain_toposolid = _create_toposolid(
-                doc,
-                boundary_loop,
-                terrain_grid,
-                center_lat,
-                center_lon,
-                base_level,
-                terrain_topo_type,
-            )
-            _set_comment(
-                terrain_toposolid,
-                "Web Context Builder | HRDEM terrain | range {:.2f}m to {:.2f}m".format(
-                    terrain_grid["min_elevation_m"],
-                    terrain_grid["max_elevation_m"],
-                ),
-            )
-            _apply_palette(doc, terrain_toposolid, palette.get("terrain"))
-            created_counts["terrain"] = 1
+        state["palette"] = palette
+        state["road_floor_type"] = _get_materialized_floor_type(doc, road_floor_type, palette.get("roads"), "WWP CONTEXT - ROAD") if road_floor_type is not None else None
+        state["track_floor_type"] = _get_materialized_floor_type(doc, track_floor_type, palette.get("tracks"), "WWP CONTEXT - TRACK") if track_floor_type is not None else None
+        state["parcel_floor_type"] = _get_materialized_floor_type(doc, parcel_floor_type, palette.get("parcels"), "WWP CONTEXT - PARCEL") if parcel_floor_type is not None else None
+        state["park_floor_type"] = _get_materialized_floor_type(doc, park_floor_type, palette.get("parks"), "WWP CONTEXT - PARK") if park_floor_type is not None else None
+        state["water_floor_type"] = _get_materialized_floor_type(doc, water_floor_type, palette.get("water"), "WWP CONTEXT - WATER") if water_floor_type is not None else None
+        return False
+
+    def _create_terrain(_item):
+        boundary_loop = _build_terrain_boundary_loop(center_lat, center_lon, radius_m, base_elevation)
+        if boundary_loop is None:
+            raise Exception("Failed to build a terrain boundary profile.")
+        terrain_toposolid = _create_toposolid(
+            doc,
+            boundary_loop,
+            terrain_grid,
+            center_lat,
+            center_lon,
+            base_level,
+            terrain_topo_type,
+        )
+        _set_comment(
+            terrain_toposolid,
+            "Web Context Builder | HRDEM terrain | range {:.2f}m to {:.2f}m".format(
+                terrain_grid["min_elevation_m"],
+                terrain_grid["max_elevation_m"],
+            ),
+        )
+        _apply_palette(doc, terrain_toposolid, state["palette"].get("terrain"))
+        state["terrain_toposolid"] = terrain_toposolid
+        return True
+
+    def _building_base_elevation(sampled_elevation):
+        if sampled_elevation is None:
+            return base_elevation
+        return base_level.Elevation + _meters_to_internal(sampled_elevation - terrain_grid["min_elevation_m"])
+
+    def _create_building(entry):
+        feature, (building_data, prepare_error) = entry
+        try:
+            if prepare_error is not None:
+                raise prepare_error
+            _create_building_mass(doc, building_data, state["palette"].get("buildings"), BUILDING_OUTPUT_DIRECTSHAPE)
+            return True
+        except Exception as ex:
+            failures.append({"id": feature.get("id") or "building", "reason": str(ex)})
+            return False
+
+    building_definitions = {}
 
-        for feature in building_features:
+    def _create_building_tile(entry):
+        tile_index, tile_entries = entry
+        palette_entry = state["palette"].get("buildings")
+        building_items = []
+        for feature, (building_data, prepare_error) in tile_entries:
             try:
-                feature_base_elevation = base_elevation
-                if terrain_enabled and terrain_grid is not None:
-                    centroid_latlon = _latlon_ring_centroid(feature.get("outer") or [])
-                    if centroid_latlon is not None:
-                        sampled_elevation = _terrain_bilinear_elevation(
-                            terrain_grid,
-                            center_lat,
-                            center_lon,
-                            centroid_latlon[0],
-                            centroid_latlon[1],
-                        )
-                        if sampled_elevation is not None:
-                            feature_base_elevation = base_level.Elevation + _meters_to_internal(
-                                sampled_elevation - terrain_grid["min_elevation_m"]
-                            )
-
-                _create_building_mass(
-                    doc,
-                    feature,
-                    center_lat,
-                    center_lon,
-                    feature_base_elevation,
-                    palette.get("buildings"),
-                    BUILDING_OUTPUT_DIRECTSHAPE,
-                )
-                created_counts["buildings"] += 1
+                if prepare_error is not None:
+                    raise prepare_error
+                building_items.append(_materialize_building_geometry(building_data, BUILDING_OUTPUT_DIRECTSHAPE, palette_entry))
             except Exception as ex:
                 failures.append({"id": feature.get("id") or "building", "reason": str(ex)})
-
-        for way in roads:
-            way_id = "way/{}".format(way.get("id"))
+        if not building_items:
+            return 0
+        try:
+            _create_directshape_building_tile(doc, building_items, tile_index, palette_entry, building_definitions)
+            return len(building_items)
+        except Exception as ex:
+            for building_item in building_items:
+                failures.append({"id": building_item["feature_id"], "reason": str(ex)})
+            return 0
+
+    mass_family_limits = None
+    mass_family_manifest = None
+    if building_output_mode == BUILDING_OUTPUT_MASS_FAMILY:
+        mass_family_limits = _load_mass_family_limits()
+        mass_family_manifest = context_family_cache.FamilyManifest(_ensure_cache_dir("generated_mass_families"))
+
+    def _create_building_family_tile(entry):
+        tile_index, tile_entries = entry
+        palette_entry = state["palette"].get("buildings")
+        building_items = []
+        for feature, (building_data, prepare_error) in tile_entries:
             try:
-                tags = way.get("tags") or {}
-                projected = _project_way_points(way, center_lat, center_lon)
-                if len(projected) < 2:
-                    raise Exception("Road geometry is too short.")
-
-                if _is_area_way(tags):
-                    ring = _close_ring(projected)
-                    curve_loops = _polygon_to_curve_loops(ring, [], base_elevation)
-                else:
-                    polygon = _polyline_to_buffer_polygon(projected, _road_width_m(tags))
-                    curve_loops = _polygon_to_curve_loops(polygon, [], base_elevation) if polygon else None
-
-                if terrain_enabled and terrain_toposolid is not None:
-                    road_subdivision = _create_toposolid_subdivision(
-                        doc,
-                        terrain_toposolid,
-                        curve_loops,
-                        "Web Context Builder | Road subdivision | {}".format(way_id),
-                    )
-                    _apply_subdivision_offset_2026(doc, road_subdivision)
-                    _apply_palette(doc, road_subdivision, palette.get("roads"))
-                else:
-                    road_floor = _create_floor(
-                        doc,
-                        curve_loops,
-                        road_floor_type,
-                        base_level,
-                        "Web Context Builder | Road | {}".format(way_id),
-                    )
-                    _apply_palette(doc, road_floor, palette.get("roads"), apply_view_override=False)
-                created_counts["roads"] += 1
+                if prepare_error is not None:
+                    raise prepare_error
+                building_items.append(_materialize_building_geometry(building_data, BUILDING_OUTPUT_MASS_FAMILY, palette_entry))
             except Exception as ex:
-                failures.append({"id": way_id, "reason": str(ex)})
+                failures.append({"id": feature.get("id") or "building", "reason": str(ex)})
+        if not building_items:
+            return 0
+        failed_before = len(failures)
+        _create_mass_family_buildings(doc, building_items, palette_entry, mass_family_limits, mass_family_manifest, failures)
+        return len(building_items) - (len(failures) - failed_before)
+
+    def _create_way_element(entry, label, palette_key, floor_type_key, area_allowed):
+        way, projected, rings, prepare_error = entry
+        way_id = "way/{}".format(way.get("id"))
+        try:
+            if area_allowed and len(projected) < 2:
+                raise Exception("{} geometry is too short.".format(label))
+            if prepare_error is not None:
+                raise prepare_error
 
-        for way in tracks:
-            way_id = "way/{}".format(way.get("id"))
-            try:
-                tags = way.get("tags") or {}
-                projected = _project_way_points(way, center_lat, center_lon)
-                if len(projected) < 2:
-                    raise Exception("Track geometry is too short.")
-
-                if _is_area_way(tags):
-                    ring = _close_ring(projected)
-                    curve_loops = _polygon_to_curve_loops(ring, [], base_elevation)
-                else:
-                    polygon = _polyline_to_buffer_polygon(projected, _track_width_m(tags))
-                    curve_loops = _polygon_to_curve_loops(polygon, [], base_elevation) if polygon else None
-
-                if terrain_enabled and terrain_toposolid is not None:
-                    track_subdivision = _create_toposolid_subdivision(
-                        doc,
-                        terrain_toposolid,
-                        curve_loops,
-                        "Web Context Builder | Track subdivision | {}".format(way_id),
-                    )
-                    _apply_subdivision_offset_2026(doc, track_subdivision)
-                    _apply_palette(doc, track_subdivision, palette.get("tracks"))
-                else:
-                    track_floor = _create_floor(
-                        doc,
-                        curve_loops,
-                        track_floor_type,
-                        base_level,
-                        "Web Context Builder | Track | {}".format(way_id),
-                    )
-                    _apply_palette(doc, track_floor, palette.get("tracks"), apply_view_override=False)
-                created_counts["tracks"] += 1
-            except Exception as ex:
-                failures.append({"id": way_id, "reason": str(ex)})
+            curve_loops = _rings_to_curve_loops(rings, base_elevation)
 
-        for feature in parcel_features:
-            try:
-                curve_loops = _feature_to_curve_loops(feature, center_lat, center_lon, base_elevation)
-                if terrain_enabled and terrain_toposolid is not None:
-                    parcel_subdivision = _create_toposolid_subdivision(
-                        doc,
-                        terrain_toposolid,
-                        curve_loops,
-                        "Web Context Builder | Parcel subdivision | {}".format(feature.get("id")),
-                    )
-                    _apply_subdivision_offset_2026(doc, parcel_subdivision)
-                    _apply_palette(doc, parcel_subdivision, palette.get("parcels"))
-                else:
-                    parcel_floor = _create_floor(
-                        doc,
-                        curve_loops,
-                        parcel_floor_type,
-                        base_level,
-                        "Web Context Builder | Parcel | {}".format(feature.get("id")),
-                    )
-                    _apply_palette(doc, parcel_floor, palette.get("parcels"), apply_view_override=False)
-                created_counts["parcels"] += 1
-            except Exception as ex:
-                failures.append({"id": feature.get("id") or "parcel", "reason": str(ex)})
+            terrain_toposolid = state["terrain_toposolid"]
+            if terrain_enabled and terrain_toposolid is not None:
+                subdivision = _create_toposolid_subdivision(
+                    doc,
+                    terrain_toposolid,
+                    curve_loops,
+                    "Web Context Builder | {} subdivision | {}".format(label, way_id),
+                )
+                _apply_subdivision_offset_2026(doc, subdivision)
+                _apply_palette(doc, subdivision, state["palette"].get(palette_key))
+            else:
+                floor = _create_floor(
+                    doc,
+                    curve_loops,
+                    state[floor_type_key],
+                    base_level,
+                    "Web Context Builder | {} | {}".format(label, way_id),
+                )
+                _apply_palette(doc, floor, state["palette"].get(palette_key), apply_view_override=False)
+            return True
+        except Exception as ex:
+            failures.append({"id": way_id, "reason": str(ex)})
+            return False
 
-        for feature in park_features:
-            try:
-                curve_loops = _feature_to_curve_loops(feature, center_lat, center_lon, base_elevation)
-                if terrain_enabled and terrain_toposolid is not None:
-                    park_subdivision = _create_toposolid_subdivision(
-                        doc,
-                        terrain_toposolid,
-                        curve_loops,
-                        "Web Context Builder | Park subdivision | {}".format(feature.get("id")),
-                    )
-                    _apply_subdivision_offset_2026(doc, park_subdivision)
-                    _apply_palette(doc, park_subdivision, palette.get("parks"))
-                else:
-                    park_floor = _create_floor(
-                        doc,
-                        _feature_to_curve_loops(
-                            feature,
-                            center_lat,
-                            center_lon,
-                            base_elevation,
-                            extra_inner_rings=_collect_water_hole_rings_for_feature(feature, water_features),
-                        ),
-                        park_floor_type,
-                        base_level,
-                        "Web Context Builder | Park | {}".format(feature.get("id")),
-                    )
-                    _apply_palette(doc, park_floor, palette.get("parks"), apply_view_override=False)
-                created_counts["parks"] += 1
-            except Exception as ex:
-                failures.append({"id": feature.get("id") or "park", "reason": str(ex)})
+    def _create_area_element(entry, label, floor_label, palette_key, floor_type_key, fallback_id):
+        feature, (rings, prepare_error) = entry
+        try:
+            if prepare_error is not None:
+                raise prepare_error
+            curve_loops = _rings_to_curve_loops(rings, base_elevation)
+            terrain_toposolid = state["terrain_toposolid"]
+            if terrain_enabled and terrain_toposolid is not None:
+                subdivision = _create_toposolid_subdivision(
+                    doc,
+                    terrain_toposolid,
+                    curve_loops,
+                    "Web Context Builder | {} subdivision | {}".format(label, feature.get("id")),
+                )
+                _apply_subdivision_offset_2026(doc, subdivision)
+                _apply_palette(doc, subdivision, state["palette"].get(palette_key))
+            else:
+                floor = _create_floor(
+                    doc,
+                    curve_loops,
+                    state[floor_type_key],
+                    base_level,
+                    "Web Context Builder | {} | {}".format(floor_label, feature.get("id")),
+                )
+                _apply_palette(doc, floor, state["palette"].get(palette_key), apply_view_override=False)
+            return True
+        except Exception as ex:
+            failures.append({"id": feature.get("id") or fallback_id, "reason": str(ex)})
+            return False
 
-        for feature in water_features:
-            try:
-                curve_loops = _feature_to_curve_loops(feature, center_lat, center_lon, base_elevation)
-                if terrain_enabled and terrain_toposolid is not None:
-                    water_subdivision = _create_toposolid_subdivision(
-                        doc,
-                        terrain_toposolid,
-                        curve_loops,
-                        "Web Context Builder | Water subdivision | {}".format(feature.get("id")),
-                    )
-                    _apply_subdivision_offset_2026(doc, water_subdivision)
-                    _apply_palette(doc, water_subdivision, palette.get("water"))
-                else:
-                    water_floor = _create_floor(
-                        doc,
-                        curve_loops,
-                        water_floor_type,
-                        base_level,
-                        "Web Context Builder | Water Area | {}".format(feature.get("id")),
-                    )
-                    _apply_palette(doc, water_floor, palette.get("water"), apply_view_override=False)
-                created_counts["water"] += 1
-            except Exception as ex:
-                failures.append({"id": feature.get("id") or "water", "reason": str(ex)})
+    road_batch = _project_and_buffer_ways(
+        roads,
+        center_lat,
+        center_lon,
+        lambda tags: None if context_classify.is_area_way(tags) else context_classify.road_width_m(tags),
+    )
+    track_batch = _project_and_buffer_ways(
+        tracks,
+        center_lat,
+        center_lon,
+        lambda tags: None if context_classify.is_area_way(tags) else context_classify.track_width_m(tags),
+    )
+    water_hole_index = context_classify.build_hole_index(water_features) if park_features and not terrain_enabled else None
+    waterway_batch = _project_and_buffer_ways(
+        [way for way in waterways if not context_classify.is_water_tag(way.get("tags") or {})],
+        center_lat,
+        center_lon,
+        context_classify.waterway_width_m,
+        area_allowed=False,
+    )
 
-        for way in waterways:
-            way_id = "way/{}".format(way.get("id"))
-            tags = way.get("tags") or {}
-            if _is_water_tag(tags):
-                continue
-            try:
-                projected = _project_way_points(way, center_lat, center_lon)
-                polygon = _polyline_to_buffer_polygon(projected, _waterway_width_m(tags))
-                curve_loops = _polygon_to_curve_loops(polygon, [], base_elevation) if polygon else None
-                if terrain_enabled and terrain_toposolid is not None:
-                    waterway_subdivision = _create_toposolid_subdivision(
-                        doc,
-                        terrain_toposolid,
-                        curve_loops,
-                        "Web Context Builder | Waterway subdivision | {}".format(way_id),
-                    )
-                    _apply_subdivision_offset_2026(doc, waterway_subdivision)
-                    _apply_palette(doc, waterway_subdivision, palette.get("water"))
-                else:
-                    waterway_floor = _create_floor(
-                        doc,
-                        curve_loops,
-                        water_floor_type,
-                        base_level,
-                        "Web Context Builder | Waterway | {}".format(way_id),
-                    )
-                    _apply_palette(doc, waterway_floor, palette.get("water"), apply_view_override=False)
-                created_counts["water"] += 1
-            except Exception as ex:
-                failures.append({"id": way_id, "reason": str(ex)})
+    # Prepare stage: everything that needs no Revit API runs up front on the worker pool,
+    # so the pipeline below only turns prepared rings into curve loops, solids and elements.
+    building_elevations = [_building_base_elevation(sampled_elevation) for sampled_elevation in building_base_elevations]
+    prepared_buildings = context_prepare.prepare_items(
+        lambda entry: _prepare_building_data(entry[0], center_lat, center_lon, entry[1]),
+        list(zip(building_features, building_elevations)),
+    )
+
+    def _area_rings(feature, water_holes):
+        extra_inner_rings = None
+        if water_holes:
+            extra_inner_rings = context_classify.collect_water_hole_rings_for_feature(feature, water_features, water_hole_index)
+        return context_prepare.feature_rings_xy(feature, center_lat, center_lon, extra_inner_rings)
 
-        transaction.Commit()
+    parcel_entries = list(zip(parcel_features, context_prepare.prepare_items(lambda feature: _area_rings(feature, False), parcel_features)))
+    park_entries = list(zip(park_features, context_prepare.prepare_items(lambda feature: _area_rings(feature, not terrain_enabled), park_features)))
+    water_entries = list(zip(water_features, context_prepare.prepare_items(lambda feature: _area_rings(feature, False), water_features)))
+
+    pipeline = context_pipeline.ChunkedPipeline(
+        context_pipeline.RevitTransactions(DB, doc, TITLE),
+        chunk_size=BUILD_CHUNK_SIZE,
+        failures=failures,
+    )
+    pipeline.add_layer("Materials", [None], _prepare_types)
+    if terrain_enabled:
+        pipeline.add_layer("Terrain", [None], _create_terrain, count_key="terrain")
+    building_entries = list(zip(building_features, prepared_buildings))
+    if building_output_mode == BUILDING_OUTPUT_MASS_FAMILY:
+        family_tiles = context_batching.group_by_tile(
+            building_entries,
+            lambda entry: entry[1][0]["anchor_xy"] if entry[1][0] else None,
+            MASS_FAMILY_TILE_SIZE_M,
+            max(1, len(building_entries)),
+        )
+        pipeline.add_layer("Buildings", list(enumerate(family_tiles, 1)), _create_building_family_tile, count_key="buildings")
+    elif len(building_entries) >= BUILDING_BULK_MIN_COUNT:
+        building_tiles = context_batching.group_by_tile(
+            building_entries,
+            lambda entry: entry[1][0]["anchor_xy"] if entry[1][0] else None,
+            BUILDING_BULK_TILE_SIZE_M,
+            BUILDING_BULK_MAX_PER_SHAPE,
+        )
+        pipeline.add_layer("Buildings", list(enumerate(building_tiles, 1)), _create_building_tile, count_key="buildings")
+    else:
+        pipeline.add_layer("Buildings", building_entries, _create_building, count_key="buildings")
+    pipeline.add_layer("Roads", road_batch, lambda entry: _create_way_element(entry, "Road", "roads", "road_floor_type", True), count_key="roads")
+    pipeline.add_layer("Tracks", track_batch, lambda entry: _create_way_element(entry, "Track", "tracks", "track_floor_type", True), count_key="tracks")
+    pipeline.add_layer("Parcels", parcel_entries, lambda entry: _create_area_element(entry, "Parcel", "Parcel", "parcels", "parcel_floor_type", "parcel"), count_key="parcels")
+    pipeline.add_layer("Parks", park_entries, lambda entry: _create_area_element(entry, "Park", "Park", "parks", "park_floor_type", "park"), count_key="parks")
+    pipeline.add_layer("Water", water_entries, lambda entry: _create_area_element(entry, "Water", "Water Area", "water", "water_floor_type", "water"), count_key="water")
+    pipeline.add_layer("Waterways", waterway_batch, lambda entry: _create_way_element(entry, "Waterway", "water", "water_floor_type", False), count_key="water")
+
+    progress_bar = _open_progress_bar()
+    try:
+        pipeline.run(progress_bar)
     except Exception as ex:
-        if started:
-            try:
-                transaction.RollBack()
-            except Exception:
-                pass
         UI.TaskDialog.Show(TITLE + " - Error", "{}\n\n{}".format(ex, traceback.format_exc()))
         return
+    finally:
+        _close_progress_bar(progress_bar)
+        if mass_family_limits is not None:
+            _save_mass_family_state(mass_family_limits, mass_family_manifest)
 
     ui.uiUtils_show_text_report(
         "{} - Results".format(TITLE),
-        _summarize_results(created_counts, failures),
+        _summarize_results(pipeline.created, failures, pipeline, terrain_grid),
         ok_text="Close",
         cancel_text=None,
         width=760,
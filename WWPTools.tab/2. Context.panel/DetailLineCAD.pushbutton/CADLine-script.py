@@ -23,6 +23,8 @@ from pyrevit import DB, revit, script
 clr.AddReference("RevitAPIUI")
 from Autodesk.Revit import UI
 
+import WWP_cadUtils as cadu
+
 
 def _load_uiutils():
     script_dir = os.path.dirname(__file__)
@@ -94,33 +96,6 @@ def _get_layer_names(import_instance):
     return []
 
 
-def _walk_geometry(geom_elem, transform):
-    for obj in geom_elem:
-        if isinstance(obj, DB.GeometryInstance):
-            next_t = transform.Multiply(obj.Transform) if transform else obj.Transform
-            if obj.SymbolGeometry is None:
-                continue
-            for sub in _walk_geometry(obj.SymbolGeometry, next_t):
-                yield sub
-        else:
-            yield obj, transform
-
-
-def _get_layer_name(doc, geom_obj):
-    if geom_obj is None:
-        return None
-    try:
-        gs_id = geom_obj.GraphicsStyleId
-    except Exception:
-        return None
-    if gs_id == DB.ElementId.InvalidElementId:
-        return None
-    gs = doc.GetElement(gs_id)
-    if isinstance(gs, DB.GraphicsStyle) and gs.GraphicsStyleCategory:
-        return gs.GraphicsStyleCategory.Name
-    return None
-
-
 def _polyline_to_lines(polyline, transform, tol):
     pts = list(polyline.GetCoordinates())
     if transform:
@@ -143,17 +118,12 @@ def _collect_curves_by_layer(doc, import_instance, selected_layers):
 
     geom = import_instance.get_Geometry(opts)
     if not geom:
-        return {}
+        return {}, {}
     curves_by_layer = defaultdict(list)
 
     tol = doc.Application.ShortCurveTolerance
-    for obj, transform in _walk_geometry(geom, None):
-        if obj is None:
-            continue
-        layer_name = _get_layer_name(doc, obj)
-        if not layer_name or layer_name not in selected_layers:
-            continue
-
+    walker = cadu.LayerWalker(doc, selected_layers)
+    for obj, transform, layer_name in walker.walk(geom):
         if isinstance(obj, DB.Curve):
             curve = obj.CreateTransformed(transform) if transform else obj
             if curve.Length >= tol:
@@ -163,7 +133,7 @@ def _collect_curves_by_layer(doc, import_instance, selected_layers):
                 if seg.Length >= tol:
                     curves_by_layer[layer_name].append(seg)
 
-    return curves_by_layer
+    return curves_by_layer, walker.stats
 
 
 def _unique_group_type_name(doc, base_name):
@@ -216,9 +186,9 @@ def main():
     if not layer_style_map:
         return
 
-    curves_by_layer = _collect_curves_by_layer(doc, import_instance, set(selected_layers))
+    curves_by_layer, walk_stats = _collect_curves_by_layer(doc, import_instance, set(selected_layers))
     if not curves_by_layer:
-        _show_alert("Detail Lines", "No curves found for the selected layers.", ui)
+        _show_alert("Detail Lines", "No curves found for the selected layers.\n" + cadu.walk_stats_text(walk_stats), ui)
         return
 
     created_counts = {}
@@ -266,7 +236,7 @@ def main():
                 ungrouped += 1
                 created_counts[layer_name] = 1
 
-    _report_results(created_counts, skipped, ungrouped, skipped_short)
+    _report_results(created_counts, skipped, ungrouped, skipped_short, walk_stats)
 
 
 def _show_alert(title, message, ui):
@@ -335,7 +305,7 @@ def _map_layers_to_styles(layers, style_names, ui):
     return mapping
 
 
-def _report_results(created_counts, skipped, ungrouped, skipped_short):
+def _report_results(created_counts, skipped, ungrouped, skipped_short, walk_stats):
     lines = ["Detail Lines from CAD"]
     for lname in sorted(created_counts.keys()):
         lines.append("- {}: {} detail lines".format(lname, created_counts[lname]))
@@ -345,6 +315,7 @@ def _report_results(created_counts, skipped, ungrouped, skipped_short):
         lines.append("- Ungrouped: {} detail lines (single or group error)".format(ungrouped))
     if skipped_short:
         lines.append("- Skipped (short): {} curves below tolerance".format(skipped_short))
+    lines.append("- " + cadu.walk_stats_text(walk_stats))
 
     try:
         out = script.get_output()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from pyrevit import DB
+
+
+def _elem_id_int(eid):
+    try:
+        return int(eid.Value)      # Revit 2024+
+    except AttributeError:
+        return int(eid.IntegerValue)  # Revit 2023-
+
+
+class LayerWalker(object):
+    """Single pass over CAD import geometry yielding (geometry, transform, layer)
+    for the selected layers.
+
+    Layer names are cached per GraphicsStyleId, and a block (its symbol
+    geometry plus the layer it is inserted on) that held nothing on a selected
+    layer is not walked again for later instances.
+    """
+
+    def __init__(self, doc, selected_layers):
+        self.doc = doc
+        self.selected_layers = set(selected_layers or [])
+        self.stats = {"visited": 0, "skipped": 0, "blocks_skipped": 0, "cache_hits": 0, "cache_misses": 0}
+        self._layer_names = {}
+        self._empty_blocks = set()
+
+    def _style_key(self, geom_obj):
+        try:
+            graphics_style_id = geom_obj.GraphicsStyleId
+        except Exception:
+            return None
+        if graphics_style_id is None or graphics_style_id == DB.ElementId.InvalidElementId:
+            return None
+        return _elem_id_int(graphics_style_id)
+
+    def layer_name(self, geom_obj):
+        style_key = self._style_key(geom_obj)
+        if style_key is None:
+            return None
+        if style_key in self._layer_names:
+            self.stats["cache_hits"] += 1
+            return self._layer_names[style_key]
+
+        self.stats["cache_misses"] += 1
+        layer_name = None
+        graphics_style = self.doc.GetElement(geom_obj.GraphicsStyleId)
+        if isinstance(graphics_style, DB.GraphicsStyle) and graphics_style.GraphicsStyleCategory:
+            layer_name = graphics_style.GraphicsStyleCategory.Name
+        self._layer_names[style_key] = layer_name
+        return layer_name
+
+    def _block_key(self, geom_instance):
+        try:
+            symbol_key = geom_instance.GetSymbolGeometryId().AsUniqueIdentifier()  # Revit 2023+
+        except Exception:
+            return None
+        return symbol_key, self._style_key(geom_instance)
+
+    def walk(self, geom_elem, transform=None):
+        for geom_obj in geom_elem:
+            if geom_obj is None:
+                continue
+            self.stats["visited"] += 1
+            if isinstance(geom_obj, DB.GeometryInstance):
+                for item in self._walk_instance(geom_obj, transform):
+                    yield item
+                continue
+
+            layer_name = self.layer_name(geom_obj)
+            if layer_name and layer_name in self.selected_layers:
+                yield geom_obj, transform, layer_name
+            else:
+                self.stats["skipped"] += 1
+
+    def _walk_instance(self, geom_instance, transform):
+        block_key = self._block_key(geom_instance)
+        if block_key is not None and block_key in self._empty_blocks:
+            self.stats["blocks_skipped"] += 1
+            return
+        symbol_geometry = geom_instance.SymbolGeometry
+        if symbol_geometry is None:
+            return
+
+        instance_transform = geom_instance.Transform
+        if instance_transform is None or instance_transform.IsIdentity:
+            next_transform = transform
+        else:
+            next_transform = transform.Multiply(instance_transform) if transform else instance_transform
+
+        found = False
+        for item in self.walk(symbol_geometry, next_transform):
+            found = True
+            yield item
+        if not found and block_key is not None:
+            self._empty_blocks.add(block_key)
+
+
+def walk_stats_text(walk_stats):
+    lookups = walk_stats.get("cache_hits", 0) + walk_stats.get("cache_misses", 0)
+    hit_rate = (100.0 * walk_stats.get("cache_hits", 0) / lookups) if lookups else 0.0
+    return "Geometry walk: {} visited | {} skipped | {} blocks skipped | layer cache hits {:.0f}%".format(
+        walk_stats.get("visited", 0),
+        walk_stats.get("skipped", 0),
+        walk_stats.get("blocks_skipped", 0),
+        hit_rate,
+    )
@@ -0,0 +1 @@
+"""Revit-free building blocks shared by the UK and Web context builders."""
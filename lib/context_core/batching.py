@@ -0,0 +1,202 @@
+import json
+import os
+
+
+DEFAULT_MAX_SOLIDS = 64
+DEFAULT_MAX_VERTICES = 24000
+DEFAULT_MAX_FILE_BYTES = 32 * 1024 * 1024
+DEFAULT_TARGET_LOAD_SEC = 4.0
+MIN_SOLIDS = 4
+MAX_SOLIDS = 400
+MIN_VERTICES = 500
+MAX_VERTICES = 200000
+INITIAL_BYTES_PER_VERTEX = 400.0
+SMOOTHING = 0.5
+MORTON_BITS = 16
+
+
+def _spread_bits(value):
+    value &= 0xFFFF
+    value = (value | (value << 8)) & 0x00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F
+    value = (value | (value << 2)) & 0x33333333
+    value = (value | (value << 1)) & 0x55555555
+    return value
+
+
+def spatial_order(items, anchor):
+    """Return items sorted along a Z-order curve of anchor(item) -> (x, y).
+
+    Consecutive runs of the result are spatially compact, so cutting it into
+    batches yields block-like clusters. Items without an anchor go last.
+    """
+    anchored = []
+    loose = []
+    for item in items or []:
+        point = anchor(item)
+        if point is None:
+            loose.append(item)
+        else:
+            anchored.append((float(point[0]), float(point[1]), item))
+    if not anchored:
+        return loose
+
+    min_x = min(entry[0] for entry in anchored)
+    min_y = min(entry[1] for entry in anchored)
+    span = max(max(entry[0] for entry in anchored) - min_x, max(entry[1] for entry in anchored) - min_y, 1e-9)
+    scale = ((1 << MORTON_BITS) - 1) / span
+
+    def _key(entry):
+        return _spread_bits(int((entry[0] - min_x) * scale)) | (_spread_bits(int((entry[1] - min_y) * scale)) << 1)
+
+    anchored.sort(key=_key)
+    return [entry[2] for entry in anchored] + loose
+
+
+def group_by_tile(items, anchor, tile_size, max_items):
+    """Group items into square tiles of anchor(item) -> (x, y), at most max_items per group.
+
+    Tiles come out in Z-order and items keep their Z-order inside a tile, so a
+    crowded tile splits into spatially compact runs. Items without an anchor
+    share trailing groups.
+    """
+    tile_size = float(tile_size)
+    max_items = max(1, int(max_items))
+    tiles = {}
+    tile_order = []
+    loose = []
+    for item in spatial_order(items, anchor):
+        point = anchor(item)
+        if point is None:
+            loose.append(item)
+            continue
+        tile = (int(point[0] // tile_size), int(point[1] // tile_size))
+        if tile not in tiles:
+            tiles[tile] = []
+            tile_order.append(tile)
+        tiles[tile].append(item)
+
+    groups = []
+    for members in [tiles[tile] for tile in tile_order] + [loose]:
+        for start in range(0, len(members), max_items):
+            groups.append(members[start:start + max_items])
+    return groups
+
+
+def split_even(items, group_count):
+    """Cut items into at most group_count consecutive runs whose sizes differ by at most one."""
+    items = list(items or [])
+    group_count = max(1, min(int(group_count), len(items)))
+    size, extra = divmod(len(items), group_count)
+    groups = []
+    start = 0
+    for index in range(group_count):
+        end = start + size + (1 if index < extra else 0)
+        if end > start:
+            groups.append(items[start:end])
+        start = end
+    return groups
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+class BatchLimits(object):
+    """Per-family solid, vertex and file-size budgets tuned from measured loads.
+
+    Each record() folds the seconds and bytes per vertex of a saved and loaded
+    family into running estimates, then resizes the vertex budget so the next
+    family should take about target_load_sec; the solid budget follows the
+    average vertices per solid seen so far.
+    """
+
+    def __init__(
+        self,
+        max_solids=DEFAULT_MAX_SOLIDS,
+        max_vertices=DEFAULT_MAX_VERTICES,
+        max_file_bytes=DEFAULT_MAX_FILE_BYTES,
+        target_load_sec=DEFAULT_TARGET_LOAD_SEC,
+        sec_per_vertex=None,
+        bytes_per_vertex=INITIAL_BYTES_PER_VERTEX,
+        vertices_per_solid=None,
+    ):
+        self.max_solids = int(max_solids)
+        self.max_vertices = int(max_vertices)
+        self.max_file_bytes = int(max_file_bytes)
+        self.target_load_sec = float(target_load_sec)
+        self.sec_per_vertex = sec_per_vertex
+        self.bytes_per_vertex = float(bytes_per_vertex)
+        self.vertices_per_solid = vertices_per_solid
+
+    def to_dict(self):
+        return {
+            "max_solids": self.max_solids,
+            "max_vertices": self.max_vertices,
+            "max_file_bytes": self.max_file_bytes,
+            "target_load_sec": self.target_load_sec,
+            "sec_per_vertex": self.sec_per_vertex,
+            "bytes_per_vertex": self.bytes_per_vertex,
+            "vertices_per_solid": self.vertices_per_solid,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        limits = cls()
+        for name in limits.to_dict():
+            if data.get(name) is not None:
+                setattr(limits, name, data[name])
+        return limits
+
+    def take(self, items, start, vertex_count):
+        """Index one past the last item of the batch starting at start."""
+        vertex_budget = min(self.max_vertices, self.max_file_bytes / max(self.bytes_per_vertex, 1.0))
+        end = start
+        vertices = 0
+        while end < len(items) and (end - start) < self.max_solids:
+            item_vertices = vertex_count(items[end])
+            if end > start and vertices + item_vertices > vertex_budget:
+                break
+            vertices += item_vertices
+            end += 1
+        return end
+
+    def record(self, solid_count, vertex_count, elapsed_sec, file_bytes=None):
+        if solid_count <= 0 or vertex_count <= 0:
+            return
+
+        def _blend(previous, sample):
+            return sample if previous is None else (previous * (1.0 - SMOOTHING)) + (sample * SMOOTHING)
+
+        self.sec_per_vertex = _blend(self.sec_per_vertex, max(float(elapsed_sec), 1e-6) / vertex_count)
+        self.vertices_per_solid = _blend(self.vertices_per_solid, float(vertex_count) / solid_count)
+        if file_bytes:
+            self.bytes_per_vertex = _blend(self.bytes_per_vertex, float(file_bytes) / vertex_count)
+
+        self.max_vertices = int(_clamp(self.target_load_sec / self.sec_per_vertex, MIN_VERTICES, MAX_VERTICES))
+        self.max_solids = int(_clamp(round(self.max_vertices / max(self.vertices_per_solid, 1.0)), MIN_SOLIDS, MAX_SOLIDS))
+
+
+def iter_batches(items, limits, vertex_count):
+    """Yield consecutive batches of items, reading limits afresh for each one.
+
+    Callers that record() into limits between batches get the adapted budget
+    for the next batch.
+    """
+    start = 0
+    while start < len(items):
+        end = limits.take(items, start, vertex_count)
+        yield items[start:end]
+        start = end
+
+
+def write_batch_index(family_path, family_name, entries):
+    """Write a JSON sidecar next to family_path listing the buildings it holds, in order."""
+    index_path = os.path.splitext(family_path)[0] + ".json"
+    try:
+        with open(index_path, "w") as index_file:
+            json.dump({"family_name": family_name, "buildings": entries}, index_file, indent=2, sort_keys=True)
+    except Exception:
+        return None
+    return index_path
@@ -0,0 +1,873 @@
+"""Time the Revit-free context pipeline stages on synthetic Overpass data.
+
+Run from the lib folder with plain CPython:
+
+    python -m context_core.bench --buildings 10000
+    python -m context_core.bench --rings
+    python -m context_core.bench --osm --buildings 50000
+    python -m context_core.bench --segments
+    python -m context_core.bench --segments cad-segments.json
+    python -m context_core.bench --mesh
+    python -m context_core.bench --holes
+    python -m context_core.bench --extract city.osm.pbf --lat 51.5074 --lon -0.1278 --radius 500
+"""
+import gc
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+from context_core import buffer, classify, extract, geometry, mesh, overpass, prepare, segments, spatial
+from context_core.rings import Feature
+
+ORIGIN_LAT = 51.5074
+ORIGIN_LON = -0.1278
+
+
+def _offset_latlon(origin_lat, origin_lon, x_m, y_m):
+    meters_per_degree_lat, meters_per_degree_lon = geometry.meters_per_degree(origin_lat)
+    return origin_lat + (y_m / meters_per_degree_lat), origin_lon + (x_m / meters_per_degree_lon)
+
+
+def _geometry(points):
+    return [{"lat": lat, "lon": lon} for lat, lon in points]
+
+
+def _box_ring(center_x, center_y, half_w, half_h, origin_lat, origin_lon, vertices=4):
+    ring = []
+    for index in range(vertices):
+        angle = (2.0 * math.pi * index) / float(vertices) + (math.pi / 4.0)
+        ring.append(_offset_latlon(
+            origin_lat,
+            origin_lon,
+            center_x + (math.cos(angle) * half_w * math.sqrt(2.0)),
+            center_y + (math.sin(angle) * half_h * math.sqrt(2.0)),
+        ))
+    ring.append(ring[0])
+    return ring
+
+
+def _split_ring(ring, parts, rng):
+    """Cut a closed ring into shuffled, partly reversed way segments."""
+    cut_count = max(1, min(parts, len(ring) - 1))
+    cuts = sorted(rng.sample(range(1, len(ring) - 1), cut_count - 1)) if cut_count > 1 else []
+    bounds = [0] + cuts + [len(ring) - 1]
+    segments = []
+    for index in range(len(bounds) - 1):
+        segment = ring[bounds[index]:bounds[index + 1] + 1]
+        if rng.random() < 0.5:
+            segment = list(reversed(segment))
+        segments.append(segment)
+    rng.shuffle(segments)
+    return segments
+
+
+def synthetic_overpass_elements(building_count=1000, road_count=200, relation_count=50, radius_m=500.0, seed=1):
+    """Return an Overpass-style element list with buildings, roads and multipolygons."""
+    rng = random.Random(seed)
+    elements = []
+    next_id = [1]
+
+    def _new_id():
+        next_id[0] += 1
+        return next_id[0]
+
+    for _ in range(building_count):
+        ring = _box_ring(
+            rng.uniform(-radius_m, radius_m),
+            rng.uniform(-radius_m, radius_m),
+            rng.uniform(4.0, 15.0),
+            rng.uniform(4.0, 15.0),
+            ORIGIN_LAT,
+            ORIGIN_LON,
+            vertices=rng.choice((4, 5, 6, 8, 12)),
+        )
+        tags = {"building": "yes"}
+        if rng.random() < 0.4:
+            tags["building:levels"] = str(rng.randint(1, 12))
+        elements.append({"type": "way", "id": _new_id(), "tags": tags, "geometry": _geometry(ring)})
+
+    for _ in range(road_count):
+        points = []
+        x_m = rng.uniform(-radius_m, radius_m)
+        y_m = rng.uniform(-radius_m, radius_m)
+        heading = rng.uniform(0.0, 2.0 * math.pi)
+        for _ in range(rng.randint(3, 20)):
+            points.append(_offset_latlon(ORIGIN_LAT, ORIGIN_LON, x_m, y_m))
+            heading += rng.uniform(-0.6, 0.6)
+            x_m += math.cos(heading) * rng.uniform(10.0, 40.0)
+            y_m += math.sin(heading) * rng.uniform(10.0, 40.0)
+        elements.append({
+            "type": "way",
+            "id": _new_id(),
+            "tags": {"highway": rng.choice(("residential", "primary", "service", "tertiary"))},
+            "geometry": _geometry(points),
+        })
+
+    for _ in range(relation_count):
+        center_x = rng.uniform(-radius_m, radius_m)
+        center_y = rng.uniform(-radius_m, radius_m)
+        outer = _box_ring(center_x, center_y, 40.0, 30.0, ORIGIN_LAT, ORIGIN_LON, vertices=rng.randint(24, 64))
+        inner = _box_ring(center_x, center_y, 10.0, 8.0, ORIGIN_LAT, ORIGIN_LON, vertices=8)
+        members = []
+        for role, ring, parts in (("outer", outer, rng.randint(2, 8)), ("inner", inner, 2)):
+            for segment in _split_ring(ring, parts, rng):
+                members.append({"type": "way", "ref": _new_id(), "role": role, "geometry": _geometry(segment)})
+        elements.append({
+            "type": "relation",
+            "id": _new_id(),
+            "tags": {"type": "multipolygon", "building": "yes"},
+            "members": members,
+        })
+
+    return elements
+
+
+def legacy_assemble_geometry_rings(members, role_name):
+    """Quadratic ring stitcher the builders used before the endpoint map."""
+    segments = geometry._member_segments(members, role_name)
+    point_key = geometry.point_key
+    rings = []
+    while segments:
+        chain = list(segments.pop(0))
+        progressed = True
+        while progressed and len(chain) >= 2 and point_key(chain[0]) != point_key(chain[-1]):
+            progressed = False
+            for index, candidate in enumerate(segments):
+                candidate_start = point_key(candidate[0])
+                candidate_end = point_key(candidate[-1])
+                chain_start = point_key(chain[0])
+                chain_end = point_key(chain[-1])
+
+                if chain_end == candidate_start:
+                    chain.extend(candidate[1:])
+                elif chain_end == candidate_end:
+                    chain.extend(list(reversed(candidate[:-1])))
+                elif chain_start == candidate_end:
+                    chain = candidate[:-1] + chain
+                elif chain_start == candidate_start:
+                    chain = list(reversed(candidate[1:])) + chain
+                else:
+                    continue
+
+                segments.pop(index)
+                progressed = True
+                break
+
+        chain = geometry.close_ring(chain)
+        unique_points = {point_key(point) for point in chain[:-1]} if len(chain) > 1 else set()
+        if len(chain) >= 4 and len(unique_points) >= 3:
+            rings.append(chain)
+
+    return rings
+
+
+def synthetic_relation_members(rng, outer_count=1, segments_per_ring=8, vertices_per_ring=64, extras=True):
+    """Multipolygon members with split, reversed and shuffled ways.
+
+    With extras, also mixes in what real relations carry: an already closed
+    way, a duplicated member, a dangling open chain, a junction shared by
+    three ways and a non-way member.
+    """
+    members = []
+    for ring_index in range(outer_count):
+        center_x = ring_index * 200.0
+        outer = _box_ring(center_x, 0.0, 60.0, 45.0, ORIGIN_LAT, ORIGIN_LON, vertices=vertices_per_ring)
+        inner = _box_ring(center_x, 0.0, 12.0, 9.0, ORIGIN_LAT, ORIGIN_LON, vertices=max(4, vertices_per_ring // 8))
+        for role, ring, parts in (("outer", outer, segments_per_ring), ("inner", inner, max(1, segments_per_ring // 4))):
+            for segment in _split_ring(ring, parts, rng):
+                members.append({"type": "way", "ref": rng.randint(1, 10 ** 9), "role": role, "geometry": _geometry(segment)})
+
+    if extras:
+        closed = _box_ring(-300.0, 0.0, 10.0, 10.0, ORIGIN_LAT, ORIGIN_LON, vertices=6)
+        members.append({"type": "way", "ref": 1, "role": "outer", "geometry": _geometry(closed)})
+        if members:
+            members.append(dict(rng.choice(members)))
+        dangling = [_offset_latlon(ORIGIN_LAT, ORIGIN_LON, -500.0 + (step * 7.0), 50.0) for step in range(5)]
+        members.append({"type": "way", "ref": 2, "role": "", "geometry": _geometry(dangling)})
+        hub = _offset_latlon(ORIGIN_LAT, ORIGIN_LON, 0.0, -400.0)
+        for branch in range(3):
+            tip = _offset_latlon(ORIGIN_LAT, ORIGIN_LON, branch * 15.0, -430.0)
+            members.append({"type": "way", "ref": 3 + branch, "role": "outer", "geometry": _geometry([hub, tip])})
+        members.append({"type": "node", "ref": 9, "role": "label"})
+    rng.shuffle(members)
+    return members
+
+
+def ring_assembly_corpus(relation_count=300, seed=1):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(relation_count):
+        corpus.append(synthetic_relation_members(
+            rng,
+            outer_count=rng.randint(1, 4),
+            segments_per_ring=rng.randint(1, 24),
+            vertices_per_ring=rng.randint(8, 128),
+            extras=rng.random() < 0.5,
+        ))
+    return corpus
+
+
+def run_ring_benchmark(member_counts=(50, 200, 800), relation_count=300, seed=1):
+    """Check both stitchers agree on the corpus, then time them on large relations."""
+    mismatches = 0
+    for members in ring_assembly_corpus(relation_count, seed):
+        for role_name in ("outer", "inner"):
+            if geometry.assemble_geometry_rings(members, role_name) != legacy_assemble_geometry_rings(members, role_name):
+                mismatches += 1
+
+    rng = random.Random(seed)
+    timings = []
+    for member_count in member_counts:
+        members = synthetic_relation_members(rng, outer_count=4, segments_per_ring=member_count // 4, vertices_per_ring=member_count * 4, extras=False)
+        started = time.time()
+        legacy_assemble_geometry_rings(members, "outer")
+        legacy_elapsed = time.time() - started
+        started = time.time()
+        geometry.assemble_geometry_rings(members, "outer")
+        timings.append((member_count, legacy_elapsed, time.time() - started))
+    return mismatches, timings
+
+
+def _time_stage(results, name, func, repeat):
+    best = None
+    value = None
+    for _ in range(max(1, repeat)):
+        # Like timeit, keep collector pauses from earlier fixtures out of the timings.
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.time()
+            value = func()
+            elapsed = time.time() - started
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    results.append((name, best))
+    return value
+
+
+def run_pipeline_benchmark(elements, repeat=3):
+    results = []
+    response_text = json.dumps({"version": 0.6, "elements": elements})
+    chunk_size = 65536
+
+    def _stream_layers():
+        layers = overpass.OverpassLayers({"buildings": True, "roads": True})
+        chunks = (response_text[index:index + chunk_size] for index in range(0, len(response_text), chunk_size))
+        for element in overpass.iter_overpass_elements(chunks):
+            layers.add(element)
+        return layers
+
+    _time_stage(results, "stream + filter", _stream_layers, repeat)
+    ways, relations, roads, _, _ = _time_stage(
+        results, "collect", lambda: classify.collect_elements(elements), repeat
+    )
+    features = _time_stage(
+        results, "classify buildings", lambda: classify.build_area_features(ways, relations, classify.is_building_tag), repeat
+    )
+    projected = _time_stage(
+        results,
+        "project rings",
+        lambda: [geometry.project_ring(feature["outer"], ORIGIN_LAT, ORIGIN_LON) for feature in features],
+        repeat,
+    )
+    _time_stage(
+        results,
+        "orient rings",
+        lambda: [geometry.orient_ring(geometry.remove_duplicate_xy(ring, 0.01), False) for ring in projected],
+        repeat,
+    )
+    _time_stage(
+        results,
+        "prepare rings",
+        lambda: prepare.prepare_items(lambda feature: prepare.feature_rings_xy(feature, ORIGIN_LAT, ORIGIN_LON), features),
+        repeat,
+    )
+    holes = features[::4]
+    hole_index = _time_stage(results, "index holes", lambda: classify.build_hole_index(holes), repeat)
+    _time_stage(
+        results,
+        "collect holes",
+        lambda: [classify.collect_water_hole_rings_for_feature(feature, holes, hole_index) for feature in features],
+        repeat,
+    )
+    _time_stage(
+        results,
+        "buffer roads",
+        lambda: [
+            buffer.polyline_to_buffer_polygon(
+                geometry.project_way_points(way, ORIGIN_LAT, ORIGIN_LON),
+                classify.road_width_m(way.get("tags") or {}),
+            )
+            for way in roads
+        ],
+        repeat,
+    )
+    projected_roads = _time_stage(results, "project roads batch", lambda: geometry.project_ways(roads, ORIGIN_LAT, ORIGIN_LON), repeat)
+    _time_stage(
+        results,
+        "buffer roads batch",
+        lambda: buffer.polylines_to_buffer_polygons(projected_roads, [classify.road_width_m(way.get("tags") or {}) for way in roads]),
+        repeat,
+    )
+    return results, len(features)
+
+
+def _retained_bytes(build):
+    """Return build() and the bytes it still holds, or None where tracemalloc is missing."""
+    try:
+        import tracemalloc
+    except ImportError:
+        return build(), None
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        value = build()
+        return value, tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def run_feature_storage_benchmark(elements, repeat=3):
+    """Compare list-of-tuple feature dicts with Feature/Ring storage for memory and ring prep time."""
+    ways, relations, _, _, _ = classify.collect_elements(elements)
+    features = classify.build_area_features(ways, relations, classify.is_building_tag)
+
+    # Both layouts are rebuilt from the classified rings so neither shares point objects with the fixture.
+    legacy_features, legacy_bytes = _retained_bytes(lambda: [
+        {"id": feature.id, "tags": feature.tags, "outer": feature.outer.points(), "inners": [inner.points() for inner in feature.inners]}
+        for feature in features
+    ])
+    ring_features, ring_bytes = _retained_bytes(lambda: [
+        Feature(feature.id, feature.tags, feature.outer.copy(), [inner.copy() for inner in feature.inners])
+        for feature in features
+    ])
+
+    results = []
+    _time_stage(
+        results,
+        "lists",
+        lambda: [
+            geometry.orient_ring(geometry.remove_duplicate_xy(geometry.project_ring(feature["outer"], ORIGIN_LAT, ORIGIN_LON), 0.01), False)
+            for feature in legacy_features
+        ],
+        repeat,
+    )
+    _time_stage(
+        results,
+        "rings",
+        lambda: [feature.outer.projected(ORIGIN_LAT, ORIGIN_LON).remove_duplicates(0.01).orient(False) for feature in ring_features],
+        repeat,
+    )
+    return len(features), (legacy_bytes, ring_bytes), results
+
+
+def run_extract_benchmark(path, lat, lon, radius_m, repeat=3):
+    """Time loading a local extract and return (results, Overpass-shaped elements) for the pipeline stages."""
+    results = []
+    selected_layers = {"buildings": True, "roads": True}
+    _time_stage(results, "load extract", lambda: extract.load_extract_layers(path, lat, lon, radius_m, selected_layers), repeat)
+    layers = overpass.OverpassLayers(selected_layers)
+    near_bounds = geometry.calculate_square_bounds(lat, lon, radius_m + extract.DEFAULT_NODE_MARGIN_M)
+    elements = list(extract.iter_extract_elements(path, near_bounds, layers.is_selected_area))
+    return results, elements
+
+
+def write_synthetic_osm(path, building_count=50000, complex_count=50, seed=1):
+    """Write an .osm extract of building ways plus large building multipolygons.
+
+    Each complex is a building relation with 20-150 outers, one inner per
+    outer, every ring cut into shuffled, partly reversed member ways.
+    """
+    rng = random.Random(seed)
+    counters = {"node": 0, "way": 0, "relation": 0}
+    node_lines = []
+    way_lines = []
+    relation_lines = []
+
+    def _next_id(kind):
+        counters[kind] += 1
+        return counters[kind]
+
+    def _ring_refs(ring):
+        refs = []
+        for lat, lon in ring[:-1]:
+            node_id = _next_id("node")
+            node_lines.append('<node id="{}" lat="{:.7f}" lon="{:.7f}"/>'.format(node_id, lat, lon))
+            refs.append(node_id)
+        return refs + [refs[0]]
+
+    def _way(refs, tags):
+        way_id = _next_id("way")
+        tag_text = "".join('<tag k="{}" v="{}"/>'.format(key, value) for key, value in sorted(tags.items()))
+        way_lines.append('<way id="{}">{}{}</way>'.format(way_id, "".join('<nd ref="{}"/>'.format(ref) for ref in refs), tag_text))
+        return way_id
+
+    side = int(math.ceil(math.sqrt(max(1, building_count))))
+    for index in range(building_count):
+        center_x = (index % side) * 25.0
+        center_y = (index // side) * 25.0
+        ring = _box_ring(center_x, center_y, 8.0, 6.0, ORIGIN_LAT, ORIGIN_LON, vertices=rng.choice((4, 5, 6, 8)))
+        _way(_ring_refs(ring), {"building": "yes"})
+
+    for complex_index in range(complex_count):
+        members = []
+        base_y = -2000.0 - (complex_index * 400.0)
+        for outer_index in range(rng.randint(20, 150)):
+            center_x = outer_index * 40.0
+            outer = _box_ring(center_x, base_y, 15.0, 12.0, ORIGIN_LAT, ORIGIN_LON, vertices=16)
+            inner = _box_ring(center_x, base_y, 5.0, 4.0, ORIGIN_LAT, ORIGIN_LON, vertices=6)
+            for role, ring, parts in (("outer", outer, rng.randint(2, 4)), ("inner", inner, 1)):
+                for segment in _split_ring(_ring_refs(ring), parts, rng):
+                    members.append((_way(segment, {}), role))
+        rng.shuffle(members)
+        member_text = "".join('<member type="way" ref="{}" role="{}"/>'.format(ref, role) for ref, role in members)
+        relation_lines.append('<relation id="{}">{}<tag k="building" v="yes"/><tag k="type" v="multipolygon"/></relation>'.format(_next_id("relation"), member_text))
+
+    with open(path, "w") as handle:
+        handle.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+        for lines in (node_lines, way_lines, relation_lines):
+            handle.write("\n".join(lines))
+            handle.write("\n")
+        handle.write("</osm>\n")
+    return counters
+
+
+def legacy_stitch_refs(segments):
+    """List-scan node ref stitcher the Building Importer used before the endpoint map."""
+    segments = [list(refs) for refs in segments]
+    rings = []
+    while segments:
+        chain = segments.pop(0)
+        progressed = True
+        while progressed and chain and chain[0] != chain[-1]:
+            progressed = False
+            for index, refs in enumerate(segments):
+                if chain[-1] == refs[0]:
+                    chain.extend(refs[1:])
+                elif chain[-1] == refs[-1]:
+                    chain.extend(list(reversed(refs[:-1])))
+                elif chain[0] == refs[-1]:
+                    chain = refs[:-1] + chain
+                elif chain[0] == refs[0]:
+                    chain = list(reversed(refs[1:])) + chain
+                else:
+                    continue
+                segments.pop(index)
+                progressed = True
+                break
+
+        if chain and chain[0] == chain[-1] and len(set(chain[:-1])) >= 3:
+            rings.append(chain)
+    return rings
+
+
+def stitch_refs(segments):
+    chains = geometry.stitch_segments(segments, [(refs[0], refs[-1]) for refs in segments])
+    return [chain for chain in chains if chain[0] == chain[-1] and len(set(chain[:-1])) >= 3]
+
+
+def _assign_inners_linear(outers, inners):
+    return [[inner for inner in inners if geometry.point_in_ring_xy(inner[0], outer)] for outer in outers]
+
+
+def _assign_inners_indexed(outers, inners):
+    assigned = [[] for _ in outers]
+    outer_index = spatial.BoxGridIndex([geometry.ring_bounds(outer) + (position,) for position, outer in enumerate(outers)])
+    for inner in inners:
+        for position in outer_index.query_point(inner[0][0], inner[0][1]):
+            if geometry.point_in_ring_xy(inner[0], outers[position]):
+                assigned[position].append(inner)
+    return assigned
+
+
+def run_osm_import_benchmark(building_count=50000, seed=1, repeat=3):
+    """Time the Building Importer's parse, relation stitching and inner assignment on a synthetic extract.
+
+    Returns (mismatches between legacy and indexed results, element counts, results).
+    """
+    handle, path = tempfile.mkstemp(suffix=".osm")
+    os.close(handle)
+    try:
+        counts = write_synthetic_osm(path, building_count, seed=seed)
+        results = []
+
+        def _parse():
+            nodes = extract.NodeStore()
+            ways = {}
+            relations = []
+            for record in extract.iter_osm_xml(path):
+                if record[0] == "node":
+                    nodes.add(record[1], record[2], record[3])
+                elif record[0] == "way":
+                    ways[record[1]] = record[4]
+                elif record[0] == "relation":
+                    relations.append(record)
+            return nodes, ways, relations
+
+        nodes, ways, relations = _time_stage(results, "parse osm", _parse, repeat)
+        segment_sets = []
+        for relation in relations:
+            for inner_role in (False, True):
+                segment_sets.append([
+                    ways[ref] for member_type, ref, role in relation[4] if member_type == "way" and (role == "inner") == inner_role and ref in ways
+                ])
+
+        legacy = _time_stage(results, "stitch legacy", lambda: [legacy_stitch_refs(segments) for segments in segment_sets], repeat)
+        stitched = _time_stage(results, "stitch endpoint map", lambda: [stitch_refs(segments) for segments in segment_sets], repeat)
+        mismatches = sum(1 for legacy_rings, rings in zip(legacy, stitched) if legacy_rings != rings)
+
+        def _project(rings):
+            return [[geometry.project_latlon(lat, lon, ORIGIN_LAT, ORIGIN_LON) for lat, lon in (nodes.get(ref) for ref in ring)] for ring in rings]
+
+        pairs = [(_project(stitched[index]), _project(stitched[index + 1])) for index in range(0, len(stitched), 2)]
+        linear = _time_stage(results, "assign inners linear", lambda: [_assign_inners_linear(outers, inners) for outers, inners in pairs], repeat)
+        indexed = _time_stage(results, "assign inners index", lambda: [_assign_inners_indexed(outers, inners) for outers, inners in pairs], repeat)
+        mismatches += sum(1 for linear_inners, indexed_inners in zip(linear, indexed) if linear_inners != indexed_inners)
+        return mismatches, counts, results
+    finally:
+        os.remove(path)
+
+
+def _water_holes_linear(feature, hole_features):
+    feature_outer = feature.get("outer") or []
+    feature_inners = feature.get("inners") or []
+    accepted = []
+    for hole_feature in hole_features:
+        hole_outer = hole_feature.get("outer") or []
+        centroid = geometry.latlon_ring_centroid(hole_outer)
+        if centroid is None or not geometry.point_in_ring_latlon(centroid, feature_outer):
+            continue
+        if any(geometry.point_in_ring_latlon(centroid, ring) for ring in list(feature_inners) + accepted):
+            continue
+        accepted.append(hole_outer)
+    return accepted
+
+
+def water_hole_cases(hole_count=2000, seed=1):
+    """(name, park features, water features) for a single hole, collinear holes and scattered holes."""
+    rng = random.Random(seed)
+    parks = [{"outer": _box_ring(0.0, 0.0, 400.0, 400.0, ORIGIN_LAT, ORIGIN_LON)}]
+    parks.extend({"outer": _box_ring(rng.uniform(-800.0, 800.0), rng.uniform(-800.0, 800.0), 60.0, 60.0, ORIGIN_LAT, ORIGIN_LON)} for _ in range(50))
+
+    def _hole(x, y):
+        return {"outer": _box_ring(x, y, 5.0, 5.0, ORIGIN_LAT, ORIGIN_LON)}
+
+    return [
+        ("single hole", parks, [_hole(10.0, 10.0)]),
+        ("collinear holes", parks, [_hole(-700.0 + (1400.0 * index / float(hole_count)), 25.0) for index in range(hole_count)]),
+        ("scattered holes", parks, [_hole(rng.uniform(-900.0, 900.0), rng.uniform(-900.0, 900.0)) for _ in range(hole_count)]),
+    ]
+
+
+def run_water_hole_benchmark(hole_count=2000, seed=1, repeat=3):
+    """Time water hole matching against a linear scan, including the degenerate single and collinear cases.
+
+    Returns (mismatches, results).
+    """
+    results = []
+    mismatches = 0
+    for name, parks, holes in water_hole_cases(hole_count, seed):
+        linear = _time_stage(results, "{} linear".format(name), lambda: [_water_holes_linear(park, holes) for park in parks], repeat)
+
+        def _indexed():
+            hole_index = classify.build_hole_index(holes)
+            return [classify.collect_water_hole_rings_for_feature(park, holes, hole_index) for park in parks]
+
+        indexed = _time_stage(results, "{} index".format(name), _indexed, repeat)
+        mismatches += sum(1 for linear_holes, indexed_holes in zip(linear, indexed) if linear_holes != indexed_holes)
+    return mismatches, results
+
+
+def _segment_key(point, tolerance):
+    return int(round(point[0] / tolerance)), int(round(point[1] / tolerance)), int(round(point[2] / tolerance))
+
+
+def _segment_distance(point_a, point_b):
+    return math.sqrt(sum((a - b) ** 2 for a, b in zip(point_a, point_b)))
+
+
+def legacy_segment_rings(segment_list, tolerance):
+    """CAD Builder's previous chain-following ring builder, on (x, y, z) tuples."""
+    unique_segments = []
+    seen_keys = set()
+    for start_point, end_point in segment_list:
+        start_key = _segment_key(start_point, tolerance)
+        end_key = _segment_key(end_point, tolerance)
+        if _segment_distance(start_point, end_point) <= tolerance or start_key == end_key:
+            continue
+        segment_key = tuple(sorted((start_key, end_key)))
+        if segment_key in seen_keys:
+            continue
+        seen_keys.add(segment_key)
+        unique_segments.append((start_point, end_point))
+
+    adjacency = {}
+    for index, (start_point, end_point) in enumerate(unique_segments):
+        adjacency.setdefault(_segment_key(start_point, tolerance), []).append((index, True))
+        adjacency.setdefault(_segment_key(end_point, tolerance), []).append((index, False))
+
+    used = [False] * len(unique_segments)
+    rings = []
+    discarded = 0
+    for index, (start_point, end_point) in enumerate(unique_segments):
+        if used[index]:
+            continue
+        used[index] = True
+        chain = [start_point, end_point]
+        while True:
+            if len(chain) >= 4 and _segment_key(chain[-1], tolerance) == _segment_key(chain[0], tolerance):
+                rings.append(chain)
+                break
+            current_key = _segment_key(chain[-1], tolerance)
+            previous_key = _segment_key(chain[-2], tolerance)
+            forward_choice = None
+            fallback_choice = None
+            for candidate_index, use_start in adjacency.get(current_key, []):
+                if used[candidate_index]:
+                    continue
+                next_point = unique_segments[candidate_index][1 if use_start else 0]
+                if _segment_key(next_point, tolerance) == previous_key:
+                    fallback_choice = fallback_choice or (candidate_index, next_point)
+                    continue
+                forward_choice = (candidate_index, next_point)
+                break
+            chosen = forward_choice or fallback_choice
+            if chosen is None:
+                discarded += 1
+                break
+            used[chosen[0]] = True
+            chain.append(chosen[1])
+    return rings, discarded
+
+
+def synthetic_cad_segments(block_count=400, parcels_per_side=3, seed=1, tolerance=0.01):
+    """Loose CAD linework: city blocks split into parcels that share edges, drawn one segment per
+    parcel side with endpoints jittered inside tolerance, plus stray open lines.
+
+    Returns (segments, expected ring count).
+    """
+    rng = random.Random(seed)
+    jitter = tolerance * 0.3
+    side = int(math.ceil(math.sqrt(block_count)))
+    block_size = 60.0
+    parcel_size = block_size / float(parcels_per_side)
+    segment_list = []
+
+    def _point(x_value, y_value):
+        return (x_value + rng.uniform(-jitter, jitter), y_value + rng.uniform(-jitter, jitter), 0.0)
+
+    for block_index in range(block_count):
+        origin_x = (block_index % side) * (block_size + 20.0)
+        origin_y = (block_index // side) * (block_size + 20.0)
+        for column in range(parcels_per_side):
+            for row in range(parcels_per_side):
+                x_value = origin_x + (column * parcel_size)
+                y_value = origin_y + (row * parcel_size)
+                corners = [(x_value, y_value), (x_value + parcel_size, y_value), (x_value + parcel_size, y_value + parcel_size), (x_value, y_value + parcel_size)]
+                for index in range(4):
+                    start = corners[index]
+                    end = corners[(index + 1) % 4]
+                    if rng.random() < 0.5:
+                        start, end = end, start
+                    segment_list.append((_point(*start), _point(*end)))
+        stray_x = origin_x + rng.uniform(0.0, block_size)
+        segment_list.append((_point(stray_x, origin_y - 5.0), _point(stray_x, origin_y - 15.0)))
+    rng.shuffle(segment_list)
+    return segment_list, block_count * parcels_per_side * parcels_per_side
+
+
+def run_segment_benchmark(path=None, block_count=400, seed=1, repeat=3):
+    """Time legacy chain following against planar_rings on a segment fixture or synthetic linework.
+
+    Returns (rows of (layer, segment count, legacy rings, planar rings, expected or None), results).
+    """
+    if path:
+        segments_by_layer, tolerance = segments.read_segment_fixture(path)
+        expected = None
+    else:
+        tolerance = 0.01
+        synthetic, expected = synthetic_cad_segments(block_count, seed=seed, tolerance=tolerance)
+        segments_by_layer = {"synthetic": synthetic}
+
+    results = []
+    legacy = _time_stage(results, "legacy chains", lambda: dict((name, legacy_segment_rings(items, tolerance)) for name, items in segments_by_layer.items()), repeat)
+    planar = _time_stage(results, "planar faces", lambda: dict((name, segments.planar_rings(items, tolerance)) for name, items in segments_by_layer.items()), repeat)
+    rows = []
+    for name in sorted(segments_by_layer):
+        rows.append((name, len(segments_by_layer[name]), len(legacy[name][0]), len(planar[name][0]), expected, planar[name][1]))
+    return rows, results
+
+
+def synthetic_mesh(box_count=200, subdivisions=4, cylinder_sides=24, seed=1, jitter=1e-5):
+    """An unwelded triangle soup of subdivided boxes and cylinders, like an imported mesh.
+
+    Every triangle has its own three points, jittered by less than the weld
+    tolerance. Returns (points, triangles, expected faces after merging).
+    """
+    rng = random.Random(seed)
+    points = []
+    triangles = []
+
+    def _triangle(a, b, c):
+        start = len(points)
+        for point in (a, b, c):
+            points.append(tuple(value + rng.uniform(-jitter, jitter) for value in point))
+        triangles.append((start, start + 1, start + 2))
+
+    def _quad(a, b, c, d):
+        _triangle(a, b, c)
+        _triangle(a, c, d)
+
+    def _grid(origin, u_axis, v_axis):
+        for row in range(subdivisions):
+            for column in range(subdivisions):
+                corners = []
+                for du, dv in ((0, 0), (1, 0), (1, 1), (0, 1)):
+                    u_value = (column + du) / float(subdivisions)
+                    v_value = (row + dv) / float(subdivisions)
+                    corners.append(tuple(origin[axis] + (u_axis[axis] * u_value) + (v_axis[axis] * v_value) for axis in range(3)))
+                _quad(*corners)
+
+    expected = 0
+    for index in range(box_count):
+        x, y = rng.uniform(0.0, 1000.0), rng.uniform(0.0, 1000.0)
+        w, d, h = rng.uniform(5.0, 30.0), rng.uniform(5.0, 30.0), rng.uniform(3.0, 60.0)
+        if index % 10:
+            _grid((x, y, 0.0), (0.0, d, 0.0), (w, 0.0, 0.0))
+            _grid((x, y, h), (w, 0.0, 0.0), (0.0, d, 0.0))
+            _grid((x, y, 0.0), (w, 0.0, 0.0), (0.0, 0.0, h))
+            _grid((x + w, y, 0.0), (0.0, d, 0.0), (0.0, 0.0, h))
+            _grid((x + w, y + d, 0.0), (-w, 0.0, 0.0), (0.0, 0.0, h))
+            _grid((x, y + d, 0.0), (0.0, -d, 0.0), (0.0, 0.0, h))
+            expected += 6
+            continue
+
+        radius = w / 2.0
+        ring = [(x + (radius * math.cos(2.0 * math.pi * side / cylinder_sides)), y + (radius * math.sin(2.0 * math.pi * side / cylinder_sides))) for side in range(cylinder_sides)]
+        for side in range(cylinder_sides):
+            (ax, ay), (bx, by) = ring[side], ring[(side + 1) % cylinder_sides]
+            _quad((ax, ay, 0.0), (bx, by, 0.0), (bx, by, h), (ax, ay, h))
+            _triangle((x, y, 0.0), (bx, by, 0.0), (ax, ay, 0.0))
+            _triangle((x, y, h), (ax, ay, h), (bx, by, h))
+        expected += cylinder_sides + 2
+    return points, triangles, expected
+
+
+def run_mesh_benchmark(box_count=200, seed=1, repeat=3):
+    """Time vertex welding and coplanar merging; returns (stats, expected faces, results)."""
+    points, triangles, expected = synthetic_mesh(box_count, seed=seed)
+    results = []
+    vertices, welded, _ = _time_stage(results, "weld vertices", lambda: mesh.weld_triangles(points, triangles), repeat)
+    _time_stage(results, "merge coplanar", lambda: mesh.merge_coplanar(vertices, welded), repeat)
+    _, _, stats = mesh.weld_and_merge(points, triangles)
+    return stats, expected, results
+
+
+def _main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="context_core.bench", description="Benchmark the context builder pipeline without Revit.")
+    parser.add_argument("--buildings", type=int, default=10000)
+    parser.add_argument("--roads", type=int, default=1000)
+    parser.add_argument("--relations", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rings", action="store_true", help="Compare ring assembly against the legacy stitcher.")
+    parser.add_argument("--storage", action="store_true", help="Compare feature dicts with Feature/Ring storage.")
+    parser.add_argument("--osm", action="store_true", help="Time Building Importer parsing and relation assembly on a synthetic .osm extract.")
+    parser.add_argument("--segments", nargs="?", const="", help="Compare CAD ring building on a segment fixture exported by CAD Builder, or on synthetic linework.")
+    parser.add_argument("--mesh", action="store_true", help="Time DirectShape To Mass vertex welding and coplanar face merging on a synthetic triangle soup.")
+    parser.add_argument("--holes", action="store_true", help="Compare indexed water hole matching with a linear scan, including single and collinear holes.")
+    parser.add_argument("--extract", help="Run the pipeline on a local .osm, .osm.pbf or GeoJSON extract instead of synthetic data.")
+    parser.add_argument("--lat", type=float, default=ORIGIN_LAT)
+    parser.add_argument("--lon", type=float, default=ORIGIN_LON)
+    parser.add_argument("--radius", type=float, default=500.0)
+    args = parser.parse_args(argv)
+
+    if args.rings:
+        mismatches, timings = run_ring_benchmark(seed=args.seed)
+        print("Ring corpus mismatches: {}".format(mismatches))
+        for member_count, legacy_elapsed, elapsed in timings:
+            print("{:>5} members  legacy {:9.2f} ms  endpoint map {:9.2f} ms  ({:.1f}x)".format(
+                member_count,
+                legacy_elapsed * 1000.0,
+                elapsed * 1000.0,
+                legacy_elapsed / max(elapsed, 1e-9),
+            ))
+        return 1 if mismatches else 0
+
+    if args.osm:
+        mismatches, counts, results = run_osm_import_benchmark(args.buildings, args.seed, args.repeat)
+        print("{} nodes, {} ways, {} relations, {} mismatches".format(counts["node"], counts["way"], counts["relation"], mismatches))
+        for name, elapsed in results:
+            print("{:<22} {:9.2f} ms".format(name, elapsed * 1000.0))
+        return 1 if mismatches else 0
+
+    if args.segments is not None:
+        rows, results = run_segment_benchmark(args.segments or None, max(1, args.buildings // 25), args.seed, args.repeat)
+        for name, segment_count, legacy_count, planar_count, expected, stats in rows:
+            print("{}: {} segments, legacy {} rings, planar {} rings{} ({} snapped, {} duplicates, {} dangling)".format(
+                name,
+                segment_count,
+                legacy_count,
+                planar_count,
+                "" if expected is None else " of {}".format(expected),
+                stats["snapped"],
+                stats["duplicates"],
+                stats["dangling"],
+            ))
+        for name, elapsed in results:
+            print("{:<14} {:9.2f} ms".format(name, elapsed * 1000.0))
+        return 1 if any(expected is not None and planar_count != expected for _, _, _, planar_count, expected, _ in rows) else 0
+
+    if args.mesh:
+        stats, expected, results = run_mesh_benchmark(max(1, args.buildings // 50), args.seed, args.repeat)
+        print("{} points -> {} vertices, {} triangles -> {} faces of {} expected ({:.1f}% fewer faces, {} patches left as triangles)".format(
+            stats["points"],
+            stats["vertices"],
+            stats["input_triangles"],
+            stats["faces"],
+            expected,
+            100.0 * (1.0 - (stats["faces"] / float(max(stats["input_triangles"], 1)))),
+            stats["unmerged_patches"],
+        ))
+        for name, elapsed in results:
+            print("{:<14} {:9.2f} ms".format(name, elapsed * 1000.0))
+        return 0 if stats["faces"] == expected else 1
+
+    if args.holes:
+        mismatches, results = run_water_hole_benchmark(max(1, args.buildings // 5), args.seed, args.repeat)
+        print("Water hole mismatches: {}".format(mismatches))
+        for name, elapsed in results:
+            print("{:<22} {:9.2f} ms".format(name, elapsed * 1000.0))
+        return 1 if mismatches else 0
+
+    extract_results = []
+    if args.extract:
+        extract_results, elements = run_extract_benchmark(args.extract, args.lat, args.lon, args.radius, args.repeat)
+    else:
+        elements = synthetic_overpass_elements(args.buildings, args.roads, args.relations, seed=args.seed)
+    if args.storage:
+        feature_count, memory, results = run_feature_storage_benchmark(elements, args.repeat)
+        print("{} building features".format(feature_count))
+        for name, retained in zip(("lists", "rings"), memory):
+            print("{:<6} retained {}".format(name, "n/a" if retained is None else "{:.1f} MB".format(retained / 1048576.0)))
+        for name, elapsed in results:
+            print("{:<6} project + dedupe + orient {:9.2f} ms".format(name, elapsed * 1000.0))
+        return 0
+
+    results, feature_count = run_pipeline_benchmark(elements, args.repeat)
+    print("{} elements, {} building features".format(len(elements), feature_count))
+    for name, elapsed in extract_results + results:
+        print("{:<20} {:9.2f} ms".format(name, elapsed * 1000.0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
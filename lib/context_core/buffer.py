@@ -0,0 +1,225 @@
+import math
+
+from context_core.geometry import close_ring, point_key, remove_duplicate_xy
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MITRE_LIMIT = 8.0
+MIN_BLEND_DOT = 0.2
+
+
+def normalize_vector(dx, dy):
+    length = math.hypot(dx, dy)
+    if length <= 1e-9:
+        return None
+    return dx / length, dy / length
+
+
+def line_intersection(point_a1, point_a2, point_b1, point_b2):
+    x1, y1 = point_a1
+    x2, y2 = point_a2
+    x3, y3 = point_b1
+    x4, y4 = point_b2
+    denominator = ((x1 - x2) * (y3 - y4)) - ((y1 - y2) * (x3 - x4))
+    if abs(denominator) <= 1e-9:
+        return None
+
+    det_a = (x1 * y2) - (y1 * x2)
+    det_b = (x3 * y4) - (y3 * x4)
+    px = ((det_a * (x3 - x4)) - ((x1 - x2) * det_b)) / denominator
+    py = ((det_a * (y3 - y4)) - ((y1 - y2) * det_b)) / denominator
+    return px, py
+
+
+def segment_normal(point_a, point_b, left_side):
+    vector = normalize_vector(point_b[0] - point_a[0], point_b[1] - point_a[1])
+    if vector is None:
+        return None
+    ux, uy = vector
+    if left_side:
+        return -uy, ux
+    return uy, -ux
+
+
+def offset_point(prev_point, point, next_point, half_width, left_side):
+    prev_normal = segment_normal(prev_point, point, left_side)
+    next_normal = segment_normal(point, next_point, left_side)
+
+    if prev_normal is None and next_normal is None:
+        return point
+    if prev_normal is None:
+        return point[0] + (next_normal[0] * half_width), point[1] + (next_normal[1] * half_width)
+    if next_normal is None:
+        return point[0] + (prev_normal[0] * half_width), point[1] + (prev_normal[1] * half_width)
+
+    prev_start = (prev_point[0] + (prev_normal[0] * half_width), prev_point[1] + (prev_normal[1] * half_width))
+    prev_end = (point[0] + (prev_normal[0] * half_width), point[1] + (prev_normal[1] * half_width))
+    next_start = (point[0] + (next_normal[0] * half_width), point[1] + (next_normal[1] * half_width))
+    next_end = (next_point[0] + (next_normal[0] * half_width), next_point[1] + (next_normal[1] * half_width))
+
+    intersection = line_intersection(prev_start, prev_end, next_start, next_end)
+    if intersection is not None and math.hypot(intersection[0] - point[0], intersection[1] - point[1]) <= (half_width * MITRE_LIMIT):
+        return intersection
+
+    blended = normalize_vector(prev_normal[0] + next_normal[0], prev_normal[1] + next_normal[1])
+    if blended is not None:
+        dot_value = max(MIN_BLEND_DOT, min(1.0, (blended[0] * prev_normal[0]) + (blended[1] * prev_normal[1])))
+        scale = half_width / dot_value
+        return point[0] + (blended[0] * scale), point[1] + (blended[1] * scale)
+
+    return point[0] + (prev_normal[0] * half_width), point[1] + (prev_normal[1] * half_width)
+
+
+def _clean_polyline(points):
+    clean = remove_duplicate_xy(points, tolerance_m=0.05)
+    if len(clean) >= 2 and clean[0] == clean[-1]:
+        clean = clean[:-1]
+    return clean if len(clean) >= 2 else None
+
+
+def _finish_buffer_polygon(left_points, right_points):
+    polygon = left_points + list(reversed(right_points))
+    polygon = close_ring(remove_duplicate_xy(polygon, tolerance_m=0.05))
+    if len(polygon) < 4:
+        return None
+    # Only needs three distinct corners, so stop keying points once they are found.
+    unique_points = set()
+    for point in polygon[:-1]:
+        unique_points.add(point_key(point))
+        if len(unique_points) >= 3:
+            return polygon
+    return None
+
+
+def polyline_to_buffer_polygon(points, width_m):
+    clean = _clean_polyline(points)
+    if clean is None:
+        return None
+
+    half_width = max(0.5, width_m / 2.0)
+    left_points = []
+    right_points = []
+
+    for index, point in enumerate(clean):
+        if index == 0:
+            left_normal = segment_normal(clean[0], clean[1], True)
+            right_normal = segment_normal(clean[0], clean[1], False)
+            left_points.append((point[0] + (left_normal[0] * half_width), point[1] + (left_normal[1] * half_width)))
+            right_points.append((point[0] + (right_normal[0] * half_width), point[1] + (right_normal[1] * half_width)))
+        elif index == len(clean) - 1:
+            left_normal = segment_normal(clean[-2], clean[-1], True)
+            right_normal = segment_normal(clean[-2], clean[-1], False)
+            left_points.append((point[0] + (left_normal[0] * half_width), point[1] + (left_normal[1] * half_width)))
+            right_points.append((point[0] + (right_normal[0] * half_width), point[1] + (right_normal[1] * half_width)))
+        else:
+            left_points.append(offset_point(clean[index - 1], point, clean[index + 1], half_width, True))
+            right_points.append(offset_point(clean[index - 1], point, clean[index + 1], half_width, False))
+
+    return _finish_buffer_polygon(left_points, right_points)
+
+
+def _mitre_vectors(clean):
+    """Left-side offset direction per vertex, scaled so a unit half width lands on the mitre."""
+    normals = []
+    for index in range(len(clean) - 1):
+        dx = clean[index + 1][0] - clean[index][0]
+        dy = clean[index + 1][1] - clean[index][1]
+        length = math.hypot(dx, dy)
+        normals.append((-dy / length, dx / length) if length > 1e-9 else (0.0, 0.0))
+
+    vectors = [normals[0]]
+    for prev_normal, next_normal in zip(normals, normals[1:]):
+        sum_x = prev_normal[0] + next_normal[0]
+        sum_y = prev_normal[1] + next_normal[1]
+        denominator = 1.0 + (prev_normal[0] * next_normal[0]) + (prev_normal[1] * next_normal[1])
+        if denominator > 1e-9 and math.hypot(sum_x, sum_y) <= MITRE_LIMIT * denominator:
+            vectors.append((sum_x / denominator, sum_y / denominator))
+            continue
+
+        sum_length = math.hypot(sum_x, sum_y)
+        if sum_length <= 1e-9:
+            vectors.append(prev_normal)
+            continue
+        blend_x = sum_x / sum_length
+        blend_y = sum_y / sum_length
+        dot_value = max(MIN_BLEND_DOT, min(1.0, (blend_x * prev_normal[0]) + (blend_y * prev_normal[1])))
+        vectors.append((blend_x / dot_value, blend_y / dot_value))
+    vectors.append(normals[-1])
+    return vectors
+
+
+def _mitre_vectors_numpy(lines):
+    points = numpy.array([point for clean in lines for point in clean], dtype=float)
+    counts = numpy.array([len(clean) for clean in lines])
+    ends = numpy.cumsum(counts)
+    is_first = numpy.zeros(len(points), dtype=bool)
+    is_first[ends - counts] = True
+    is_last = numpy.zeros(len(points), dtype=bool)
+    is_last[ends - 1] = True
+
+    deltas = points[1:] - points[:-1]
+    lengths = numpy.hypot(deltas[:, 0], deltas[:, 1])
+    lengths[lengths <= 1e-9] = numpy.inf
+    normals = numpy.column_stack((-deltas[:, 1] / lengths, deltas[:, 0] / lengths))
+
+    # Segments that cross from one polyline into the next are never read.
+    prev_normals = numpy.empty_like(points)
+    next_normals = numpy.empty_like(points)
+    prev_normals[1:] = normals
+    next_normals[:-1] = normals
+    prev_normals[is_first] = next_normals[is_first]
+    next_normals[is_last] = prev_normals[is_last]
+
+    sums = prev_normals + next_normals
+    sum_lengths = numpy.hypot(sums[:, 0], sums[:, 1])
+    denominators = 1.0 + numpy.einsum("ij,ij->i", prev_normals, next_normals)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        mitres = sums / denominators[:, None]
+        blends = sums / sum_lengths[:, None]
+        dots = numpy.clip(numpy.einsum("ij,ij->i", blends, prev_normals), MIN_BLEND_DOT, 1.0)
+        blends = blends / dots[:, None]
+    blends[sum_lengths <= 1e-9] = prev_normals[sum_lengths <= 1e-9]
+    use_mitre = (denominators > 1e-9) & (sum_lengths <= MITRE_LIMIT * denominators)
+    return points, numpy.where(use_mitre[:, None], mitres, blends)
+
+
+def polylines_to_buffer_polygons(polylines, widths_m):
+    """Buffer many projected polylines at once; returns one polygon or None per input.
+
+    Vertices get the closed-form mitre offset of polyline_to_buffer_polygon,
+    computed across every polyline in a single NumPy pass when available. A
+    width of None skips that polyline.
+    """
+    polygons = [None] * len(polylines)
+    jobs = []
+    for index, (points, width_m) in enumerate(zip(polylines, widths_m)):
+        if width_m is None:
+            continue
+        clean = _clean_polyline(points)
+        if clean is not None:
+            jobs.append((index, clean, max(0.5, width_m / 2.0)))
+    if not jobs:
+        return polygons
+
+    if numpy is None:
+        for index, clean, half_width in jobs:
+            vectors = _mitre_vectors(clean)
+            left_points = [(point[0] + (vector[0] * half_width), point[1] + (vector[1] * half_width)) for point, vector in zip(clean, vectors)]
+            right_points = [(point[0] - (vector[0] * half_width), point[1] - (vector[1] * half_width)) for point, vector in zip(clean, vectors)]
+            polygons[index] = _finish_buffer_polygon(left_points, right_points)
+        return polygons
+
+    points, vectors = _mitre_vectors_numpy([clean for _, clean, _ in jobs])
+    half_widths = numpy.repeat([half_width for _, _, half_width in jobs], [len(clean) for _, clean, _ in jobs])
+    offsets = vectors * half_widths[:, None]
+    left_all = list(map(tuple, (points + offsets).tolist()))
+    right_all = list(map(tuple, (points - offsets).tolist()))
+    start = 0
+    for index, clean, _ in jobs:
+        end = start + len(clean)
+        polygons[index] = _finish_buffer_polygon(left_all[start:end], right_all[start:end])
+        start = end
+    return polygons
@@ -0,0 +1,43 @@
+import hashlib
+import json
+import os
+
+
+def cache_key(*parts):
+    normalized = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=True)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def ensure_cache_dir(cache_root, bucket_name):
+    bucket_path = os.path.join(cache_root, bucket_name)
+    if not os.path.isdir(bucket_path):
+        os.makedirs(bucket_path)
+    return bucket_path
+
+
+def cache_file_path(cache_root, bucket_name, cache_key_value, extension):
+    return os.path.join(ensure_cache_dir(cache_root, bucket_name), "{}.{}".format(cache_key_value, extension))
+
+
+def read_cache_json(cache_root, bucket_name, cache_key_value):
+    if not cache_root:
+        return None
+    cache_path = cache_file_path(cache_root, bucket_name, cache_key_value, "json")
+    if not os.path.isfile(cache_path):
+        return None
+    try:
+        with open(cache_path, "r") as cache_file:
+            return json.load(cache_file)
+    except Exception:
+        return None
+
+
+def write_cache_json(cache_root, bucket_name, cache_key_value, data):
+    if not cache_root:
+        return
+    try:
+        cache_path = cache_file_path(cache_root, bucket_name, cache_key_value, "json")
+        with open(cache_path, "w") as cache_file:
+            json.dump(data, cache_file, indent=2, sort_keys=True)
+    except Exception:
+        pass
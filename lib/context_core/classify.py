@@ -0,0 +1,300 @@
+import re
+
+from context_core.geometry import assemble_geometry_rings, geometry_to_points, latlon_ring_centroid, point_in_bounds, point_in_ring_latlon, ring_bounds
+from context_core.rings import Feature, Ring
+from context_core.spatial import BoxGridIndex
+
+
+PEDESTRIAN_HIGHWAYS = (
+    "footway",
+    "path",
+    "cycleway",
+    "pedestrian",
+    "steps",
+    "track",
+    "bridleway",
+    "corridor",
+)
+
+
+def is_building_tag(tags):
+    for key in ("building", "building:part"):
+        value = (tags.get(key) or "").strip().lower()
+        if value and value not in ("no", "false", "0"):
+            return True
+    return False
+
+
+def is_park_tag(tags):
+    leisure = (tags.get("leisure") or "").strip().lower()
+    landuse = (tags.get("landuse") or "").strip().lower()
+    natural = (tags.get("natural") or "").strip().lower()
+    return (
+        leisure in ("park", "garden", "playground", "recreation_ground")
+        or landuse in ("grass", "recreation_ground", "village_green", "greenfield")
+        or natural == "grassland"
+    )
+
+
+def is_water_tag(tags):
+    natural = (tags.get("natural") or "").strip().lower()
+    landuse = (tags.get("landuse") or "").strip().lower()
+    water = (tags.get("water") or "").strip().lower()
+    waterway = (tags.get("waterway") or "").strip().lower()
+    return (
+        natural == "water"
+        or landuse in ("reservoir", "basin")
+        or bool(water)
+        or waterway == "riverbank"
+    )
+
+
+def is_track_tag(tags):
+    railway = (tags.get("railway") or "").strip().lower()
+    return railway in ("rail", "light_rail", "tram", "subway", "narrow_gauge")
+
+
+def is_parcel_tag(tags):
+    boundary = (tags.get("boundary") or "").strip().lower()
+    parcel = (tags.get("parcel") or "").strip().lower()
+    return boundary == "cadastral" or bool(parcel)
+
+
+def is_area_way(tags):
+    area_value = (tags.get("area") or "").strip().lower()
+    return area_value in ("yes", "1", "true") or bool(tags.get("area:highway"))
+
+
+def collect_elements(elements):
+    ways = {}
+    relations = []
+    roads = []
+    tracks = []
+    waterways = []
+
+    for element in elements or []:
+        element_type = (element.get("type") or "").lower()
+        element_id = str(element.get("id"))
+        tags = element.get("tags") or {}
+
+        if element_type == "way":
+            ways[element_id] = element
+
+            highway = (tags.get("highway") or "").strip().lower()
+            if highway and highway not in PEDESTRIAN_HIGHWAYS:
+                roads.append(element)
+
+            if is_track_tag(tags):
+                tracks.append(element)
+
+            waterway = (tags.get("waterway") or "").strip().lower()
+            if waterway and waterway not in ("dam", "weir", "dock"):
+                waterways.append(element)
+        elif element_type == "relation":
+            relations.append(element)
+
+    return ways, relations, roads, tracks, waterways
+
+
+def build_area_features(ways, relations, predicate):
+    features = []
+    relation_way_ids = set()
+
+    for relation in relations or []:
+        tags = relation.get("tags") or {}
+        if not predicate(tags):
+            continue
+
+        members = relation.get("members") or []
+        outer_rings = [Ring.from_points(ring) for ring in assemble_geometry_rings(members, "outer")]
+        if not outer_rings:
+            continue
+
+        inner_rings = [Ring.from_points(ring) for ring in assemble_geometry_rings(members, "inner")]
+        for member in members:
+            if (member.get("type") or "").lower() == "way" and member.get("ref") is not None:
+                relation_way_ids.add(str(member.get("ref")))
+
+        assigned_inners = [[] for _ in outer_rings]
+        outer_index = BoxGridIndex([ring_bounds(outer_ring) + (position,) for position, outer_ring in enumerate(outer_rings)])
+        for inner_ring in inner_rings:
+            first_point = inner_ring[0]
+            for position in outer_index.query_point(first_point[0], first_point[1]):
+                if point_in_ring_latlon(first_point, outer_rings[position]):
+                    assigned_inners[position].append(inner_ring)
+
+        for position, outer_ring in enumerate(outer_rings):
+            features.append(
+                Feature(
+                    "relation/{}:{}".format(relation.get("id"), position + 1),
+                    tags,
+                    outer_ring,
+                    assigned_inners[position],
+                )
+            )
+
+    for way_id, way in (ways or {}).items():
+        if way_id in relation_way_ids:
+            continue
+
+        tags = way.get("tags") or {}
+        if not predicate(tags):
+            continue
+
+        ring = Ring.from_points(geometry_to_points(way.get("geometry"))).close()
+        if not ring.is_valid_polygon():
+            continue
+
+        features.append(Feature("way/{}".format(way_id), tags, ring))
+
+    return features
+
+
+def build_hole_index(hole_features):
+    """Grid index of hole outlines by centroid, for collect_water_hole_rings_for_feature."""
+    boxes = []
+    for hole_feature in hole_features or []:
+        hole_outer = hole_feature.get("outer") or []
+        if not hole_outer:
+            continue
+        centroid = latlon_ring_centroid(hole_outer)
+        if centroid is None:
+            continue
+        boxes.append((centroid[0], centroid[1], centroid[0], centroid[1], (centroid, hole_outer, ring_bounds(hole_outer))))
+    return BoxGridIndex(boxes)
+
+
+def collect_water_hole_rings_for_feature(feature, hole_features, hole_index=None):
+    """Outlines of hole_features whose centroid lies inside feature and outside its inners.
+
+    Pass a build_hole_index() result as hole_index when calling this for many
+    features against the same holes; only holes whose centroid falls in the
+    feature's bounds are tested.
+    """
+    if not feature or not (hole_features or hole_index):
+        return []
+    if hole_index is None:
+        hole_index = build_hole_index(hole_features)
+
+    feature_outer = feature.get("outer") or []
+    feature_bounds = ring_bounds(feature_outer)
+    if feature_bounds is None:
+        return []
+    feature_inners = [(inner_ring, ring_bounds(inner_ring)) for inner_ring in feature.get("inners") or []]
+    accepted_holes = []
+
+    for centroid, hole_outer, hole_bounds in hole_index.query(*feature_bounds):
+        if not point_in_ring_latlon(centroid, feature_outer):
+            continue
+        if any(point_in_bounds(centroid, inner_bounds) and point_in_ring_latlon(centroid, inner_ring) for inner_ring, inner_bounds in feature_inners):
+            continue
+        if any(point_in_bounds(centroid, accepted_bounds) and point_in_ring_latlon(centroid, accepted_ring) for accepted_ring, accepted_bounds in accepted_holes):
+            continue
+
+        accepted_holes.append((hole_outer, hole_bounds))
+
+    return [hole_outer for hole_outer, _ in accepted_holes]
+
+
+def parse_numeric(raw_text):
+    text = (raw_text or "").strip().replace(",", ".")
+    match = re.search(r"[-+]?\d*\.?\d+", text)
+    if not match:
+        return None
+    try:
+        return float(match.group(0))
+    except Exception:
+        return None
+
+
+def parse_height_m(tags):
+    for key in ("height", "building:height", "est_height"):
+        raw_value = tags.get(key)
+        if not raw_value:
+            continue
+
+        value = parse_numeric(raw_value)
+        if value is None or value <= 0:
+            continue
+
+        text = raw_value.lower()
+        if "ft" in text or "feet" in text or "'" in text:
+            return value * 0.3048
+        if "mm" in text:
+            return value / 1000.0
+        if "cm" in text:
+            return value / 100.0
+        return value
+    return None
+
+
+def parse_levels(tags):
+    for key in ("building:levels", "levels"):
+        value = parse_numeric(tags.get(key))
+        if value is not None and value > 0:
+            return value
+    return None
+
+
+def get_building_height_m(tags):
+    explicit_height = parse_height_m(tags)
+    if explicit_height is not None:
+        return explicit_height, "height"
+
+    levels = parse_levels(tags)
+    if levels is not None:
+        return ((levels - 1.0) * 2.95) + 3.25, "levels"
+
+    return 12.0, "default"
+
+
+def road_width_m(tags):
+    explicit = parse_numeric(tags.get("width"))
+    if explicit is not None and explicit > 0:
+        return explicit
+
+    highway = (tags.get("highway") or "").strip().lower()
+    widths = {
+        "motorway": 18.0,
+        "trunk": 14.0,
+        "primary": 12.0,
+        "secondary": 10.0,
+        "tertiary": 8.0,
+        "residential": 7.2,
+        "service": 6.0,
+        "living_street": 5.0,
+        "unclassified": 6.5,
+    }
+    return widths.get(highway, 7.0)
+
+
+def track_width_m(tags):
+    explicit = parse_numeric(tags.get("width"))
+    if explicit is not None and explicit > 0:
+        return explicit
+
+    railway = (tags.get("railway") or "").strip().lower()
+    widths = {
+        "rail": 5.0,
+        "light_rail": 4.0,
+        "tram": 3.5,
+        "subway": 5.0,
+        "narrow_gauge": 3.0,
+    }
+    return widths.get(railway, 4.0)
+
+
+def waterway_width_m(tags):
+    explicit = parse_numeric(tags.get("width"))
+    if explicit is not None and explicit > 0:
+        return explicit
+
+    waterway = (tags.get("waterway") or "").strip().lower()
+    widths = {
+        "river": 12.0,
+        "canal": 8.0,
+        "stream": 4.0,
+        "ditch": 2.5,
+        "drain": 2.5,
+    }
+    return widths.get(waterway, 5.0)
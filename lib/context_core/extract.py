@@ -0,0 +1,528 @@
+import io
+import json
+import os
+import struct
+import xml.etree.ElementTree as ET
+import zlib
+from array import array
+from bisect import bisect_left
+
+from context_core.geometry import calculate_square_bounds
+from context_core.overpass import OverpassLayers
+
+
+EXTRACT_FILE_FILTER = "OSM extracts (*.osm;*.pbf;*.geojson;*.json)|*.osm;*.pbf;*.geojson;*.json|All files (*.*)|*.*"
+DEFAULT_NODE_MARGIN_M = 250.0
+PBF_MAX_BLOB_BYTES = 64 * 1024 * 1024
+
+
+def extract_format(path):
+    lowered = (path or "").lower()
+    if lowered.endswith(".osm.pbf") or lowered.endswith(".pbf"):
+        return "pbf"
+    if lowered.endswith(".osm") or lowered.endswith(".xml"):
+        return "osm"
+    if lowered.endswith(".geojson") or lowered.endswith(".json"):
+        return "geojson"
+    return None
+
+
+def _bounds_overlap(bounds_a, bounds_b):
+    return bounds_a[0] <= bounds_b[2] and bounds_a[2] >= bounds_b[0] and bounds_a[1] <= bounds_b[3] and bounds_a[3] >= bounds_b[1]
+
+
+def _union_bounds(bounds_list):
+    bounds_list = [bounds for bounds in bounds_list if bounds is not None]
+    if not bounds_list:
+        return None
+    return (
+        min(bounds[0] for bounds in bounds_list),
+        min(bounds[1] for bounds in bounds_list),
+        max(bounds[2] for bounds in bounds_list),
+        max(bounds[3] for bounds in bounds_list),
+    )
+
+
+# Records shared by the XML and PBF readers (the XML reader also yields "bounds"):
+#   ("node", id, lat, lon)
+#   ("way", id, tags, version, refs)
+#   ("relation", id, tags, version, [(member type, ref, role), ...])
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1] if "}" in tag else tag
+
+
+def _xml_children(element, name):
+    return [child for child in element if _local_name(child.tag) == name]
+
+
+def iter_osm_xml(path, nodes=True, ways=True, relations=True):
+    """Stream node/way/relation records from an .osm file, clearing parsed elements as it goes.
+
+    A <bounds> element, when present, is yielded as ("bounds", minlat, minlon, maxlat, maxlon).
+    """
+    root = None
+    for event, element in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            continue
+
+        tag = _local_name(element.tag)
+        if tag not in ("node", "way", "relation", "bounds"):
+            continue
+        try:
+            if tag == "node":
+                if nodes:
+                    yield ("node", int(element.get("id")), float(element.get("lat")), float(element.get("lon")))
+            elif tag == "bounds":
+                yield ("bounds", float(element.get("minlat", 0.0)), float(element.get("minlon", 0.0)), float(element.get("maxlat", 0.0)), float(element.get("maxlon", 0.0)))
+            elif (tag == "way" and ways) or (tag == "relation" and relations):
+                tags = dict((child.get("k"), child.get("v")) for child in _xml_children(element, "tag") if child.get("k"))
+                version = element.get("version")
+                version = int(version) if version else None
+                if tag == "way":
+                    yield ("way", int(element.get("id")), tags, version, [int(child.get("ref")) for child in _xml_children(element, "nd")])
+                else:
+                    members = [
+                        ((child.get("type") or "").lower(), int(child.get("ref")), child.get("role") or "")
+                        for child in _xml_children(element, "member")
+                    ]
+                    yield ("relation", int(element.get("id")), tags, version, members)
+        except (TypeError, ValueError):
+            pass
+        if root is not None:
+            root.clear()
+
+
+def _varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(data, start=0, end=None):
+    """Yield (field number, value) for a protobuf message; length-delimited values are (start, end) spans."""
+    pos = start
+    end = len(data) if end is None else end
+    while pos < end:
+        key, pos = _varint(data, pos)
+        wire_type = key & 7
+        if wire_type == 0:
+            value, pos = _varint(data, pos)
+        elif wire_type == 2:
+            length, pos = _varint(data, pos)
+            value = (pos, pos + length)
+            pos += length
+        elif wire_type == 1:
+            value = None
+            pos += 8
+        elif wire_type == 5:
+            value = None
+            pos += 4
+        else:
+            raise ValueError("Unsupported protobuf wire type {}.".format(wire_type))
+        yield key >> 3, value
+
+
+def _packed(data, span):
+    values = []
+    pos, end = span
+    while pos < end:
+        value, pos = _varint(data, pos)
+        values.append(value)
+    return values
+
+
+def _zigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _int64(value):
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _delta_decode(values):
+    total = 0
+    decoded = []
+    for value in values:
+        total += _zigzag(value)
+        decoded.append(total)
+    return decoded
+
+
+def _pbf_blobs(handle):
+    while True:
+        size_bytes = handle.read(4)
+        if len(size_bytes) < 4:
+            return
+        header = bytearray(handle.read(struct.unpack(">I", size_bytes)[0]))
+        blob_type = None
+        data_size = 0
+        for number, value in _fields(header):
+            if number == 1:
+                blob_type = bytes(header[value[0]:value[1]]).decode("utf-8")
+            elif number == 3:
+                data_size = value
+        if data_size > PBF_MAX_BLOB_BYTES:
+            raise ValueError("PBF blob is larger than {} bytes.".format(PBF_MAX_BLOB_BYTES))
+
+        blob = bytearray(handle.read(data_size))
+        raw = None
+        for number, value in _fields(blob):
+            if number == 1:
+                raw = blob[value[0]:value[1]]
+            elif number == 3:
+                raw = bytearray(zlib.decompress(bytes(blob[value[0]:value[1]])))
+        if raw is None:
+            raise ValueError("Unsupported PBF blob compression.")
+        yield blob_type, raw
+
+
+def _pbf_tags(block, strings, key_span, value_span):
+    if key_span is None or value_span is None:
+        return {}
+    return dict((strings[key], strings[value]) for key, value in zip(_packed(block, key_span), _packed(block, value_span)))
+
+
+def _pbf_version(block, info_span):
+    if info_span is None:
+        return None
+    for number, value in _fields(block, *info_span):
+        if number == 1:
+            return value
+    return None
+
+
+def _iter_pbf_block(block, nodes, ways, relations):
+    strings = []
+    groups = []
+    granularity = 100
+    lat_offset = 0
+    lon_offset = 0
+    for number, value in _fields(block):
+        if number == 1:
+            strings = [bytes(block[span[0]:span[1]]).decode("utf-8") for _, span in _fields(block, *value)]
+        elif number == 2:
+            groups.append(value)
+        elif number == 17:
+            granularity = value
+        elif number == 19:
+            lat_offset = _int64(value)
+        elif number == 20:
+            lon_offset = _int64(value)
+
+    def _lat(raw):
+        return 1e-9 * (lat_offset + (granularity * raw))
+
+    def _lon(raw):
+        return 1e-9 * (lon_offset + (granularity * raw))
+
+    for group in groups:
+        for kind, span in _fields(block, *group):
+            if kind == 2 and nodes:
+                dense = dict((number, value) for number, value in _fields(block, *span) if number in (1, 8, 9))
+                if 1 not in dense:
+                    continue
+                ids = _delta_decode(_packed(block, dense[1]))
+                lats = _delta_decode(_packed(block, dense[8]))
+                lons = _delta_decode(_packed(block, dense[9]))
+                for node_id, lat, lon in zip(ids, lats, lons):
+                    yield ("node", node_id, _lat(lat), _lon(lon))
+            elif kind == 1 and nodes:
+                node = dict(_fields(block, *span))
+                yield ("node", _zigzag(node.get(1, 0)), _lat(_zigzag(node.get(8, 0))), _lon(_zigzag(node.get(9, 0))))
+            elif (kind == 3 and ways) or (kind == 4 and relations):
+                fields = dict(_fields(block, *span))
+                tags = _pbf_tags(block, strings, fields.get(2), fields.get(3))
+                version = _pbf_version(block, fields.get(4))
+                element_id = _int64(fields.get(1, 0))
+                if kind == 3:
+                    refs = _delta_decode(_packed(block, fields[8])) if 8 in fields else []
+                    yield ("way", element_id, tags, version, refs)
+                else:
+                    roles = _packed(block, fields[8]) if 8 in fields else []
+                    member_ids = _delta_decode(_packed(block, fields[9])) if 9 in fields else []
+                    types = _packed(block, fields[10]) if 10 in fields else []
+                    members = [
+                        (("node", "way", "relation")[member_type] if member_type < 3 else "", member_id, strings[role])
+                        for role, member_id, member_type in zip(roles, member_ids, types)
+                    ]
+                    yield ("relation", element_id, tags, version, members)
+
+
+def iter_osm_pbf(path, nodes=True, ways=True, relations=True):
+    """Stream node/way/relation records from an .osm.pbf file, one decoded block at a time."""
+    with open(path, "rb") as handle:
+        for blob_type, raw in _pbf_blobs(handle):
+            if blob_type != "OSMData":
+                continue
+            for record in _iter_pbf_block(raw, nodes, ways, relations):
+                yield record
+
+
+class NodeStore(object):
+    """Node coordinates in one flat array('d'), keyed by OSM id."""
+
+    def __init__(self):
+        self._index = {}
+        self._coords = array("d")
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, node_id):
+        return node_id in self._index
+
+    def add(self, node_id, lat, lon):
+        if node_id in self._index:
+            return
+        self._index[node_id] = len(self._coords)
+        self._coords.append(lat)
+        self._coords.append(lon)
+
+    def get(self, node_id):
+        position = self._index.get(node_id)
+        if position is None:
+            return None
+        return self._coords[position], self._coords[position + 1]
+
+    def points(self, refs):
+        points = []
+        for ref in refs:
+            point = self.get(ref)
+            if point is not None:
+                points.append([point[0], point[1]])
+        return points
+
+
+class PackedRows(object):
+    """Fixed-width rows of floats in flat arrays, searched by id.
+
+    Ids are kept as doubles (exact for OSM ids) so the arrays also work where
+    array('q') does not; a node costs about 24 bytes instead of a dict entry
+    and a tuple.
+    """
+
+    def __init__(self, width):
+        self.width = int(width)
+        self._ids = array("d")
+        self._values = array("d")
+        self._sorted = True
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, row_id, values):
+        if self._ids and row_id < self._ids[-1]:
+            self._sorted = False
+        self._ids.append(row_id)
+        self._values.extend(values)
+
+    def _ensure_sorted(self):
+        if self._sorted:
+            return
+        width = self.width
+        order = sorted(range(len(self._ids)), key=self._ids.__getitem__)
+        self._ids = array("d", (self._ids[position] for position in order))
+        self._values = array("d", (self._values[(width * position) + offset] for position in order for offset in range(width)))
+        self._sorted = True
+
+    def get(self, row_id):
+        self._ensure_sorted()
+        position = bisect_left(self._ids, row_id)
+        if position >= len(self._ids) or self._ids[position] != row_id:
+            return None
+        start = self.width * position
+        return tuple(self._values[start:start + self.width])
+
+    def point_bounds(self, refs):
+        """(min_lat, min_lon, max_lat, max_lon) of the known (lat, lon) rows among refs, or None."""
+        self._ensure_sorted()
+        ids = self._ids
+        values = self._values
+        count = len(ids)
+        lats = []
+        lons = []
+        for ref in refs:
+            position = bisect_left(ids, ref)
+            if position < count and ids[position] == ref:
+                lats.append(values[2 * position])
+                lons.append(values[(2 * position) + 1])
+        if not lats:
+            return None
+        return min(lats), min(lons), max(lats), max(lons)
+
+
+def resolve_osm_records(iter_records, near_bounds, keep_relation):
+    """Collect ways and relations overlapping near_bounds from a re-readable record stream.
+
+    iter_records(nodes, ways, relations) streams the file again each call.
+    Like an Overpass bbox query, a way is kept when its bounding box overlaps
+    near_bounds, so areas enclosing the site and long roads or waterways
+    crossing it without a vertex inside are kept too; a relation accepted by
+    keep_relation is kept when the union of its member ways' boxes overlaps.
+    The first pass packs every node's coordinates and every other way's box
+    for those tests; a second pass over ways only fetches the missing members
+    of kept relations. Only the kept ways' nodes are copied into the returned
+    NodeStore. Returns (nodes, ways, relations) where ways maps id -> (tags,
+    version, refs).
+    """
+    packed_nodes = PackedRows(2)
+    far_way_bounds = PackedRows(4)
+    ways = {}
+    relations = []
+    for record in iter_records(True, True, True):
+        kind = record[0]
+        if kind == "node":
+            packed_nodes.add(record[1], (record[2], record[3]))
+        elif kind == "way":
+            refs = record[4]
+            way_bounds = packed_nodes.point_bounds(refs)
+            if way_bounds is None:
+                continue
+            if _bounds_overlap(way_bounds, near_bounds):
+                ways[record[1]] = (record[2], record[3], refs)
+            else:
+                far_way_bounds.add(record[1], way_bounds)
+        elif kind == "relation" and keep_relation(record[2]):
+            member_ids = [member[1] for member in record[4] if member[0] == "way"]
+            if any(way_id in ways for way_id in member_ids):
+                relations.append(record)
+                continue
+            relation_bounds = _union_bounds([far_way_bounds.get(way_id) for way_id in member_ids])
+            if relation_bounds is not None and _bounds_overlap(relation_bounds, near_bounds):
+                relations.append(record)
+    far_way_bounds = None
+
+    missing_ways = set(
+        member[1] for relation in relations for member in relation[4] if member[0] == "way" and member[1] not in ways
+    )
+    if missing_ways:
+        for record in iter_records(False, True, False):
+            if record[0] == "way" and record[1] in missing_ways:
+                ways[record[1]] = (record[2], record[3], record[4])
+
+    nodes = NodeStore()
+    for _, _, refs in ways.values():
+        for ref in refs:
+            if ref not in nodes:
+                point = packed_nodes.get(ref)
+                if point is not None:
+                    nodes.add(ref, point[0], point[1])
+    return nodes, ways, relations
+
+
+def _osm_elements(iter_records, near_bounds, keep_relation):
+    nodes, ways, relations = resolve_osm_records(iter_records, near_bounds, keep_relation)
+    for way_id, (tags, version, refs) in ways.items():
+        if not tags:
+            continue
+        yield {"type": "way", "id": way_id, "tags": tags, "version": version, "geometry": nodes.points(refs)}
+
+    for _, relation_id, tags, version, members in relations:
+        way_members = []
+        for member_type, ref, role in members:
+            if member_type != "way" or ref not in ways:
+                continue
+            way_members.append({"type": "way", "ref": ref, "role": role, "geometry": nodes.points(ways[ref][2])})
+        yield {"type": "relation", "id": relation_id, "tags": tags, "version": version, "members": way_members}
+
+
+def _geojson_id(feature, index):
+    properties = feature.get("properties") or {}
+    raw_id = properties.get("@id") or feature.get("id")
+    if raw_id is None:
+        return None, "geojson-{}".format(index + 1)
+    text = str(raw_id)
+    if "/" in text:
+        element_type, element_id = text.split("/", 1)
+        return element_type.lower(), element_id
+    return None, text
+
+
+def _geojson_ring(coordinates):
+    return [[float(point[1]), float(point[0])] for point in coordinates or [] if len(point) >= 2]
+
+
+def iter_geojson_elements(path):
+    """Overpass-shaped ways and relations from a GeoJSON file; polygons with holes become relations."""
+    with io.open(path, "r", encoding="utf-8") as handle:
+        data = json.load(handle)
+    if (data.get("type") or "") == "Feature":
+        features = [data]
+    else:
+        features = data.get("features") or []
+
+    for index, feature in enumerate(features):
+        geometry = feature.get("geometry") or {}
+        geometry_type = geometry.get("type") or ""
+        coordinates = geometry.get("coordinates") or []
+        properties = feature.get("properties") or {}
+        tags = dict((key, value if isinstance(value, type(u"")) else str(value)) for key, value in properties.items() if value is not None and not key.startswith("@"))
+        version = properties.get("@version")
+        _, element_id = _geojson_id(feature, index)
+
+        if geometry_type == "LineString":
+            yield {"type": "way", "id": element_id, "tags": tags, "version": version, "geometry": _geojson_ring(coordinates)}
+        elif geometry_type == "MultiLineString":
+            for line_index, line in enumerate(coordinates):
+                yield {"type": "way", "id": "{}-{}".format(element_id, line_index + 1), "tags": tags, "version": version, "geometry": _geojson_ring(line)}
+        elif geometry_type == "Polygon" and len(coordinates) == 1:
+            yield {"type": "way", "id": element_id, "tags": tags, "version": version, "geometry": _geojson_ring(coordinates[0])}
+        elif geometry_type in ("Polygon", "MultiPolygon"):
+            polygons = [coordinates] if geometry_type == "Polygon" else coordinates
+            members = []
+            for polygon in polygons:
+                for ring_index, ring in enumerate(polygon):
+                    members.append(
+                        {
+                            "type": "way",
+                            "ref": "{}-{}".format(element_id, len(members) + 1),
+                            "role": "outer" if ring_index == 0 else "inner",
+                            "geometry": _geojson_ring(ring),
+                        }
+                    )
+            yield {"type": "relation", "id": element_id, "tags": tags, "version": version, "members": members}
+
+
+def iter_extract_elements(path, near_bounds, keep_relation):
+    """Overpass-shaped elements from a local .osm, .osm.pbf or GeoJSON extract."""
+    file_format = extract_format(path)
+    if file_format == "osm":
+        return _osm_elements(lambda nodes, ways, relations: iter_osm_xml(path, nodes, ways, relations), near_bounds, keep_relation)
+    if file_format == "pbf":
+        return _osm_elements(lambda nodes, ways, relations: iter_osm_pbf(path, nodes, ways, relations), near_bounds, keep_relation)
+    if file_format == "geojson":
+        return iter_geojson_elements(path)
+    raise ValueError("Unsupported extract format: {}".format(path))
+
+
+def load_extract_layers(path, center_lat, center_lon, radius_m, selected_layers, node_margin_m=DEFAULT_NODE_MARGIN_M):
+    """Classify a local extract into OverpassLayers clipped to the square around the centre.
+
+    Ways and relations are kept when their bounds overlap the square grown by
+    node_margin_m. Nodes are held as packed coordinates and only the kept
+    ways' nodes become NodeStore entries, so regional extracts load without
+    holding the whole file as elements.
+    """
+    if not os.path.isfile(path):
+        raise ValueError("Extract file not found: {}".format(path))
+
+    bounds = calculate_square_bounds(center_lat, center_lon, radius_m)
+    near_bounds = calculate_square_bounds(center_lat, center_lon, radius_m + max(0.0, float(node_margin_m)))
+    layers = OverpassLayers(selected_layers)
+    for element in iter_extract_elements(path, near_bounds, layers.is_selected_area):
+        if element.get("type") == "way" and not element.get("geometry"):
+            continue
+        layers.add(element)
+    layers.clip_to_bounds(bounds)
+    layers.endpoint = "file: {}".format(os.path.basename(path))
+    return layers
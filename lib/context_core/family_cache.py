@@ -0,0 +1,200 @@
+import json
+import os
+import time
+
+from context_core.cache import cache_key
+
+
+FAMILY_CACHE_VERSION = 2
+MANIFEST_FILE_NAME = "manifest.json"
+DEFAULT_MAX_AGE_DAYS = 60
+DEFAULT_MAX_TOTAL_BYTES = 2 * 1024 * 1024 * 1024
+GEOMETRY_DIGITS = 3
+
+
+def geometry_key(rings_xy, height_m, base_elevation):
+    """Digest of a building's projected rings (mm), height and base elevation."""
+    rings = [[(round(point[0], GEOMETRY_DIGITS), round(point[1], GEOMETRY_DIGITS)) for point in ring or []] for ring in rings_xy or []]
+    return cache_key("mass_geometry", rings, round(float(height_m), GEOMETRY_DIGITS), round(float(base_elevation or 0.0), 4))
+
+
+def footprint_key(rings_xy, height_m):
+    """Translation-invariant digest of a footprint and height.
+
+    Returns (origin_xy, key) where origin_xy is the lower-left corner of the
+    rings; buildings sharing a key are the same solid moved by their origins.
+    """
+    points = [point for ring in rings_xy or [] for point in ring or []]
+    if not points:
+        return None, None
+    origin_x = min(point[0] for point in points)
+    origin_y = min(point[1] for point in points)
+    rings = [[(round(float(point[0] - origin_x), GEOMETRY_DIGITS), round(float(point[1] - origin_y), GEOMETRY_DIGITS)) for point in ring or []] for ring in rings_xy]
+    return (origin_x, origin_y), cache_key("footprint", rings, round(float(height_m), GEOMETRY_DIGITS))
+
+
+def shape_key(points_xyz, volumes=()):
+    """Translation-invariant digest of a 3D shape from sample points and solid volumes.
+
+    Returns (origin_xyz, key) where origin_xyz is the minimum corner of the
+    points; shapes sharing a key are the same geometry moved by their origins.
+    """
+    points = list(points_xyz or [])
+    if not points:
+        return None, None
+    origin = tuple(min(point[axis] for point in points) for axis in range(3))
+    samples = sorted(set(
+        tuple(round(float(point[axis] - origin[axis]), GEOMETRY_DIGITS) for axis in range(3))
+        for point in points
+    ))
+    return origin, cache_key("shape", [list(sample) for sample in samples], sorted(round(float(volume), GEOMETRY_DIGITS) for volume in volumes or ()))
+
+
+def palette_signature(palette_entry):
+    if not palette_entry:
+        return None
+    rgb = palette_entry.get("rgb")
+    return [palette_entry.get("name"), list(rgb) if rgb else None, palette_entry.get("transparency") or 0]
+
+
+def group_content_hash(geometry_keys, palette_entry=None):
+    """Content address of a group of buildings: their geometry keys in any order plus the palette.
+
+    Used both for a spatial tile, which stays the same whatever batch limits
+    cut it into families, and for each family within it.
+    """
+    return cache_key("mass_family", FAMILY_CACHE_VERSION, sorted(geometry_keys), palette_signature(palette_entry))
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except Exception:
+        return 0
+
+
+def _remove_quietly(path):
+    try:
+        if os.path.isfile(path):
+            os.remove(path)
+    except Exception:
+        pass
+
+
+class FamilyManifest(object):
+    """Manifest of generated .rfa files in one directory, keyed by content hash.
+
+    Each entry lists the files a group of buildings was built into, with their
+    family names, total size and last use; evict() drops entries unused for
+    max_age_days and then the least recently used ones until the directory
+    holds at most max_total_bytes. Evicted families are deleted together with
+    their index sidecars.
+    """
+
+    def __init__(self, directory, max_age_days=DEFAULT_MAX_AGE_DAYS, max_total_bytes=DEFAULT_MAX_TOTAL_BYTES):
+        self.directory = directory
+        self.max_age_days = max_age_days
+        self.max_total_bytes = max_total_bytes
+        self._entries = {}
+        self._dirty = False
+        self._load()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, MANIFEST_FILE_NAME)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as manifest_file:
+                data = json.load(manifest_file)
+        except Exception:
+            return
+        version = (data or {}).get("version")
+        if version == 1:
+            # Version 1 held one file per entry; keep those families reachable for eviction.
+            for content_hash, entry in (data.get("entries") or {}).items():
+                entry = dict(entry)
+                entry["files"] = [entry.pop("file")] if entry.get("file") else []
+                entry["family_names"] = [entry.pop("family_name")] if entry.get("family_name") else []
+                self._entries[content_hash] = entry
+            self._dirty = True
+            return
+        if version != FAMILY_CACHE_VERSION:
+            return
+        self._entries = dict(data.get("entries") or {})
+
+    def family_path(self, family_name):
+        return os.path.join(self.directory, "{}.rfa".format(family_name))
+
+    def lookup(self, content_hash):
+        """Paths of every family file for content_hash, or None unless all of them are still on disk."""
+        entry = self._entries.get(content_hash)
+        if not entry:
+            return None
+        paths = [os.path.join(self.directory, file_name) for file_name in entry.get("files") or []]
+        if not paths or not all(os.path.isfile(path) for path in paths):
+            self._entries.pop(content_hash, None)
+            self._dirty = True
+            return None
+        entry["last_used"] = int(time.time())
+        self._dirty = True
+        return paths
+
+    def add(self, content_hash, paths, family_names):
+        now = int(time.time())
+        self._entries[content_hash] = {
+            "files": [os.path.basename(path) for path in paths],
+            "family_names": list(family_names),
+            "bytes": sum(_file_size(path) for path in paths),
+            "created": now,
+            "last_used": now,
+        }
+        self._dirty = True
+
+    def _remove(self, content_hash):
+        entry = self._entries.pop(content_hash, None) or {}
+        for file_name in entry.get("files") or []:
+            family_path = os.path.join(self.directory, file_name)
+            _remove_quietly(family_path)
+            _remove_quietly(os.path.splitext(family_path)[0] + ".json")
+        self._dirty = True
+
+    def evict(self, now=None):
+        now = int(now if now is not None else time.time())
+        removed = 0
+        if self.max_age_days:
+            cutoff = now - int(float(self.max_age_days) * 86400)
+            for content_hash, entry in list(self._entries.items()):
+                if int(entry.get("last_used") or 0) < cutoff:
+                    self._remove(content_hash)
+                    removed += 1
+
+        if self.max_total_bytes:
+            ordered = sorted(self._entries.items(), key=lambda item: int(item[1].get("last_used") or 0))
+            total_bytes = sum(int(entry.get("bytes") or 0) for _, entry in ordered)
+            for content_hash, entry in ordered:
+                if total_bytes <= self.max_total_bytes:
+                    break
+                total_bytes -= int(entry.get("bytes") or 0)
+                self._remove(content_hash)
+                removed += 1
+        return removed
+
+    def save(self):
+        if not self._dirty:
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as manifest_file:
+                json.dump({"version": FAMILY_CACHE_VERSION, "entries": self._entries}, manifest_file, indent=2, sort_keys=True)
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+            os.rename(temp_path, self.path)
+            self._dirty = False
+        except Exception:
+            pass
@@ -0,0 +1,325 @@
+import math
+from collections import deque
+
+from context_core.rings import EARTH_RADIUS_M, Ring
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def meters_per_degree(center_lat):
+    meters_per_degree_lat = 111320.0
+    meters_per_degree_lon = max(1e-9, meters_per_degree_lat * math.cos(math.radians(center_lat)))
+    return meters_per_degree_lat, meters_per_degree_lon
+
+
+def calculate_square_bounds(center_lat, center_lon, radius_m):
+    lat_rad = math.radians(center_lat)
+    meters_per_degree_lat = 111320.0
+    meters_per_degree_lon = max(1e-9, meters_per_degree_lat * math.cos(lat_rad))
+    delta_lat = radius_m / meters_per_degree_lat
+    delta_lon = radius_m / meters_per_degree_lon
+    return (
+        center_lat - delta_lat,
+        center_lon - delta_lon,
+        center_lat + delta_lat,
+        center_lon + delta_lon,
+    )
+
+
+def point_key(point):
+    return (round(point[0], 8), round(point[1], 8))
+
+
+def geometry_to_points(geometry):
+    points = []
+    for item in geometry or []:
+        try:
+            if isinstance(item, dict):
+                points.append((float(item["lat"]), float(item["lon"])))
+            else:
+                points.append((float(item[0]), float(item[1])))
+        except Exception:
+            continue
+    return points
+
+
+def close_ring(points):
+    clean = [point for point in (points or []) if point is not None]
+    if len(clean) < 3:
+        return clean
+    if point_key(clean[0]) != point_key(clean[-1]):
+        clean.append(clean[0])
+    return clean
+
+
+def _member_segments(members, role_name):
+    segments = []
+    for member in members or []:
+        if (member.get("type") or "").lower() != "way":
+            continue
+
+        role = (member.get("role") or "").strip().lower()
+        if role_name == "inner":
+            if role != "inner":
+                continue
+        elif role == "inner":
+            continue
+
+        points = geometry_to_points(member.get("geometry"))
+        if len(points) < 2:
+            continue
+        segments.append(points)
+    return segments
+
+
+def stitch_segments(segments, endpoint_keys):
+    """Join segments that share endpoints into chains.
+
+    endpoint_keys[i] is the (start, end) key pair of segments[i]. Chains grow
+    greedily in segment order: each step takes the earliest unused segment
+    touching either chain end. Candidates come from an endpoint to segment
+    index map rather than a rescan of every remaining segment. Returns every
+    chain, closed or not.
+    """
+    segments_by_endpoint = {}
+    for index, (start_key, end_key) in enumerate(endpoint_keys):
+        segments_by_endpoint.setdefault(start_key, deque()).append(index)
+        if end_key != start_key:
+            segments_by_endpoint.setdefault(end_key, deque()).append(index)
+    used = [False] * len(segments)
+
+    def _first_unused(key):
+        queue = segments_by_endpoint.get(key)
+        while queue and used[queue[0]]:
+            queue.popleft()
+        return queue[0] if queue else None
+
+    chains = []
+    next_start = 0
+    while True:
+        while next_start < len(segments) and used[next_start]:
+            next_start += 1
+        if next_start >= len(segments):
+            break
+
+        used[next_start] = True
+        chain = deque(segments[next_start])
+        chain_start, chain_end = endpoint_keys[next_start]
+        while chain_start != chain_end:
+            candidates = [index for index in (_first_unused(chain_end), _first_unused(chain_start)) if index is not None]
+            if not candidates:
+                break
+
+            index = min(candidates)
+            candidate = segments[index]
+            candidate_start, candidate_end = endpoint_keys[index]
+            if chain_end == candidate_start:
+                chain.extend(candidate[1:])
+                chain_end = candidate_end
+            elif chain_end == candidate_end:
+                chain.extend(reversed(candidate[:-1]))
+                chain_end = candidate_start
+            elif chain_start == candidate_end:
+                chain.extendleft(reversed(candidate[:-1]))
+                chain_start = candidate_start
+            else:
+                chain.extendleft(candidate[1:])
+                chain_start = candidate_end
+            used[index] = True
+        chains.append(list(chain))
+
+    return chains
+
+
+def assemble_geometry_rings(members, role_name):
+    """Stitch relation member ways into closed rings (see stitch_segments)."""
+    segments = _member_segments(members, role_name)
+    endpoint_keys = [(point_key(segment[0]), point_key(segment[-1])) for segment in segments]
+    rings = []
+    for chain in stitch_segments(segments, endpoint_keys):
+        chain = close_ring(chain)
+        unique_points = {point_key(point) for point in chain[:-1]} if len(chain) > 1 else set()
+        if len(chain) >= 4 and len(unique_points) >= 3:
+            rings.append(chain)
+
+    return rings
+
+
+def ring_bounds(ring):
+    """(min first, min second, max first, max second) of a ring's coordinate pairs."""
+    if isinstance(ring, Ring):
+        return ring.bounds()
+    if not ring:
+        return None
+    firsts = [point[0] for point in ring]
+    seconds = [point[1] for point in ring]
+    return min(firsts), min(seconds), max(firsts), max(seconds)
+
+
+def point_in_bounds(point, bounds):
+    return bounds is not None and bounds[0] <= point[0] <= bounds[2] and bounds[1] <= point[1] <= bounds[3]
+
+
+def point_in_ring_latlon(point, ring):
+    if isinstance(ring, Ring):
+        return ring.contains_latlon(point[0], point[1])
+    x = point[1]
+    y = point[0]
+    inside = False
+    for index in range(len(ring) - 1):
+        x1 = ring[index][1]
+        y1 = ring[index][0]
+        x2 = ring[index + 1][1]
+        y2 = ring[index + 1][0]
+        intersects = (y1 > y) != (y2 > y)
+        if not intersects:
+            continue
+        slope_x = ((x2 - x1) * (y - y1) / ((y2 - y1) or 1e-12)) + x1
+        if x < slope_x:
+            inside = not inside
+    return inside
+
+
+def latlon_ring_centroid(ring):
+    if isinstance(ring, Ring):
+        return ring.centroid_latlon()
+    if not ring:
+        return None
+
+    points = ring[:-1] if len(ring) > 1 and point_key(ring[0]) == point_key(ring[-1]) else ring
+    if len(points) < 3:
+        return points[0] if points else None
+
+    area = 0.0
+    centroid_lat = 0.0
+    centroid_lon = 0.0
+    for index in range(len(points)):
+        lat1, lon1 = points[index]
+        lat2, lon2 = points[(index + 1) % len(points)]
+        cross = (lon1 * lat2) - (lon2 * lat1)
+        area += cross
+        centroid_lon += (lon1 + lon2) * cross
+        centroid_lat += (lat1 + lat2) * cross
+
+    if abs(area) <= 1e-9:
+        return (
+            sum(point[0] for point in points) / float(len(points)),
+            sum(point[1] for point in points) / float(len(points)),
+        )
+
+    area *= 0.5
+    return centroid_lat / (6.0 * area), centroid_lon / (6.0 * area)
+
+
+def project_latlon(lat, lon, origin_lat, origin_lon):
+    earth_radius_m = 6378137.0
+    lat_rad = math.radians(lat)
+    lon_rad = math.radians(lon)
+    origin_lat_rad = math.radians(origin_lat)
+    origin_lon_rad = math.radians(origin_lon)
+    x_m = (lon_rad - origin_lon_rad) * math.cos(origin_lat_rad) * earth_radius_m
+    y_m = (lat_rad - origin_lat_rad) * earth_radius_m
+    return x_m, y_m
+
+
+def project_ring(ring, origin_lat, origin_lon):
+    if isinstance(ring, Ring):
+        return ring.projected(origin_lat, origin_lon).points()
+    return [project_latlon(point[0], point[1], origin_lat, origin_lon) for point in ring or []]
+
+
+def project_way_points(way, origin_lat, origin_lon):
+    points = geometry_to_points(way.get("geometry"))
+    projected = [project_latlon(point[0], point[1], origin_lat, origin_lon) for point in points]
+    return remove_duplicate_xy(projected, tolerance_m=0.05)
+
+
+def project_polylines(polylines, origin_lat, origin_lon):
+    """Project lists of (lat, lon) points in one pass, vectorised when NumPy is available."""
+    polylines = [line for line in polylines or []]
+    origin_lat_rad = math.radians(origin_lat)
+    origin_lon_rad = math.radians(origin_lon)
+    cos_origin_lat = math.cos(origin_lat_rad)
+
+    if numpy is None:
+        radians = math.radians
+        return [
+            [((radians(point[1]) - origin_lon_rad) * cos_origin_lat * EARTH_RADIUS_M, (radians(point[0]) - origin_lat_rad) * EARTH_RADIUS_M) for point in line or []]
+            for line in polylines
+        ]
+
+    counts = [len(line or ()) for line in polylines]
+    latlons = numpy.array([(point[0], point[1]) for line in polylines for point in line or []], dtype=float).reshape(-1, 2)
+    xs = ((numpy.radians(latlons[:, 1]) - origin_lon_rad) * cos_origin_lat * EARTH_RADIUS_M).tolist()
+    ys = ((numpy.radians(latlons[:, 0]) - origin_lat_rad) * EARTH_RADIUS_M).tolist()
+    points = list(zip(xs, ys))
+
+    projected = []
+    start = 0
+    for count in counts:
+        projected.append(points[start:start + count])
+        start += count
+    return projected
+
+
+def project_ways(ways, origin_lat, origin_lon):
+    """Batch form of project_way_points for a list of ways."""
+    polylines = project_polylines([geometry_to_points(way.get("geometry")) for way in ways or []], origin_lat, origin_lon)
+    return [remove_duplicate_xy(points, tolerance_m=0.05) for points in polylines]
+
+
+def remove_duplicate_xy(points, tolerance_m=0.05):
+    cleaned = []
+    for point in points or []:
+        if not cleaned:
+            cleaned.append(point)
+            continue
+
+        prev_x, prev_y = cleaned[-1]
+        curr_x, curr_y = point
+        if math.hypot(curr_x - prev_x, curr_y - prev_y) > tolerance_m:
+            cleaned.append(point)
+
+    if len(cleaned) > 1:
+        first_x, first_y = cleaned[0]
+        last_x, last_y = cleaned[-1]
+        if math.hypot(first_x - last_x, first_y - last_y) <= tolerance_m:
+            cleaned[-1] = cleaned[0]
+
+    return cleaned
+
+
+def signed_area_xy(points):
+    area = 0.0
+    for index in range(len(points) - 1):
+        x1, y1 = points[index]
+        x2, y2 = points[index + 1]
+        area += (x1 * y2) - (x2 * y1)
+    return area / 2.0
+
+
+def orient_ring(points, clockwise):
+    area = signed_area_xy(points)
+    is_clockwise = area < 0
+    if is_clockwise != clockwise:
+        return list(reversed(points))
+    return points
+
+
+def point_in_ring_xy(point, ring):
+    x = point[0]
+    y = point[1]
+    inside = False
+    for index in range(len(ring) - 1):
+        x1, y1 = ring[index]
+        x2, y2 = ring[index + 1]
+        intersects = (y1 > y) != (y2 > y)
+        if not intersects:
+            continue
+        slope_x = ((x2 - x1) * (y - y1) / ((y2 - y1) or 1e-12)) + x1
+        if x < slope_x:
+            inside = not inside
+    return inside
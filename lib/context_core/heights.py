@@ -0,0 +1,127 @@
+import math
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except Exception:
+    ThreadPoolExecutor = None
+
+from context_core.cache import cache_key
+from context_core.geometry import latlon_ring_centroid, point_key
+
+
+DEFAULT_SAMPLE_POINT_LIMIT = 9
+DEFAULT_MIN_HEIGHT_M = 3.0
+DEFAULT_MAX_HEIGHT_M = 120.0
+
+
+def feature_sample_points(feature, limit=DEFAULT_SAMPLE_POINT_LIMIT):
+    """Centroid plus evenly spaced outline vertices, at most limit distinct points."""
+    samples = []
+    sample_keys = set()
+
+    def _add_sample(point):
+        if point is None or len(point) < 2:
+            return
+        key = (round(float(point[0]), 7), round(float(point[1]), 7))
+        if key in sample_keys:
+            return
+        sample_keys.add(key)
+        samples.append((float(point[0]), float(point[1])))
+
+    outer_ring = feature.get("outer") or []
+    _add_sample(latlon_ring_centroid(outer_ring))
+
+    outer_points = outer_ring[:-1] if len(outer_ring) > 1 and point_key(outer_ring[0]) == point_key(outer_ring[-1]) else list(outer_ring)
+    if outer_points:
+        step = max(1, int(math.floor(len(outer_points) / float(max(1, limit - 1)))))
+        for index in range(0, len(outer_points), step):
+            _add_sample(outer_points[index])
+            if len(samples) >= limit:
+                break
+
+    return samples[:limit]
+
+
+def height_from_samples(dtm_values, dsm_values, min_height_m=DEFAULT_MIN_HEIGHT_M, max_height_m=DEFAULT_MAX_HEIGHT_M):
+    """Highest DSM return minus median DTM, clamped; None when either side is empty."""
+    dtm_samples = sorted(float(value) for value in dtm_values or [] if value is not None)
+    dsm_samples = sorted(float(value) for value in dsm_values or [] if value is not None)
+    if not dtm_samples or not dsm_samples:
+        return None
+
+    height_m = dsm_samples[-1] - dtm_samples[len(dtm_samples) // 2]
+    if height_m <= 0:
+        return None
+    return max(min_height_m, min(max_height_m, height_m))
+
+
+def feature_revision(feature):
+    """Cache key for a feature's resolved height: OSM id and a digest of its outline.
+
+    OSM versions are not used: moving a way's nodes does not bump the way's
+    version, nor does editing a member way bump its relation's.
+    """
+    feature_id = feature.get("id") or "building"
+    outline = [(round(point[0], 7), round(point[1], 7)) for point in feature.get("outer") or []]
+    return "{}@{}".format(feature_id, cache_key(outline)[:16])
+
+
+def _sample_all(sample_elevations, points):
+    if not points:
+        return []
+    try:
+        return sample_elevations(points)
+    except Exception:
+        return [None] * len(points)
+
+
+def resolve_dsm_dtm_heights(
+    features,
+    sample_dtm,
+    sample_dsm,
+    cache=None,
+    sample_limit=DEFAULT_SAMPLE_POINT_LIMIT,
+    min_height_m=DEFAULT_MIN_HEIGHT_M,
+    max_height_m=DEFAULT_MAX_HEIGHT_M,
+):
+    """Resolve DSM minus DTM heights for many buildings with one batch per surface.
+
+    sample_dtm(points) and sample_dsm(points) take every sample point of every
+    uncached feature at once and return elevations in order; both surfaces are
+    sampled concurrently. cache maps feature_revision() to a height and gains
+    the newly resolved heights. Returns {feature id: height or None}.
+    """
+    heights = {}
+    pending = []
+    for feature in features or []:
+        feature_id = feature.get("id") or "building"
+        revision = feature_revision(feature)
+        if cache is not None and cache.get(revision) is not None:
+            heights[feature_id] = float(cache[revision])
+            continue
+        points = feature_sample_points(feature, sample_limit)
+        if not points:
+            heights[feature_id] = None
+            continue
+        pending.append((feature_id, revision, points))
+
+    all_points = [point for _, _, points in pending for point in points]
+    if ThreadPoolExecutor is not None and all_points:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            dtm_future = executor.submit(_sample_all, sample_dtm, all_points)
+            dsm_future = executor.submit(_sample_all, sample_dsm, all_points)
+            dtm_values = dtm_future.result()
+            dsm_values = dsm_future.result()
+    else:
+        dtm_values = _sample_all(sample_dtm, all_points)
+        dsm_values = _sample_all(sample_dsm, all_points)
+
+    start = 0
+    for feature_id, revision, points in pending:
+        end = start + len(points)
+        height_m = height_from_samples(dtm_values[start:end], dsm_values[start:end], min_height_m, max_height_m)
+        start = end
+        heights[feature_id] = height_m
+        if height_m is not None and cache is not None:
+            cache[revision] = height_m
+    return heights
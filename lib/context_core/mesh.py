@@ -0,0 +1,189 @@
+import math
+
+
+DEFAULT_WELD_TOLERANCE = 1e-4
+DEFAULT_ANGLE_TOLERANCE_DEG = 0.1
+
+
+class VertexWelder(object):
+    """Merges 3D points within tolerance onto the first point seen, through a grid hash.
+
+    Cells are twice the tolerance wide, so each lookup checks the point's own
+    cell and the seven neighbours on its nearer sides.
+    """
+
+    def __init__(self, tolerance=DEFAULT_WELD_TOLERANCE):
+        self.tolerance = float(tolerance) or 1e-9
+        self._tolerance2 = self.tolerance * self.tolerance
+        self._cell_size = self.tolerance * 2.0
+        self._cells = {}
+        self.vertices = []
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def add(self, point):
+        cells = []
+        home = []
+        for axis in range(3):
+            scaled = point[axis] / self._cell_size
+            cell = int(math.floor(scaled))
+            home.append(cell)
+            cells.append((cell, cell + 1 if scaled - cell >= 0.5 else cell - 1))
+        best = None
+        best_distance2 = self._tolerance2
+        for cell_x in cells[0]:
+            for cell_y in cells[1]:
+                for cell_z in cells[2]:
+                    for index in self._cells.get((cell_x, cell_y, cell_z), ()):
+                        vertex = self.vertices[index]
+                        distance2 = ((vertex[0] - point[0]) ** 2) + ((vertex[1] - point[1]) ** 2) + ((vertex[2] - point[2]) ** 2)
+                        if distance2 <= best_distance2:
+                            best = index
+                            best_distance2 = distance2
+        if best is not None:
+            return best
+
+        index = len(self.vertices)
+        self.vertices.append((float(point[0]), float(point[1]), float(point[2])))
+        self._cells.setdefault(tuple(home), []).append(index)
+        return index
+
+
+def weld_triangles(points, triangles, tolerance=DEFAULT_WELD_TOLERANCE):
+    """Weld (x, y, z) points within tolerance and remap index triangles onto them.
+
+    Triangles that collapse onto fewer than three vertices and repeats of a
+    triangle already seen are dropped. Returns (vertices, triangles, stats).
+    """
+    welder = VertexWelder(tolerance)
+    remap = [welder.add(point) for point in points or []]
+    stats = {"points": len(remap), "triangles": 0, "degenerate": 0, "duplicates": 0}
+    welded = []
+    seen = set()
+    for triangle in triangles or []:
+        stats["triangles"] += 1
+        a, b, c = remap[triangle[0]], remap[triangle[1]], remap[triangle[2]]
+        if a == b or b == c or a == c:
+            stats["degenerate"] += 1
+            continue
+        key = tuple(sorted((a, b, c)))
+        if key in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(key)
+        welded.append((a, b, c))
+    stats["vertices"] = len(welder)
+    return welder.vertices, welded, stats
+
+
+def _plane(vertices, triangle):
+    a, b, c = [vertices[index] for index in triangle]
+    ux, uy, uz = b[0] - a[0], b[1] - a[1], b[2] - a[2]
+    vx, vy, vz = c[0] - a[0], c[1] - a[1], c[2] - a[2]
+    nx, ny, nz = (uy * vz) - (uz * vy), (uz * vx) - (ux * vz), (ux * vy) - (uy * vx)
+    length = math.sqrt((nx * nx) + (ny * ny) + (nz * nz))
+    if length <= 1e-18:
+        return None
+    nx, ny, nz = nx / length, ny / length, nz / length
+    return nx, ny, nz, (nx * a[0]) + (ny * a[1]) + (nz * a[2])
+
+
+def _boundary_loop(triangles, members):
+    """The single boundary loop of a patch of triangles, or None when it has holes or pinches."""
+    directed = set()
+    for member in members:
+        a, b, c = triangles[member]
+        directed.update(((a, b), (b, c), (c, a)))
+    following = {}
+    for start, end in directed:
+        if (end, start) in directed:
+            continue
+        if start in following:
+            return None
+        following[start] = end
+    if not following:
+        return None
+
+    first = next(iter(following))
+    loop = [first]
+    current = following[first]
+    while current != first:
+        if current not in following or len(loop) > len(following):
+            return None
+        loop.append(current)
+        current = following[current]
+    return loop if len(loop) == len(following) else None
+
+
+def merge_coplanar(vertices, triangles, angle_tolerance_deg=DEFAULT_ANGLE_TOLERANCE_DEG, distance_tolerance=DEFAULT_WELD_TOLERANCE):
+    """Merge edge-connected coplanar triangles into polygon faces.
+
+    Patches grow from a seed triangle and only take neighbours within the
+    angle and distance tolerance of the seed's plane, so gently curved
+    surfaces do not drift into one non-planar polygon. A patch whose
+    boundary is not a single simple loop stays as triangles. Polygons keep
+    the triangles' winding. Returns (faces as vertex index lists, stats).
+    """
+    min_dot = math.cos(math.radians(angle_tolerance_deg))
+    planes = [_plane(vertices, triangle) for triangle in triangles]
+    edge_faces = {}
+    for index, (a, b, c) in enumerate(triangles):
+        for start, end in ((a, b), (b, c), (c, a)):
+            edge_faces.setdefault((start, end), []).append(index)
+
+    patch_of = [None] * len(triangles)
+    faces = []
+    stats = {"triangles": len(triangles), "faces": 0, "merged_patches": 0, "unmerged_patches": 0}
+    for seed, seed_plane in enumerate(planes):
+        if patch_of[seed] is not None:
+            continue
+        patch_of[seed] = seed
+        members = [seed]
+        if seed_plane is not None:
+            nx, ny, nz, offset = seed_plane
+            stack = [seed]
+            while stack:
+                a, b, c = triangles[stack.pop()]
+                for start, end in ((a, b), (b, c), (c, a)):
+                    for neighbour in edge_faces.get((end, start), ()):
+                        plane = planes[neighbour]
+                        if patch_of[neighbour] is not None or plane is None:
+                            continue
+                        if (plane[0] * nx) + (plane[1] * ny) + (plane[2] * nz) < min_dot:
+                            continue
+                        far = [vertices[vertex] for vertex in triangles[neighbour]]
+                        if any(abs((point[0] * nx) + (point[1] * ny) + (point[2] * nz) - offset) > distance_tolerance for point in far):
+                            continue
+                        patch_of[neighbour] = seed
+                        members.append(neighbour)
+                        stack.append(neighbour)
+
+        if len(members) == 1:
+            faces.append(list(triangles[seed]))
+            continue
+        loop = _boundary_loop(triangles, members)
+        if loop is None:
+            stats["unmerged_patches"] += 1
+            faces.extend(list(triangles[member]) for member in members)
+        else:
+            stats["merged_patches"] += 1
+            faces.append(loop)
+
+    stats["faces"] = len(faces)
+    return faces, stats
+
+
+def weld_and_merge(points, triangles, tolerance=DEFAULT_WELD_TOLERANCE, angle_tolerance_deg=DEFAULT_ANGLE_TOLERANCE_DEG):
+    """weld_triangles then merge_coplanar; returns (vertices, faces, stats) with both stages' counts."""
+    vertices, welded, weld_stats = weld_triangles(points, triangles, tolerance)
+    faces, merge_stats = merge_coplanar(vertices, welded, angle_tolerance_deg, tolerance)
+    stats = dict(weld_stats)
+    stats.update({
+        "input_triangles": weld_stats["triangles"],
+        "triangles": len(welded),
+        "faces": merge_stats["faces"],
+        "merged_patches": merge_stats["merged_patches"],
+        "unmerged_patches": merge_stats["unmerged_patches"],
+    })
+    return vertices, faces, stats
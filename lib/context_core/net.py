@@ -0,0 +1,101 @@
+import codecs
+import json
+import threading
+import time
+
+from WWP_compat import Request, decode_to_text, urllib_parse, urlopen
+
+
+_THROTTLES = {}
+_THROTTLES_LOCK = threading.Lock()
+
+
+def http_get_text(url, user_agent, timeout_sec=20):
+    request = Request(url, headers={"User-Agent": user_agent})
+    response = urlopen(request, timeout=timeout_sec)
+    try:
+        return decode_to_text(response.read(), "utf-8")
+    finally:
+        response.close()
+
+
+def http_get_json(url, user_agent, timeout_sec=20):
+    return json.loads(http_get_text(url, user_agent, timeout_sec))
+
+
+def http_post_text(url, body_text, user_agent, timeout_sec=20):
+    payload = urllib_parse.urlencode({"data": body_text}).encode("utf-8")
+    request = Request(
+        url,
+        data=payload,
+        headers={"User-Agent": user_agent, "Content-Type": "application/x-www-form-urlencoded"},
+    )
+    response = urlopen(request, timeout=timeout_sec)
+    try:
+        return decode_to_text(response.read(), "utf-8")
+    finally:
+        response.close()
+
+
+def iter_response_text(response, chunk_size=65536):
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    while True:
+        data = response.read(chunk_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b"", True)
+    if tail:
+        yield tail
+
+
+def http_post_text_chunks(url, body_text, user_agent, timeout_sec=20, chunk_size=65536):
+    """Like http_post_text, but yields the decoded body as it downloads."""
+    payload = urllib_parse.urlencode({"data": body_text}).encode("utf-8")
+    request = Request(
+        url,
+        data=payload,
+        headers={"User-Agent": user_agent, "Content-Type": "application/x-www-form-urlencoded"},
+    )
+    response = urlopen(request, timeout=timeout_sec)
+    try:
+        for text in iter_response_text(response, chunk_size):
+            yield text
+    finally:
+        response.close()
+
+
+class RequestThrottle(object):
+    """Context manager capping concurrent requests and spacing out their starts."""
+
+    def __init__(self, max_concurrent=2, min_interval_sec=1.0):
+        self._semaphore = threading.BoundedSemaphore(max(1, int(max_concurrent)))
+        self._min_interval = max(0.0, float(min_interval_sec))
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        with self._lock:
+            now = time.time()
+            wait_sec = self._next_start - now
+            self._next_start = max(now, self._next_start) + self._min_interval
+        if wait_sec > 0:
+            time.sleep(wait_sec)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self._semaphore.release()
+        return False
+
+
+def throttle_for(url, max_concurrent=2, min_interval_sec=1.0):
+    key = (url or "", int(max_concurrent), float(min_interval_sec))
+    with _THROTTLES_LOCK:
+        throttle = _THROTTLES.get(key)
+        if throttle is None:
+            throttle = RequestThrottle(max_concurrent, min_interval_sec)
+            _THROTTLES[key] = throttle
+    return throttle
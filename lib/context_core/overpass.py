@@ -0,0 +1,416 @@
+import json
+import random
+import re
+import time
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except Exception:
+    ThreadPoolExecutor = None
+
+from context_core.cache import cache_key, read_cache_json, write_cache_json
+from context_core.classify import (
+    PEDESTRIAN_HIGHWAYS,
+    is_building_tag,
+    is_park_tag,
+    is_parcel_tag,
+    is_track_tag,
+    is_water_tag,
+)
+from context_core.geometry import calculate_square_bounds, geometry_to_points
+from context_core.net import http_post_text_chunks, throttle_for
+from context_core.terrain import host_of
+from context_core.tiles import bounds_intersect, tile_bounds, tiles_for_bounds
+
+
+# Worldwide mirrors only: tiles are spread across the rotation, so a regional
+# mirror would answer empty for every tile outside its region.
+OVERPASS_ENDPOINTS = [
+    "https://overpass-api.de/api/interpreter",
+    "https://overpass.kumi.systems/api/interpreter",
+    "https://lz4.overpass-api.de/api/interpreter",
+    "https://z.overpass-api.de/api/interpreter",
+]
+MAX_FAILURES_IN_REPORT = 30
+LAYER_CACHE_VERSION = 3
+TILE_ZOOM = 15
+TILE_MAX_WORKERS = 4
+ENDPOINT_MAX_CONCURRENT = 2
+ENDPOINT_MIN_INTERVAL_SEC = 1.0
+RETRY_MAX_ROUNDS = 3
+RETRY_BACKOFF_BASE_SEC = 2.0
+RETRY_BACKOFF_MAX_SEC = 30.0
+AREA_LAYER_PREDICATES = (
+    ("buildings", is_building_tag),
+    ("parcels", is_parcel_tag),
+    ("parks", is_park_tag),
+    ("water", is_water_tag),
+)
+ALL_LAYERS = dict((layer_name, True) for layer_name in ("buildings", "parcels", "parks", "water", "roads", "tracks"))
+
+_ELEMENTS_ARRAY = re.compile(r'"elements"\s*:\s*\[')
+_ARRAY_SEPARATORS = " \t\r\n,"
+
+
+def build_overpass_query(bounds):
+    min_lat, min_lon, max_lat, max_lon = bounds
+    return """
+[out:json][timeout:90];
+(
+  way({south},{west},{north},{east})["building"];
+  relation({south},{west},{north},{east})["building"];
+  way({south},{west},{north},{east})["building:part"];
+  relation({south},{west},{north},{east})["building:part"];
+  way({south},{west},{north},{east})["highway"];
+  way({south},{west},{north},{east})["leisure"="park"];
+  relation({south},{west},{north},{east})["leisure"="park"];
+  way({south},{west},{north},{east})["landuse"~"grass|recreation_ground|village_green|greenfield"];
+  relation({south},{west},{north},{east})["landuse"~"grass|recreation_ground|village_green|greenfield"];
+  way({south},{west},{north},{east})["natural"="water"];
+  relation({south},{west},{north},{east})["natural"="water"];
+  way({south},{west},{north},{east})["water"];
+  relation({south},{west},{north},{east})["water"];
+  way({south},{west},{north},{east})["landuse"~"reservoir|basin"];
+  relation({south},{west},{north},{east})["landuse"~"reservoir|basin"];
+  way({south},{west},{north},{east})["waterway"];
+  way({south},{west},{north},{east})["railway"~"rail|light_rail|tram|subway|narrow_gauge"];
+  way({south},{west},{north},{east})["boundary"="cadastral"];
+  relation({south},{west},{north},{east})["boundary"="cadastral"];
+  way({south},{west},{north},{east})["parcel"];
+  relation({south},{west},{north},{east})["parcel"];
+);
+out body geom;
+""".strip().format(
+        south=min_lat,
+        west=min_lon,
+        north=max_lat,
+        east=max_lon,
+    )
+
+
+def iter_overpass_elements(chunks):
+    """Yield the elements of an Overpass JSON response as the text arrives.
+
+    Only the current element is held in memory; everything outside the
+    top-level "elements" array is skipped.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    in_array = False
+    exhausted = False
+    chunk_iter = iter(chunks)
+    while True:
+        if not in_array:
+            match = _ELEMENTS_ARRAY.search(buffer)
+            if match is not None:
+                position = match.end()
+                in_array = True
+
+        if in_array:
+            while position < len(buffer) and buffer[position] in _ARRAY_SEPARATORS:
+                position += 1
+            if position < len(buffer):
+                if buffer[position] == "]":
+                    return
+                try:
+                    element, position_end = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    if exhausted:
+                        raise
+                else:
+                    position = position_end
+                    yield element
+                    continue
+
+        if exhausted:
+            if in_array:
+                raise ValueError("Overpass response ended inside the elements array.")
+            raise ValueError("Overpass response has no elements array.")
+
+        try:
+            chunk = next(chunk_iter)
+        except StopIteration:
+            exhausted = True
+            continue
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def _compact_geometry(geometry):
+    return [[point[0], point[1]] for point in geometry_to_points(geometry)]
+
+
+def compact_element(element):
+    element_type = (element.get("type") or "").lower()
+    compact = {"type": element_type, "id": element.get("id"), "tags": element.get("tags") or {}}
+    if element_type == "way":
+        compact["geometry"] = _compact_geometry(element.get("geometry"))
+    elif element_type == "relation":
+        compact["members"] = [
+            {
+                "type": "way",
+                "ref": member.get("ref"),
+                "role": member.get("role") or "",
+                "geometry": _compact_geometry(member.get("geometry")),
+            }
+            for member in element.get("members") or []
+            if (member.get("type") or "").lower() == "way"
+        ]
+    return compact
+
+
+def _element_bounds(element):
+    geometries = [element.get("geometry")] if "geometry" in element else [
+        member.get("geometry") for member in element.get("members") or []
+    ]
+    lats = []
+    lons = []
+    for geometry in geometries:
+        for lat, lon in geometry_to_points(geometry):
+            lats.append(lat)
+            lons.append(lon)
+    if not lats:
+        return None
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+class OverpassLayers(object):
+    """Overpass elements classified into the layers selected in the dialog.
+
+    Elements are compacted and dropped as they are added, so only geometry
+    for selected layers is kept; to_compact() is what gets cached.
+    """
+
+    def __init__(self, selected_layers=None):
+        selected_layers = selected_layers or {}
+        self.layer_names = sorted(name for name, enabled in selected_layers.items() if enabled)
+        self._area_predicates = [
+            predicate for layer_name, predicate in AREA_LAYER_PREDICATES if selected_layers.get(layer_name)
+        ]
+        self._keep_roads = bool(selected_layers.get("roads"))
+        self._keep_tracks = bool(selected_layers.get("tracks"))
+        self._keep_waterways = bool(selected_layers.get("water"))
+        self.element_count = 0
+        self.endpoint = None
+        self.cache_source = None
+        self.ways = {}
+        self.relations = []
+        self.roads = []
+        self.tracks = []
+        self.waterways = []
+        self._merged_ids = {}
+
+    def is_selected_area(self, tags):
+        return any(predicate(tags) for predicate in self._area_predicates)
+
+    def _keeps(self, list_name):
+        if list_name == "relations":
+            return lambda element: self.is_selected_area(element.get("tags") or {})
+        if list_name == "roads":
+            return lambda element: self._keep_roads
+        if list_name == "tracks":
+            return lambda element: self._keep_tracks
+        return lambda element: self._keep_waterways
+
+    def add(self, element):
+        self.element_count += 1
+        element_type = (element.get("type") or "").lower()
+        tags = element.get("tags") or {}
+
+        if element_type == "way":
+            compact = None
+            if self.is_selected_area(tags):
+                compact = compact_element(element)
+                self.ways[str(element.get("id"))] = compact
+
+            highway = (tags.get("highway") or "").strip().lower()
+            if self._keep_roads and highway and highway not in PEDESTRIAN_HIGHWAYS:
+                compact = compact or compact_element(element)
+                self.roads.append(compact)
+
+            if self._keep_tracks and is_track_tag(tags):
+                compact = compact or compact_element(element)
+                self.tracks.append(compact)
+
+            waterway = (tags.get("waterway") or "").strip().lower()
+            if self._keep_waterways and waterway and waterway not in ("dam", "weir", "dock"):
+                compact = compact or compact_element(element)
+                self.waterways.append(compact)
+        elif element_type == "relation" and self.is_selected_area(tags):
+            self.relations.append(compact_element(element))
+
+    def layers(self):
+        return self.ways, self.relations, self.roads, self.tracks, self.waterways
+
+    def merge(self, other):
+        """Add another tile's elements in this instance's selected layers, skipping ids already present."""
+        self.element_count += other.element_count
+        for way_id, way in other.ways.items():
+            if self.is_selected_area(way.get("tags") or {}):
+                self.ways.setdefault(way_id, way)
+        for list_name in ("relations", "roads", "tracks", "waterways"):
+            keep = self._keeps(list_name)
+            target = getattr(self, list_name)
+            seen_ids = self._merged_ids.get(list_name)
+            if seen_ids is None:
+                seen_ids = set(str(element.get("id")) for element in target)
+                self._merged_ids[list_name] = seen_ids
+            for element in getattr(other, list_name):
+                element_id = str(element.get("id"))
+                if element_id in seen_ids or not keep(element):
+                    continue
+                seen_ids.add(element_id)
+                target.append(element)
+
+    def clip_to_bounds(self, bounds):
+        """Drop elements whose geometry box misses a (south, west, north, east) box."""
+
+        def _keep(element):
+            element_bounds = _element_bounds(element)
+            return element_bounds is not None and bounds_intersect(element_bounds, bounds)
+
+        self.ways = dict((way_id, way) for way_id, way in self.ways.items() if _keep(way))
+        for list_name in ("relations", "roads", "tracks", "waterways"):
+            setattr(self, list_name, [element for element in getattr(self, list_name) if _keep(element)])
+        self._merged_ids = {}
+
+    def to_compact(self):
+        return {
+            "endpoint": self.endpoint,
+            "element_count": self.element_count,
+            "layer_names": self.layer_names,
+            "ways": list(self.ways.values()),
+            "relations": self.relations,
+            "roads": self.roads,
+            "tracks": self.tracks,
+            "waterways": self.waterways,
+        }
+
+    @classmethod
+    def from_compact(cls, data):
+        layers = cls(dict((name, True) for name in data.get("layer_names") or []))
+        layers.element_count = int(data.get("element_count") or 0)
+        layers.endpoint = data.get("endpoint")
+        layers.ways = dict((str(way.get("id")), way) for way in data.get("ways") or [])
+        layers.relations = list(data.get("relations") or [])
+        layers.roads = list(data.get("roads") or [])
+        layers.tracks = list(data.get("tracks") or [])
+        layers.waterways = list(data.get("waterways") or [])
+        return layers
+
+
+def _fetch_tile_layers(tile, endpoints, first_endpoint_index, user_agent, timeout_sec, max_rounds):
+    """Fetch every layer of one tile, rotating through endpoints and backing off between rounds.
+
+    An empty answer is a soft failure: the remaining endpoints are tried, and
+    the tile only counts as empty once every endpoint has said so in the same
+    round. Returns (layers or None, cacheable, failures); a tile that came
+    back empty from some endpoints while others failed is used but not cached.
+    """
+    query = build_overpass_query(tile_bounds(*tile))
+    failures = []
+    empty_layers = None
+    for round_index in range(max(1, max_rounds)):
+        empty_count = 0
+        for offset in range(len(endpoints)):
+            endpoint = endpoints[(first_endpoint_index + offset) % len(endpoints)]
+            try:
+                with throttle_for(endpoint, ENDPOINT_MAX_CONCURRENT, ENDPOINT_MIN_INTERVAL_SEC):
+                    layers = OverpassLayers(ALL_LAYERS)
+                    for element in iter_overpass_elements(http_post_text_chunks(endpoint, query, user_agent, timeout_sec=timeout_sec)):
+                        layers.add(element)
+                layers.endpoint = endpoint
+            except Exception as ex:
+                failures.append("{}/{}/{} | {} | {}".format(tile[0], tile[1], tile[2], endpoint, str(ex)))
+                continue
+            if layers.element_count:
+                return layers, True, failures
+            empty_count += 1
+            if empty_layers is None:
+                empty_layers = layers
+        if empty_count == len(endpoints):
+            return empty_layers, True, failures
+        if round_index + 1 < max_rounds:
+            delay_sec = min(RETRY_BACKOFF_MAX_SEC, RETRY_BACKOFF_BASE_SEC * (2 ** round_index))
+            time.sleep(delay_sec * (0.5 + (random.random() * 0.5)))
+    return empty_layers, False, failures
+
+
+def _endpoint_label(endpoint):
+    return host_of(endpoint) or endpoint
+
+
+def fetch_overpass_tiles(
+    center_lat,
+    center_lon,
+    radius_m,
+    selected_layers,
+    user_agent,
+    cache_root=None,
+    endpoints=None,
+    zoom=TILE_ZOOM,
+    max_workers=TILE_MAX_WORKERS,
+    timeout_sec=90,
+    max_rounds=RETRY_MAX_ROUNDS,
+):
+    """Fetch the square around a centre as cached, fixed-zoom Overpass tiles.
+
+    Each tile is cached on its own with every layer, so nearby studies share
+    tiles whatever layers they select. Missing tiles are fetched concurrently,
+    spread across the endpoints, and merged into the selected layers with way
+    and relation ids de-duplicated before clipping to the square.
+    """
+    endpoints = list(endpoints or OVERPASS_ENDPOINTS)
+    bounds = calculate_square_bounds(center_lat, center_lon, radius_m)
+    tiles = tiles_for_bounds(bounds, zoom)
+
+    tile_layers = {}
+    missing = []
+    for tile in tiles:
+        cache_key_value = cache_key("overpass_tile", LAYER_CACHE_VERSION, list(tile))
+        cached = read_cache_json(cache_root, "overpass_tiles", cache_key_value)
+        if cached:
+            layers = OverpassLayers.from_compact(cached)
+            layers.endpoint = "<cache>"
+            tile_layers[tile] = layers
+        else:
+            missing.append((tile, cache_key_value))
+
+    failures = []
+
+    def _fetch(index):
+        tile = missing[index][0]
+        return _fetch_tile_layers(tile, endpoints, index % len(endpoints), user_agent, timeout_sec, max_rounds)
+
+    if ThreadPoolExecutor is not None and max_workers > 1 and len(missing) > 1:
+        with ThreadPoolExecutor(max_workers=max(1, min(int(max_workers), len(missing)))) as executor:
+            results = list(executor.map(_fetch, range(len(missing))))
+    else:
+        results = [_fetch(index) for index in range(len(missing))]
+
+    for (tile, cache_key_value), (layers, cacheable, tile_failures) in zip(missing, results):
+        if layers is None:
+            failures.extend(tile_failures)
+            continue
+        if cacheable:
+            write_cache_json(cache_root, "overpass_tiles", cache_key_value, layers.to_compact())
+        tile_layers[tile] = layers
+
+    if failures:
+        raise Exception("Overpass tiles failed on every endpoint.\n{}".format("\n".join(failures[:MAX_FAILURES_IN_REPORT])))
+
+    merged = OverpassLayers(selected_layers)
+    sources = {}
+    for tile in tiles:
+        layers = tile_layers[tile]
+        merged.merge(layers)
+        label = _endpoint_label(layers.endpoint)
+        sources[label] = sources.get(label, 0) + 1
+    merged.clip_to_bounds(bounds)
+    merged.endpoint = ", ".join(
+        "{} ({} tile{})".format(label, count, "" if count == 1 else "s") for label, count in sorted(sources.items())
+    )
+    if not missing:
+        merged.cache_source = "appdata"
+    return merged
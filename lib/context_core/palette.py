@@ -0,0 +1,22 @@
+CONTEXT_PALETTE = {
+    "buildings": {"name": "WWP Context - Massing", "rgb": (186, 186, 186), "transparency": 0},
+    "roads": {"name": "WWP Context - Road", "rgb": (152, 152, 152), "transparency": 0},
+    "tracks": {"name": "WWP Context - Track", "rgb": (120, 120, 120), "transparency": 0},
+    "parcels": {"name": "WWP Context - Parcel", "rgb": (255, 221, 21), "transparency": 60},
+    "parks": {"name": "WWP Context - Park", "rgb": (143, 188, 143), "transparency": 0},
+    "water": {"name": "WWP Context - Water", "rgb": (173, 216, 230), "transparency": 0},
+    "terrain": {"name": "WWP Context - Curb", "rgb": (225, 225, 225), "transparency": 0},
+}
+CONTEXT_FLOOR_TYPE_SPECS = (
+    ("WWP CONTEXT - ROAD", "roads"),
+    ("WWP CONTEXT - TRACK", "tracks"),
+    ("WWP CONTEXT - PARCEL", "parcels"),
+    ("WWP CONTEXT - PARK", "parks"),
+    ("WWP CONTEXT - WATER", "water"),
+)
+
+
+def legacy_floor_type_suffix(type_name):
+    if not type_name or " - " not in type_name:
+        return None
+    return " - WWP " + type_name.split(" - ")[-1].title()
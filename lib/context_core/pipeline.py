@@ -0,0 +1,197 @@
+import time
+import traceback
+
+
+DEFAULT_CHUNK_SIZE = 200
+
+STATUS_COMPLETED = "completed"
+STATUS_CANCELLED = "cancelled"
+STATUS_FAILED = "failed"
+
+
+def format_duration(seconds):
+    seconds = int(max(0, round(seconds)))
+    if seconds < 60:
+        return "{}s".format(seconds)
+    if seconds < 3600:
+        return "{}m {:02d}s".format(seconds // 60, seconds % 60)
+    return "{}h {:02d}m".format(seconds // 3600, (seconds % 3600) // 60)
+
+
+def estimate_remaining(elapsed_sec, done, total):
+    if done <= 0 or total <= done:
+        return None
+    return elapsed_sec * (total - done) / float(done)
+
+
+class RevitTransactions(object):
+    """TransactionGroup/Transaction scopes for ChunkedPipeline.
+
+    db is the Autodesk.Revit.DB module, passed in so this module stays
+    importable outside Revit. The outer group is assimilated at the end so the
+    whole build is one undo step; each layer gets its own group so a cancelled
+    layer can be rolled back without touching the layers before it.
+    """
+
+    def __init__(self, db, doc, title):
+        self._db = db
+        self._doc = doc
+        self._title = title
+        self._outer = None
+        self._layer = None
+        self._chunk = None
+
+    def begin(self):
+        self._outer = self._db.TransactionGroup(self._doc, self._title)
+        self._outer.Start()
+
+    def begin_layer(self, name):
+        self._layer = self._db.TransactionGroup(self._doc, "{} | {}".format(self._title, name))
+        self._layer.Start()
+
+    def begin_chunk(self, name):
+        self._chunk = self._db.Transaction(self._doc, "{} | {}".format(self._title, name))
+        self._chunk.Start()
+
+    def commit_chunk(self):
+        chunk, self._chunk = self._chunk, None
+        if chunk is not None:
+            chunk.Commit()
+
+    def rollback_chunk(self):
+        chunk, self._chunk = self._chunk, None
+        if chunk is not None and chunk.HasStarted() and not chunk.HasEnded():
+            chunk.RollBack()
+
+    def commit_layer(self):
+        layer, self._layer = self._layer, None
+        if layer is not None:
+            layer.Assimilate()
+
+    def rollback_layer(self):
+        layer, self._layer = self._layer, None
+        if layer is not None and layer.HasStarted() and not layer.HasEnded():
+            layer.RollBack()
+
+    def finish(self, keep):
+        outer, self._outer = self._outer, None
+        if outer is None or not outer.HasStarted() or outer.HasEnded():
+            return
+        if keep:
+            outer.Assimilate()
+        else:
+            outer.RollBack()
+
+
+class ChunkedPipeline(object):
+    """Run build layers item by item, committing every chunk_size items.
+
+    Each layer is (name, items, func); func(item) does the work for one item,
+    records its own per-item failures and returns how many elements it created
+    (True counts as one). created holds those counts per count_key for
+    committed chunks. The progress object
+    is duck-typed after pyRevit's ProgressBar: update_progress(value, max),
+    an optional writable title, and a cancelled flag that is checked between
+    items. On cancel the layer in progress is rolled back and completed layers
+    are kept; an exception escaping func rolls back its layer and stops.
+    failures is the list func appends to; the entries a rolled-back layer
+    added are removed with it, and rolled_back records the layer and what it
+    had created and recorded before the rollback.
+    """
+
+    def __init__(self, transactions, chunk_size=DEFAULT_CHUNK_SIZE, failures=None):
+        self._transactions = transactions
+        self._chunk_size = max(1, int(chunk_size))
+        self._layers = []
+        self.completed_layers = []
+        self.created = {}
+        self.failures = failures if failures is not None else []
+        self.rolled_back = None
+        self.status = None
+        self.error = None
+        self.error_trace = None
+        self.failed_layer = None
+
+    def add_layer(self, name, items, func, count_key=None):
+        self._layers.append((name, list(items or []), func, count_key or name))
+
+    @property
+    def total(self):
+        return sum(len(layer[1]) for layer in self._layers)
+
+    def _report(self, progress, name, done, total, started):
+        if progress is None:
+            return
+        remaining = estimate_remaining(time.time() - started, done, total)
+        text = "{} - {} of {}".format(name, done, total)
+        if remaining is not None:
+            text += " - about {} left".format(format_duration(remaining))
+        try:
+            progress.title = text
+        except Exception:
+            pass
+        try:
+            progress.update_progress(done, total)
+        except Exception:
+            pass
+
+    def _discard_layer(self, name, layer_created, failure_mark):
+        self.rolled_back = {"layer": name, "created": layer_created, "failures": len(self.failures) - failure_mark}
+        del self.failures[failure_mark:]
+
+    def run(self, progress=None):
+        transactions = self._transactions
+        total = max(1, self.total)
+        done = 0
+        started = time.time()
+        self.status = STATUS_COMPLETED
+        transactions.begin()
+        try:
+            for name, items, func, count_key in self._layers:
+                if getattr(progress, "cancelled", False):
+                    self.status = STATUS_CANCELLED
+                    break
+
+                layer_created = 0
+                failure_mark = len(self.failures)
+                transactions.begin_layer(name)
+                try:
+                    for chunk_start in range(0, len(items), self._chunk_size):
+                        chunk = items[chunk_start:chunk_start + self._chunk_size]
+                        transactions.begin_chunk("{} {}-{}".format(name, chunk_start + 1, chunk_start + len(chunk)))
+                        chunk_created = 0
+                        try:
+                            for item in chunk:
+                                if getattr(progress, "cancelled", False):
+                                    self.status = STATUS_CANCELLED
+                                    break
+                                chunk_created += int(func(item) or 0)
+                                done += 1
+                                self._report(progress, name, done, total, started)
+                        except Exception:
+                            transactions.rollback_chunk()
+                            raise
+                        if self.status == STATUS_CANCELLED:
+                            transactions.rollback_chunk()
+                            break
+                        transactions.commit_chunk()
+                        layer_created += chunk_created
+                except Exception as ex:
+                    transactions.rollback_layer()
+                    self._discard_layer(name, layer_created, failure_mark)
+                    self.status = STATUS_FAILED
+                    self.error = ex
+                    self.error_trace = traceback.format_exc()
+                    self.failed_layer = name
+                    break
+
+                if self.status == STATUS_CANCELLED:
+                    transactions.rollback_layer()
+                    self._discard_layer(name, layer_created, failure_mark)
+                    break
+                transactions.commit_layer()
+                self.created[count_key] = self.created.get(count_key, 0) + layer_created
+                self.completed_layers.append(name)
+        finally:
+            transactions.finish(keep=bool(self.completed_layers))
+        return self.status
@@ -0,0 +1,91 @@
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except Exception:
+    ThreadPoolExecutor = None
+
+try:
+    from multiprocessing import cpu_count as _cpu_count
+except Exception:
+    _cpu_count = None
+
+from context_core.geometry import close_ring, orient_ring, point_key, project_ring, remove_duplicate_xy
+
+
+RING_TOLERANCE_M = 0.01
+MAX_WORKERS = 8
+MIN_ITEMS_PER_WORKER = 32
+CHUNKS_PER_WORKER = 4
+
+
+def default_workers():
+    """One worker per core, leaving a core for Revit's UI thread."""
+    try:
+        return max(1, min(MAX_WORKERS, _cpu_count() - 1))
+    except Exception:
+        return 1
+
+
+def clean_ring_xy(points, clockwise, tolerance_m=RING_TOLERANCE_M):
+    """Closed, deduplicated and oriented copy of an XY ring, or None with fewer than three distinct points."""
+    ring = close_ring(remove_duplicate_xy(points, tolerance_m=tolerance_m))
+    unique_points = {point_key(point) for point in ring[:-1]} if len(ring) > 1 else set()
+    if len(ring) < 4 or len(unique_points) < 3:
+        return None
+    return orient_ring(ring, clockwise=clockwise)
+
+
+def polygon_rings_xy(outer_points, inner_rings=None, tolerance_m=RING_TOLERANCE_M):
+    """[outer, inner, ...] cleaned XY rings, outer counter-clockwise and inners clockwise.
+
+    Degenerate inners are dropped; a degenerate outer returns None.
+    """
+    outer = clean_ring_xy(outer_points, False, tolerance_m)
+    if outer is None:
+        return None
+    rings = [outer]
+    for inner_points in inner_rings or []:
+        inner = clean_ring_xy(inner_points, True, tolerance_m)
+        if inner is not None:
+            rings.append(inner)
+    return rings
+
+
+def feature_rings_xy(feature, origin_lat, origin_lon, extra_inner_rings=None):
+    inner_rings = list(feature.get("inners") or [])
+    inner_rings.extend(extra_inner_rings or [])
+    return polygon_rings_xy(
+        project_ring(feature.get("outer") or [], origin_lat, origin_lon),
+        [project_ring(ring, origin_lat, origin_lon) for ring in inner_rings],
+    )
+
+
+def _run_chunk(func, chunk):
+    results = []
+    for item in chunk:
+        try:
+            results.append((func(item), None))
+        except Exception as ex:
+            results.append((None, ex))
+    return results
+
+
+def prepare_items(func, items, max_workers=None):
+    """[(func(item), None) or (None, exception)] for each item, in order.
+
+    Pure-Python preparation ahead of Revit API calls: items are cut into
+    chunks and run on a thread pool when there are enough of them to pay for
+    it, so func must not touch the Revit API or shared mutable state.
+    """
+    items = list(items or [])
+    max_workers = default_workers() if max_workers is None else int(max_workers)
+    worker_count = max(1, min(max_workers, len(items) // MIN_ITEMS_PER_WORKER))
+    if ThreadPoolExecutor is None or worker_count <= 1:
+        return _run_chunk(func, items)
+
+    chunk_size = max(1, -(-len(items) // (worker_count * CHUNKS_PER_WORKER)))
+    chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+    results = []
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        for chunk_results in executor.map(lambda chunk: _run_chunk(func, chunk), chunks):
+            results.extend(chunk_results)
+    return results
@@ -0,0 +1,241 @@
+import math
+from array import array
+
+EARTH_RADIUS_M = 6378137.0
+DEG_TO_RAD = math.pi / 180.0
+POINT_KEY_DIGITS = 8
+
+
+class Ring(object):
+    """Polyline stored as interleaved doubles (a0, b0, a1, b1, ...).
+
+    Lat/lon rings hold (lat, lon) pairs and project() rewrites them in place
+    as (x, y) metres. Indexing and iteration return tuples, so helpers written
+    for lists of points keep working.
+    """
+
+    __slots__ = ("coords",)
+
+    def __init__(self, coords=None):
+        self.coords = coords if isinstance(coords, array) else array("d", coords or [])
+
+    @classmethod
+    def from_points(cls, points):
+        coords = array("d")
+        for point in points or []:
+            coords.append(float(point[0]))
+            coords.append(float(point[1]))
+        return cls(coords)
+
+    def __len__(self):
+        return len(self.coords) // 2
+
+    def __iter__(self):
+        coords = self.coords
+        for index in range(0, len(coords), 2):
+            yield coords[index], coords[index + 1]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        count = len(self)
+        if index < 0:
+            index += count
+        if index < 0 or index >= count:
+            raise IndexError("ring index out of range")
+        return self.coords[2 * index], self.coords[(2 * index) + 1]
+
+    def __repr__(self):
+        return "Ring({} points)".format(len(self))
+
+    def points(self):
+        return list(self)
+
+    def copy(self):
+        return Ring(array("d", self.coords))
+
+    def _key(self, index):
+        return (
+            round(self.coords[2 * index], POINT_KEY_DIGITS),
+            round(self.coords[(2 * index) + 1], POINT_KEY_DIGITS),
+        )
+
+    def is_closed(self):
+        return len(self) > 1 and self._key(0) == self._key(len(self) - 1)
+
+    def close(self):
+        if len(self) >= 3 and not self.is_closed():
+            self.coords.append(self.coords[0])
+            self.coords.append(self.coords[1])
+        return self
+
+    def unique_point_count(self):
+        count = len(self)
+        if count <= 1:
+            return 0
+        return len(set(self._key(index) for index in range(count - 1)))
+
+    def is_valid_polygon(self):
+        return len(self) >= 4 and self.unique_point_count() >= 3
+
+    def remove_duplicates(self, tolerance_m=0.05):
+        """Drop consecutive points within tolerance_m, in place; snaps a near-closed end shut."""
+        values = self.coords.tolist()
+        if not values:
+            return self
+
+        hypot = math.hypot
+        prev_x = values[0]
+        prev_y = values[1]
+        kept = [prev_x, prev_y]
+        append = kept.append
+        for curr_x, curr_y in zip(values[2::2], values[3::2]):
+            if hypot(curr_x - prev_x, curr_y - prev_y) > tolerance_m:
+                append(curr_x)
+                append(curr_y)
+                prev_x = curr_x
+                prev_y = curr_y
+
+        snap = len(kept) > 2 and hypot(kept[0] - prev_x, kept[1] - prev_y) <= tolerance_m
+        if snap:
+            kept[-2] = kept[0]
+            kept[-1] = kept[1]
+        if snap or len(kept) != len(values):
+            # Most rings have nothing to drop; keep their array as it is.
+            self.coords = array("d", kept)
+        return self
+
+    def signed_area(self):
+        values = self.coords.tolist()
+        if len(values) < 4:
+            return 0.0
+        area = 0.0
+        x1 = values[0]
+        y1 = values[1]
+        for index in range(2, len(values) - 1, 2):
+            x2 = values[index]
+            y2 = values[index + 1]
+            area += (x1 * y2) - (x2 * y1)
+            x1 = x2
+            y1 = y2
+        return area / 2.0
+
+    def reverse(self):
+        coords = self.coords
+        coords[0::2], coords[1::2] = coords[-2::-2], coords[-1::-2]
+        return self
+
+    def orient(self, clockwise):
+        if (self.signed_area() < 0) != clockwise:
+            self.reverse()
+        return self
+
+    def project(self, origin_lat, origin_lon):
+        """Rewrite (lat, lon) pairs as local (x, y) metres, in place."""
+        # lon * DEG_TO_RAD is what math.radians computes, without a call per value.
+        origin_lat_rad = math.radians(origin_lat)
+        origin_lon_rad = math.radians(origin_lon)
+        cos_origin_lat = math.cos(origin_lat_rad)
+        values = self.coords.tolist()
+        lats = values[0::2]
+        values[0::2] = [((lon * DEG_TO_RAD) - origin_lon_rad) * cos_origin_lat * EARTH_RADIUS_M for lon in values[1::2]]
+        values[1::2] = [((lat * DEG_TO_RAD) - origin_lat_rad) * EARTH_RADIUS_M for lat in lats]
+        self.coords = array("d", values)
+        return self
+
+    def projected(self, origin_lat, origin_lon):
+        """Projected copy; the source ring is left in lat/lon."""
+        return Ring(self.coords).project(origin_lat, origin_lon)
+
+    def bounds(self):
+        coords = self.coords
+        if not coords:
+            return None
+        firsts = coords[0::2]
+        seconds = coords[1::2]
+        return min(firsts), min(seconds), max(firsts), max(seconds)
+
+    def _contains(self, x, y, x_offset):
+        coords = self.coords
+        y_offset = 1 - x_offset
+        inside = False
+        for index in range(0, len(coords) - 2, 2):
+            x1 = coords[index + x_offset]
+            y1 = coords[index + y_offset]
+            x2 = coords[index + 2 + x_offset]
+            y2 = coords[index + 2 + y_offset]
+            if (y1 > y) == (y2 > y):
+                continue
+            slope_x = ((x2 - x1) * (y - y1) / ((y2 - y1) or 1e-12)) + x1
+            if x < slope_x:
+                inside = not inside
+        return inside
+
+    def contains_latlon(self, lat, lon):
+        return self._contains(lon, lat, 1)
+
+    def contains_xy(self, x, y):
+        return self._contains(x, y, 0)
+
+    def centroid_latlon(self):
+        count = len(self)
+        if count == 0:
+            return None
+        if self.is_closed():
+            count -= 1
+        if count < 3:
+            return self[0]
+
+        coords = self.coords
+        area = 0.0
+        centroid_lat = 0.0
+        centroid_lon = 0.0
+        for index in range(count):
+            next_index = (index + 1) % count
+            lat1 = coords[2 * index]
+            lon1 = coords[(2 * index) + 1]
+            lat2 = coords[2 * next_index]
+            lon2 = coords[(2 * next_index) + 1]
+            cross = (lon1 * lat2) - (lon2 * lat1)
+            area += cross
+            centroid_lon += (lon1 + lon2) * cross
+            centroid_lat += (lat1 + lat2) * cross
+
+        if abs(area) <= 1e-9:
+            return (
+                sum(coords[2 * index] for index in range(count)) / float(count),
+                sum(coords[(2 * index) + 1] for index in range(count)) / float(count),
+            )
+
+        area *= 0.5
+        return centroid_lat / (6.0 * area), centroid_lon / (6.0 * area)
+
+
+class Feature(object):
+    """Area feature with a Ring outer boundary and Ring holes.
+
+    Supports get() and item access with the old dict keys ("id", "tags",
+    "outer", "inners") so callers can treat it like the previous dicts.
+    """
+
+    __slots__ = ("id", "tags", "outer", "inners")
+
+    def __init__(self, feature_id, tags, outer, inners=None):
+        self.id = feature_id
+        self.tags = tags or {}
+        self.outer = outer
+        self.inners = inners or []
+
+    def get(self, key, default=None):
+        if key in self.__slots__:
+            value = getattr(self, key)
+            return default if value is None else value
+        return default
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __repr__(self):
+        return "Feature({!r}, {} points, {} inners)".format(self.id, len(self.outer or ()), len(self.inners))
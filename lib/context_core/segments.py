@@ -0,0 +1,194 @@
+import json
+import math
+
+
+DEFAULT_TOLERANCE = 0.01
+FIXTURE_VERSION = 1
+
+
+class SnapGrid(object):
+    """Merges points within tolerance onto the first point seen, through a grid hash.
+
+    Cells are twice the tolerance wide, so each lookup only has to check the
+    point's own cell and the three neighbours on its nearer sides.
+    """
+
+    def __init__(self, tolerance=DEFAULT_TOLERANCE):
+        self.tolerance = float(tolerance) or 1e-6
+        self._tolerance2 = self.tolerance * self.tolerance
+        self._cell_size = self.tolerance * 2.0
+        self._cells = {}
+        self.points = []
+        self.snapped = 0
+
+    def __len__(self):
+        return len(self.points)
+
+    def add(self, point):
+        """Index of the vertex point snaps onto, adding a new vertex when none is within tolerance."""
+        x_value, y_value = point[0], point[1]
+        scaled_x = x_value / self._cell_size
+        scaled_y = y_value / self._cell_size
+        cell_x = int(math.floor(scaled_x))
+        cell_y = int(math.floor(scaled_y))
+        side_x = cell_x + 1 if scaled_x - cell_x >= 0.5 else cell_x - 1
+        side_y = cell_y + 1 if scaled_y - cell_y >= 0.5 else cell_y - 1
+        best = None
+        best_distance2 = self._tolerance2
+        for cell in ((cell_x, cell_y), (side_x, cell_y), (cell_x, side_y), (side_x, side_y)):
+            for index in self._cells.get(cell, ()):
+                vertex = self.points[index]
+                distance2 = ((vertex[0] - x_value) ** 2) + ((vertex[1] - y_value) ** 2)
+                if distance2 <= best_distance2:
+                    best = index
+                    best_distance2 = distance2
+        if best is not None:
+            self.snapped += 1
+            return best
+
+        index = len(self.points)
+        self.points.append(point)
+        self._cells.setdefault((cell_x, cell_y), []).append(index)
+        return index
+
+
+def _prune_dangling(adjacency):
+    """Strip open chains back to the cycles they hang off; returns the number of edges removed."""
+    removed = 0
+    stack = [vertex for vertex, neighbours in enumerate(adjacency) if len(neighbours) == 1]
+    while stack:
+        vertex = stack.pop()
+        if len(adjacency[vertex]) != 1:
+            continue
+        neighbour = adjacency[vertex].pop()
+        adjacency[neighbour].discard(vertex)
+        removed += 1
+        if len(adjacency[neighbour]) == 1:
+            stack.append(neighbour)
+    return removed
+
+
+def _walk_faces(points, adjacency):
+    """Faces of the planar graph as vertex cycles, each half-edge used once.
+
+    Bounded faces come out counter-clockwise, the unbounded face of each
+    connected piece clockwise.
+    """
+    rotation = {}
+    position = {}
+    for vertex, neighbours in enumerate(adjacency):
+        if not neighbours:
+            continue
+        x_value, y_value = points[vertex][0], points[vertex][1]
+        ordered = sorted(neighbours, key=lambda other: math.atan2(points[other][1] - y_value, points[other][0] - x_value))
+        rotation[vertex] = ordered
+        for order_index, other in enumerate(ordered):
+            position[(vertex, other)] = order_index
+
+    face_of = {}
+    faces = []
+    for vertex, ordered in rotation.items():
+        for other in ordered:
+            if (vertex, other) in face_of:
+                continue
+            face_index = len(faces)
+            face = []
+            start, end = vertex, other
+            while (start, end) not in face_of:
+                face_of[(start, end)] = face_index
+                face.append(start)
+                around = rotation[end]
+                start, end = end, around[position[(end, start)] - 1]
+            faces.append(face)
+    return faces, face_of
+
+
+def _signed_area(points, face):
+    area = 0.0
+    previous = points[face[-1]]
+    for vertex in face:
+        current = points[vertex]
+        area += (previous[0] * current[1]) - (current[0] * previous[1])
+        previous = current
+    return area / 2.0
+
+
+def planar_rings(segments, tolerance=DEFAULT_TOLERANCE):
+    """Closed rings recovered from loose (start, end) segments of (x, y, ...) points.
+
+    Endpoints within tolerance are snapped together, duplicate edges merged,
+    dangling chains and bridges removed, and every bounded face of the
+    remaining planar graph is returned as a closed counter-clockwise ring, so
+    outlines that share edges (parcels, block subdivisions) each come back as
+    their own ring. Returns (rings, stats).
+    """
+    grid = SnapGrid(tolerance)
+    stats = {"segments": 0, "degenerate": 0, "duplicates": 0, "snapped": 0, "dangling": 0, "bridges": 0, "rings": 0}
+    edges = set()
+    for start_point, end_point in segments or []:
+        stats["segments"] += 1
+        start_index = grid.add(start_point)
+        end_index = grid.add(end_point)
+        if start_index == end_index:
+            stats["degenerate"] += 1
+            continue
+        edge = (start_index, end_index) if start_index < end_index else (end_index, start_index)
+        if edge in edges:
+            stats["duplicates"] += 1
+            continue
+        edges.add(edge)
+    stats["snapped"] = grid.snapped
+
+    points = grid.points
+    adjacency = [set() for _ in points]
+    for start_index, end_index in edges:
+        adjacency[start_index].add(end_index)
+        adjacency[end_index].add(start_index)
+    stats["dangling"] = _prune_dangling(adjacency)
+
+    faces, face_of = _walk_faces(points, adjacency)
+    # A bridge between two cycles is walked in both directions by the same face.
+    bridges = [(start, end) for (start, end), face_index in face_of.items() if start < end and face_of.get((end, start)) == face_index]
+    if bridges:
+        for start, end in bridges:
+            adjacency[start].discard(end)
+            adjacency[end].discard(start)
+        stats["bridges"] = len(bridges)
+        stats["dangling"] += _prune_dangling(adjacency)
+        faces, face_of = _walk_faces(points, adjacency)
+
+    min_area = grid.tolerance * grid.tolerance
+    rings = []
+    for face in faces:
+        if len(face) < 3 or _signed_area(points, face) <= min_area:
+            continue
+        ring = [points[vertex] for vertex in face]
+        ring.append(ring[0])
+        rings.append(ring)
+    stats["rings"] = len(rings)
+    return rings, stats
+
+
+def write_segment_fixture(path, segments_by_layer, tolerance, units=None):
+    """Save {layer: [(start, end), ...]} as a JSON fixture for planar_rings benchmarks outside Revit."""
+    data = {
+        "version": FIXTURE_VERSION,
+        "tolerance": tolerance,
+        "units": units,
+        "layers": dict(
+            (layer_name, [[list(start_point), list(end_point)] for start_point, end_point in segments])
+            for layer_name, segments in (segments_by_layer or {}).items()
+        ),
+    }
+    with open(path, "w") as fixture_file:
+        json.dump(data, fixture_file)
+
+
+def read_segment_fixture(path):
+    """({layer: [(start, end), ...]}, tolerance) from a write_segment_fixture file."""
+    with open(path, "r") as fixture_file:
+        data = json.load(fixture_file)
+    segments_by_layer = {}
+    for layer_name, segments in (data.get("layers") or {}).items():
+        segments_by_layer[layer_name] = [(tuple(start_point), tuple(end_point)) for start_point, end_point in segments]
+    return segments_by_layer, data.get("tolerance") or DEFAULT_TOLERANCE
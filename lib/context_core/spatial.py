@@ -0,0 +1,177 @@
+import heapq
+import math
+
+
+MIN_POINT_CELL_SIZE = 1.0
+
+
+class PointGridIndex(object):
+    """Uniform grid buckets over (x, y, value) points for nearest lookups.
+
+    Cells default to the larger extent over sqrt(n), floored at min_cell_size
+    so a single point or a single row of points cannot shrink them to nothing.
+    """
+
+    def __init__(self, points, cell_size=None, min_cell_size=MIN_POINT_CELL_SIZE):
+        self._points = [(float(x), float(y), value) for x, y, value in points or []]
+        self._buckets = {}
+        if not self._points:
+            self._cell_size = 1.0
+            self._bounds = (0, 0, 0, 0)
+            self._ring_limit = 0
+            return
+
+        min_x = min(point[0] for point in self._points)
+        max_x = max(point[0] for point in self._points)
+        min_y = min(point[1] for point in self._points)
+        max_y = max(point[1] for point in self._points)
+        if not cell_size:
+            cell_size = max(max_x - min_x, max_y - min_y) / math.sqrt(float(len(self._points)))
+        self._cell_size = max(float(min_cell_size) or 1e-9, float(cell_size))
+
+        for point in self._points:
+            self._buckets.setdefault(self._cell_of(point[0], point[1]), []).append(point)
+
+        min_cell = self._cell_of(min_x, min_y)
+        max_cell = self._cell_of(max_x, max_y)
+        self._bounds = (min_cell[0], min_cell[1], max_cell[0], max_cell[1])
+        # Walking rings out to r visits (2r + 1)^2 cells; past about n / 4 cells
+        # a linear scan over the points is cheaper.
+        self._ring_limit = max(2, int(math.sqrt(float(len(self._points))) / 4.0))
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell_of(self, x, y):
+        return int(math.floor(x / self._cell_size)), int(math.floor(y / self._cell_size))
+
+    def _ring_cells(self, cell_x, cell_y, ring):
+        if ring == 0:
+            yield cell_x, cell_y
+            return
+        for offset in range(-ring, ring + 1):
+            yield cell_x + offset, cell_y - ring
+            yield cell_x + offset, cell_y + ring
+        for offset in range(-ring + 1, ring):
+            yield cell_x - ring, cell_y + offset
+            yield cell_x + ring, cell_y + offset
+
+    def _max_ring(self, cell_x, cell_y):
+        min_cx, min_cy, max_cx, max_cy = self._bounds
+        return max(abs(cell_x - min_cx), abs(cell_x - max_cx), abs(cell_y - min_cy), abs(cell_y - max_cy))
+
+    def k_nearest(self, x, y, k=1):
+        """Return up to k (distance, value) pairs ordered by distance."""
+        if not self._points or k <= 0:
+            return []
+
+        cell_x, cell_y = self._cell_of(x, y)
+        max_ring = self._max_ring(cell_x, cell_y)
+        found = []
+        ring = 0
+        while ring <= max_ring:
+            if ring > self._ring_limit:
+                # Far outside the points (or they are sparse); scan them all instead.
+                return heapq.nsmallest(k, ((math.hypot(point[0] - x, point[1] - y), point[2]) for point in self._points), key=lambda item: item[0])
+            for cell in self._ring_cells(cell_x, cell_y, ring):
+                for point in self._buckets.get(cell, ()):
+                    found.append((math.hypot(point[0] - x, point[1] - y), point[2]))
+            if len(found) >= k:
+                found.sort(key=lambda item: item[0])
+                found = found[:k]
+                # Anything in ring + 1 or beyond is at least ring * cell_size away.
+                if found[-1][0] <= ring * self._cell_size:
+                    break
+            ring += 1
+
+        found.sort(key=lambda item: item[0])
+        return found[:k]
+
+    def nearest(self, x, y):
+        found = self.k_nearest(x, y, 1)
+        return found[0][1] if found else None
+
+    def inverse_distance(self, x, y, k=4, power=2.0):
+        found = self.k_nearest(x, y, k)
+        if not found:
+            return None
+        if found[0][0] <= 1e-9:
+            return found[0][1]
+        weight_total = 0.0
+        value_total = 0.0
+        for distance, value in found:
+            weight = 1.0 / (distance ** power)
+            weight_total += weight
+            value_total += weight * value
+        return value_total / weight_total
+
+
+class BoxGridIndex(object):
+    """Uniform grid buckets over (min_x, min_y, max_x, max_y, value) boxes for overlap queries.
+
+    Cells default to the larger of sqrt(area / n), the mean box extent and the
+    larger data extent over sqrt(n), so zero-size boxes in one spot or along
+    one line still get real cells; with no extent at all they fall back to
+    unit cells. A query spanning more cells than there are boxes scans the
+    boxes instead.
+    """
+
+    def __init__(self, boxes, cell_size=None):
+        self._boxes = [(float(box[0]), float(box[1]), float(box[2]), float(box[3]), box[4]) for box in boxes or []]
+        self._buckets = {}
+        if not self._boxes:
+            self._cell_size = 1.0
+            return
+
+        if not cell_size:
+            min_x = min(box[0] for box in self._boxes)
+            min_y = min(box[1] for box in self._boxes)
+            max_x = max(box[2] for box in self._boxes)
+            max_y = max(box[3] for box in self._boxes)
+            count = float(len(self._boxes))
+            area = (max_x - min_x) * (max_y - min_y)
+            mean_extent = sum(max(box[2] - box[0], box[3] - box[1]) for box in self._boxes) / count
+            cell_size = max(math.sqrt(area / count), mean_extent, max(max_x - min_x, max_y - min_y) / math.sqrt(count))
+        self._cell_size = float(cell_size) if cell_size > 0 else 1.0
+
+        for position, box in enumerate(self._boxes):
+            for cell in self._cells(box[0], box[1], box[2], box[3]):
+                self._buckets.setdefault(cell, []).append(position)
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def _cell_range(self, min_x, min_y, max_x, max_y):
+        return (
+            int(math.floor(min_x / self._cell_size)),
+            int(math.floor(min_y / self._cell_size)),
+            int(math.floor(max_x / self._cell_size)),
+            int(math.floor(max_y / self._cell_size)),
+        )
+
+    def _cells(self, min_x, min_y, max_x, max_y):
+        min_cx, min_cy, max_cx, max_cy = self._cell_range(min_x, min_y, max_x, max_y)
+        for cell_x in range(min_cx, max_cx + 1):
+            for cell_y in range(min_cy, max_cy + 1):
+                yield cell_x, cell_y
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """Values of boxes overlapping the query box, in insertion order."""
+        if not self._boxes:
+            return []
+        min_cx, min_cy, max_cx, max_cy = self._cell_range(min_x, min_y, max_x, max_y)
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(self._boxes):
+            positions = range(len(self._boxes))
+        else:
+            positions = set()
+            for cell in self._cells(min_x, min_y, max_x, max_y):
+                positions.update(self._buckets.get(cell, ()))
+        found = []
+        for position in sorted(positions):
+            box = self._boxes[position]
+            if box[0] <= max_x and box[2] >= min_x and box[1] <= max_y and box[3] >= min_y:
+                found.append(box[4])
+        return found
+
+    def query_point(self, x, y):
+        return self.query(x, y, x, y)
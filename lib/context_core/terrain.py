@@ -0,0 +1,616 @@
+import math
+import threading
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except Exception:
+    ThreadPoolExecutor = None
+
+try:
+    import urllib.parse as _urllib_parse
+except Exception:
+    import urlparse as _urllib_parse
+
+from context_core.geometry import meters_per_degree, project_latlon
+from context_core.spatial import PointGridIndex
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from urllib.parse import urlencode as _urlencode
+except Exception:
+    from urllib import urlencode as _urlencode
+
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_HOST_LIMIT = 4
+POINT_KEY_DIGITS = 8
+RASTER_MIN_POINTS = 16
+RASTER_MAX_CELLS_PER_SIDE = 256
+INTERPOLATION_NEIGHBOURS = 4
+METERS_PER_DEG_LAT = 110540.0
+METERS_PER_DEG_LON = 111320.0
+
+_HOST_SEMAPHORES = {}
+_HOST_SEMAPHORES_LOCK = threading.Lock()
+
+
+def point_key(lat, lon):
+    return (round(float(lat), POINT_KEY_DIGITS), round(float(lon), POINT_KEY_DIGITS))
+
+
+def host_of(url):
+    try:
+        return (_urllib_parse.urlparse(url).netloc or url or "").lower()
+    except Exception:
+        return str(url or "").lower()
+
+
+def _host_semaphore(host, limit):
+    key = (host or "", int(max(1, limit)))
+    with _HOST_SEMAPHORES_LOCK:
+        semaphore = _HOST_SEMAPHORES.get(key)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(key[1])
+            _HOST_SEMAPHORES[key] = semaphore
+    return semaphore
+
+
+def _unique_keys(points):
+    keys = []
+    unique = []
+    seen = set()
+    for lat, lon in points or []:
+        key = point_key(lat, lon)
+        keys.append(key)
+        if key not in seen:
+            seen.add(key)
+            unique.append(key)
+    return keys, unique
+
+
+def _fetch_points_serial(keys, sample_point):
+    values = {}
+    errors = []
+    for key in keys:
+        try:
+            values[key] = sample_point(key[0], key[1])
+        except Exception as ex:
+            values[key] = None
+            errors.append(ex)
+    return values, errors
+
+
+def _fetch_points_pooled(keys, sample_point, max_workers, host, host_limit):
+    if ThreadPoolExecutor is None or max_workers <= 1 or len(keys) <= 1:
+        return _fetch_points_serial(keys, sample_point)
+
+    semaphore = _host_semaphore(host, host_limit)
+    values = {}
+    errors = []
+
+    def _run(key):
+        with semaphore:
+            return sample_point(key[0], key[1])
+
+    worker_count = max(1, min(int(max_workers), len(keys)))
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        futures = [(key, executor.submit(_run, key)) for key in keys]
+        for key, future in futures:
+            try:
+                values[key] = future.result()
+            except Exception as ex:
+                values[key] = None
+                errors.append(ex)
+    return values, errors
+
+
+def sample_points(
+    points,
+    sample_point,
+    lookup=None,
+    store=None,
+    fetch_raster=None,
+    max_workers=DEFAULT_MAX_WORKERS,
+    host=None,
+    host_limit=DEFAULT_HOST_LIMIT,
+    raster_min_points=RASTER_MIN_POINTS,
+):
+    """Resolve an elevation for every (lat, lon) in points, in input order.
+
+    Cached values come from lookup(keys) -> {key: value}; missing keys are read
+    from fetch_raster when it is given and enough points are missing, and
+    whatever the raster did not cover is fetched point by point on a bounded
+    pool. Only point samples are handed to store({key: value}), once, on the
+    calling thread: raster values are interpolated at the raster's resolution
+    and must not answer later exact lookups.
+    """
+    keys, unique = _unique_keys(points)
+    if not unique:
+        return []
+
+    values = {}
+    if lookup is not None:
+        try:
+            values.update(lookup(unique) or {})
+        except Exception:
+            values = {}
+
+    missing = [key for key in unique if values.get(key) is None]
+    fetched = {}
+
+    if fetch_raster is not None and len(missing) >= max(1, raster_min_points):
+        try:
+            raster_values = fetch_raster(missing) or {}
+        except Exception:
+            raster_values = {}
+        for key in missing:
+            value = raster_values.get(key)
+            if value is not None:
+                values[key] = value
+        # Cells the raster reported as nodata are genuinely empty; only points
+        # outside the returned raster are retried one by one.
+        missing = [key for key in missing if key not in raster_values]
+
+    errors = []
+    if missing:
+        pooled_values, errors = _fetch_points_pooled(missing, sample_point, max_workers, host, host_limit)
+        for key, value in pooled_values.items():
+            if value is not None:
+                fetched[key] = value
+
+    if fetched and store is not None:
+        try:
+            store(fetched)
+        except Exception:
+            pass
+
+    values.update(fetched)
+    if errors and not any(values.get(key) is not None for key in unique):
+        raise errors[0]
+    return [values.get(key) for key in keys]
+
+
+class TerrainPointIndex(object):
+    """Nearest-neighbour lookups over terrain grid points.
+
+    Points are {"lat", "lon", "elevation_m"} dicts as stored in a terrain grid;
+    they are bucketed in local metres so distances are isotropic.
+    """
+
+    def __init__(self, points):
+        usable = []
+        for point in points or []:
+            try:
+                usable.append((float(point["lat"]), float(point["lon"]), float(point["elevation_m"])))
+            except Exception:
+                continue
+        ref_lat = (sum(point[0] for point in usable) / float(len(usable))) if usable else 0.0
+        self._scale_x = METERS_PER_DEG_LON * math.cos(math.radians(ref_lat))
+        self._scale_y = METERS_PER_DEG_LAT
+        self._index = PointGridIndex(
+            [(lon * self._scale_x, lat * self._scale_y, value) for lat, lon, value in usable]
+        )
+
+    def __len__(self):
+        return len(self._index)
+
+    def nearest(self, lat, lon):
+        return self._index.nearest(lon * self._scale_x, lat * self._scale_y)
+
+    def interpolate(self, lat, lon, neighbours=INTERPOLATION_NEIGHBOURS):
+        return self._index.inverse_distance(lon * self._scale_x, lat * self._scale_y, neighbours)
+
+
+def grid_point_index(terrain_grid):
+    # Built once per grid and kept on the in-memory dict; grids are written to
+    # the JSON cache before they are queried.
+    index = terrain_grid.get("_point_index")
+    if index is None:
+        index = TerrainPointIndex(terrain_grid.get("points") or [])
+        terrain_grid["_point_index"] = index
+    return index
+
+
+def grid_nearest_elevation(terrain_grid, lat, lon):
+    return grid_point_index(terrain_grid).nearest(lat, lon)
+
+
+def grid_interpolated_elevation(terrain_grid, lat, lon, neighbours=INTERPOLATION_NEIGHBOURS):
+    return grid_point_index(terrain_grid).interpolate(lat, lon, neighbours)
+
+
+def grid_bilinear_elevation(terrain_grid, center_lat, center_lon, lat, lon, neighbours=INTERPOLATION_NEIGHBOURS):
+    dense_half_size_m = terrain_grid.get("dense_half_size_m") or 0.0
+    grid_rows = terrain_grid["rows"]
+    step_lat = terrain_grid["step_lat"]
+    step_lon = terrain_grid["step_lon"]
+    steps_each_side = terrain_grid["steps_each_side"]
+    per_side = terrain_grid["per_side"]
+
+    if dense_half_size_m > 0.0:
+        dx_m, dy_m = project_latlon(lat, lon, center_lat, center_lon)
+        if abs(dx_m) <= dense_half_size_m and abs(dy_m) <= dense_half_size_m:
+            dense_rows = terrain_grid.get("dense_rows")
+            if dense_rows:
+                grid_rows = dense_rows
+                step_lat = terrain_grid["dense_step_lat"]
+                step_lon = terrain_grid["dense_step_lon"]
+                steps_each_side = terrain_grid["dense_steps_each_side"]
+                per_side = terrain_grid["dense_per_side"]
+
+    max_index = per_side - 1
+    row_position = ((center_lat + (steps_each_side * step_lat)) - lat) / step_lat
+    col_position = (lon - (center_lon - (steps_each_side * step_lon))) / step_lon
+
+    row0 = int(math.floor(row_position))
+    col0 = int(math.floor(col_position))
+    row1 = min(max_index, row0 + 1)
+    col1 = min(max_index, col0 + 1)
+    row0 = max(0, min(max_index, row0))
+    col0 = max(0, min(max_index, col0))
+
+    q11 = grid_rows[row0][col0]
+    q12 = grid_rows[row0][col1]
+    q21 = grid_rows[row1][col0]
+    q22 = grid_rows[row1][col1]
+
+    if None in (q11, q12, q21, q22):
+        return grid_interpolated_elevation(terrain_grid, lat, lon, neighbours)
+
+    tx = 0.0 if col1 == col0 else max(0.0, min(1.0, col_position - col0))
+    ty = 0.0 if row1 == row0 else max(0.0, min(1.0, row_position - row0))
+    return (
+        (q11 * (1.0 - tx) * (1.0 - ty))
+        + (q12 * tx * (1.0 - ty))
+        + (q21 * (1.0 - tx) * ty)
+        + (q22 * tx * ty)
+    )
+
+
+def _grid_array(terrain_grid, rows_key):
+    # Cached next to the point index; missing samples become NaN.
+    cache_key = "_array_" + rows_key
+    array = terrain_grid.get(cache_key)
+    if array is None:
+        array = numpy.array(
+            [[numpy.nan if value is None else value for value in row] for row in terrain_grid[rows_key]],
+            dtype=float,
+        )
+        terrain_grid[cache_key] = array
+    return array
+
+
+def _bilinear_numpy(grid_array, center_lat, center_lon, step_lat, step_lon, steps_each_side, per_side, lats, lons):
+    max_index = per_side - 1
+    row_position = ((center_lat + (steps_each_side * step_lat)) - lats) / step_lat
+    col_position = (lons - (center_lon - (steps_each_side * step_lon))) / step_lon
+    row0 = numpy.floor(row_position).astype(int)
+    col0 = numpy.floor(col_position).astype(int)
+    row1 = numpy.minimum(max_index, row0 + 1)
+    col1 = numpy.minimum(max_index, col0 + 1)
+    row0 = numpy.clip(row0, 0, max_index)
+    col0 = numpy.clip(col0, 0, max_index)
+
+    tx = numpy.where(col1 == col0, 0.0, numpy.clip(col_position - col0, 0.0, 1.0))
+    ty = numpy.where(row1 == row0, 0.0, numpy.clip(row_position - row0, 0.0, 1.0))
+    return (
+        (grid_array[row0, col0] * (1.0 - tx) * (1.0 - ty))
+        + (grid_array[row0, col1] * tx * (1.0 - ty))
+        + (grid_array[row1, col0] * (1.0 - tx) * ty)
+        + (grid_array[row1, col1] * tx * ty)
+    )
+
+
+def _grid_bilinear_elevations_numpy(terrain_grid, center_lat, center_lon, lats, lons):
+    """Bilinear elevations for arrays of points; NaN wherever a corner sample is missing."""
+    values = _bilinear_numpy(
+        _grid_array(terrain_grid, "rows"),
+        center_lat,
+        center_lon,
+        terrain_grid["step_lat"],
+        terrain_grid["step_lon"],
+        terrain_grid["steps_each_side"],
+        terrain_grid["per_side"],
+        lats,
+        lons,
+    )
+
+    dense_half_size_m = terrain_grid.get("dense_half_size_m") or 0.0
+    if dense_half_size_m > 0.0 and terrain_grid.get("dense_rows"):
+        earth_radius_m = 6378137.0
+        dx_m = numpy.radians(lons - center_lon) * math.cos(math.radians(center_lat)) * earth_radius_m
+        dy_m = numpy.radians(lats - center_lat) * earth_radius_m
+        dense = (numpy.abs(dx_m) <= dense_half_size_m) & (numpy.abs(dy_m) <= dense_half_size_m)
+        if dense.any():
+            values[dense] = _bilinear_numpy(
+                _grid_array(terrain_grid, "dense_rows"),
+                center_lat,
+                center_lon,
+                terrain_grid["dense_step_lat"],
+                terrain_grid["dense_step_lon"],
+                terrain_grid["dense_steps_each_side"],
+                terrain_grid["dense_per_side"],
+                lats[dense],
+                lons[dense],
+            )
+    return values
+
+
+def grid_bilinear_elevations(terrain_grid, center_lat, center_lon, latlons, neighbours=INTERPOLATION_NEIGHBOURS):
+    """grid_bilinear_elevation for a whole list of (lat, lon) points (None entries stay None).
+
+    With NumPy the bilinear pass runs over all points at once; only points
+    next to missing samples go through the per-point nearest-neighbour fallback.
+    """
+    latlons = list(latlons or [])
+    if not terrain_grid:
+        return [None for _ in latlons]
+    if numpy is None:
+        elevations = []
+        for latlon in latlons:
+            if latlon is None:
+                elevations.append(None)
+                continue
+            elevations.append(grid_bilinear_elevation(terrain_grid, center_lat, center_lon, latlon[0], latlon[1], neighbours))
+        return elevations
+
+    positions = [index for index, latlon in enumerate(latlons) if latlon is not None]
+    elevations = [None] * len(latlons)
+    if not positions:
+        return elevations
+    lats = numpy.array([latlons[index][0] for index in positions], dtype=float)
+    lons = numpy.array([latlons[index][1] for index in positions], dtype=float)
+    values = _grid_bilinear_elevations_numpy(terrain_grid, center_lat, center_lon, lats, lons)
+    for index, value in zip(positions, values.tolist()):
+        if value != value:
+            latlon = latlons[index]
+            value = grid_interpolated_elevation(terrain_grid, latlon[0], latlon[1], neighbours)
+        elevations[index] = value
+    return elevations
+
+
+def points_bounds(points):
+    lats = [point[0] for point in points]
+    lons = [point[1] for point in points]
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+def _distinct_count(values, digits=POINT_KEY_DIGITS):
+    return len({round(value, digits) for value in values})
+
+
+def raster_window_for_points(points, max_cells_per_side=RASTER_MAX_CELLS_PER_SIDE):
+    """Pick a lat/lon raster whose cell centres land on regular grid points.
+
+    For a regular grid the raster is one cell per grid row/column and the bbox
+    is padded by half a step; scattered points get an evenly spaced window.
+    """
+    if not points:
+        return None
+
+    min_lat, min_lon, max_lat, max_lon = points_bounds(points)
+    width = max(1, min(int(max_cells_per_side), _distinct_count([point[1] for point in points])))
+    height = max(1, min(int(max_cells_per_side), _distinct_count([point[0] for point in points])))
+    step_lon = (max_lon - min_lon) / float(width - 1) if width > 1 else 1e-5
+    step_lat = (max_lat - min_lat) / float(height - 1) if height > 1 else 1e-5
+    return {
+        "min_lat": min_lat - (step_lat / 2.0),
+        "min_lon": min_lon - (step_lon / 2.0),
+        "max_lat": max_lat + (step_lat / 2.0),
+        "max_lon": max_lon + (step_lon / 2.0),
+        "width": width,
+        "height": height,
+    }
+
+
+def raster_windows_at_resolution(points, cell_size_m, max_cells_per_side=RASTER_MAX_CELLS_PER_SIDE):
+    """Split points into lat/lon rasters of cell_size_m cells, at most max_cells_per_side a side.
+
+    Returns [(window, points in it)]. Points are grouped by square tiles one
+    cell narrower than a window, so each group plus a cell of padding fits.
+    """
+    if not points or not cell_size_m or cell_size_m <= 0:
+        return []
+
+    meters_per_degree_lat, meters_per_degree_lon = meters_per_degree(sum(point[0] for point in points) / float(len(points)))
+    cell_lat = float(cell_size_m) / meters_per_degree_lat
+    cell_lon = float(cell_size_m) / meters_per_degree_lon
+    cells_per_tile = max(1, int(max_cells_per_side) - 2)
+    groups = {}
+    for point in points:
+        tile = (int(math.floor(point[0] / (cell_lat * cells_per_tile))), int(math.floor(point[1] / (cell_lon * cells_per_tile))))
+        groups.setdefault(tile, []).append(point)
+
+    windows = []
+    for tile in sorted(groups):
+        group = groups[tile]
+        min_lat, min_lon, max_lat, max_lon = points_bounds(group)
+        width = min(int(max_cells_per_side), int(math.ceil((max_lon - min_lon) / cell_lon)) + 2)
+        height = min(int(max_cells_per_side), int(math.ceil((max_lat - min_lat) / cell_lat)) + 2)
+        center_lat = (min_lat + max_lat) / 2.0
+        center_lon = (min_lon + max_lon) / 2.0
+        windows.append((
+            {
+                "min_lat": center_lat - (height * cell_lat / 2.0),
+                "min_lon": center_lon - (width * cell_lon / 2.0),
+                "max_lat": center_lat + (height * cell_lat / 2.0),
+                "max_lon": center_lon + (width * cell_lon / 2.0),
+                "width": width,
+                "height": height,
+            },
+            group,
+        ))
+    return windows
+
+
+def parse_ascii_grid(text):
+    """Parse an ESRI ASCII grid (ArcGrid) into a raster dict."""
+    tokens = (text or "").split()
+    header = {}
+    index = 0
+    while index + 1 < len(tokens):
+        name = tokens[index].lower()
+        if name not in ("ncols", "nrows", "xllcorner", "yllcorner", "xllcenter", "yllcenter", "cellsize", "dx", "dy", "nodata_value"):
+            break
+        header[name] = float(tokens[index + 1])
+        index += 2
+
+    ncols = int(header.get("ncols") or 0)
+    nrows = int(header.get("nrows") or 0)
+    if ncols <= 0 or nrows <= 0:
+        raise ValueError("Raster response is not an ASCII grid.")
+
+    cell_x = header.get("dx") or header.get("cellsize")
+    cell_y = header.get("dy") or header.get("cellsize")
+    if not cell_x or not cell_y:
+        raise ValueError("Raster response has no cell size.")
+
+    if "xllcenter" in header:
+        min_x = header["xllcenter"] - (cell_x / 2.0)
+    else:
+        min_x = header.get("xllcorner", 0.0)
+    if "yllcenter" in header:
+        min_y = header["yllcenter"] - (cell_y / 2.0)
+    else:
+        min_y = header.get("yllcorner", 0.0)
+
+    body = tokens[index:index + (ncols * nrows)]
+    if len(body) < ncols * nrows:
+        raise ValueError("Raster response is truncated.")
+
+    nodata = header.get("nodata_value")
+    values = []
+    for token in body:
+        value = float(token)
+        if nodata is not None and abs(value - nodata) <= 1e-6:
+            value = None
+        values.append(value)
+
+    return {
+        "ncols": ncols,
+        "nrows": nrows,
+        "min_x": min_x,
+        "min_y": min_y,
+        "cell_x": cell_x,
+        "cell_y": cell_y,
+        "values": values,
+    }
+
+
+def _raster_position(raster, lat, lon):
+    ncols = raster["ncols"]
+    nrows = raster["nrows"]
+    col_position = ((lon - raster["min_x"]) / raster["cell_x"]) - 0.5
+    row_position = (((raster["min_y"] + (nrows * raster["cell_y"])) - lat) / raster["cell_y"]) - 0.5
+    if col_position < -0.5 or row_position < -0.5 or col_position > ncols - 0.5 or row_position > nrows - 0.5:
+        return None
+    return row_position, col_position
+
+
+def raster_contains(raster, lat, lon):
+    return _raster_position(raster, lat, lon) is not None
+
+
+def raster_value_at(raster, lat, lon):
+    position = _raster_position(raster, lat, lon)
+    if position is None:
+        return None
+
+    row_position, col_position = position
+    ncols = raster["ncols"]
+    nrows = raster["nrows"]
+    values = raster["values"]
+    col0 = max(0, min(ncols - 1, int(math.floor(col_position))))
+    row0 = max(0, min(nrows - 1, int(math.floor(row_position))))
+    col1 = min(ncols - 1, col0 + 1)
+    row1 = min(nrows - 1, row0 + 1)
+    q11 = values[(row0 * ncols) + col0]
+    q12 = values[(row0 * ncols) + col1]
+    q21 = values[(row1 * ncols) + col0]
+    q22 = values[(row1 * ncols) + col1]
+
+    if None in (q11, q12, q21, q22):
+        nearest_col = max(0, min(ncols - 1, int(round(col_position))))
+        nearest_row = max(0, min(nrows - 1, int(round(row_position))))
+        return values[(nearest_row * ncols) + nearest_col]
+
+    tx = max(0.0, min(1.0, col_position - col0))
+    ty = max(0.0, min(1.0, row_position - row0))
+    return (
+        (q11 * (1.0 - tx) * (1.0 - ty))
+        + (q12 * tx * (1.0 - ty))
+        + (q21 * (1.0 - tx) * ty)
+        + (q22 * tx * ty)
+    )
+
+
+def build_wcs_getcoverage_url(endpoint, coverage, window, output_format="ArcGrid"):
+    query = _urlencode(
+        {
+            "service": "WCS",
+            "version": "1.0.0",
+            "request": "GetCoverage",
+            "coverage": coverage,
+            "crs": "EPSG:4326",
+            "bbox": "{:.8f},{:.8f},{:.8f},{:.8f}".format(
+                window["min_lon"],
+                window["min_lat"],
+                window["max_lon"],
+                window["max_lat"],
+            ),
+            "width": window["width"],
+            "height": window["height"],
+            "format": output_format,
+        }
+    )
+    return "{}?{}".format(endpoint, query)
+
+
+def wcs_raster_fetcher(endpoint, coverage, http_get_text, output_format="ArcGrid", max_cells_per_side=RASTER_MAX_CELLS_PER_SIDE, timeout_sec=60, cell_size_m=None):
+    """Return a fetch_raster callable that reads points from a WCS coverage.
+
+    By default every point comes from one raster fitted to the points, which
+    suits regular grids. With cell_size_m the points are read from as many
+    windows at that resolution as they need, for scattered points such as
+    building outlines that must not be blurred by coarse cells, fetched a few
+    at a time; a window that fails leaves its points to the point-by-point
+    fallback.
+    """
+    if not endpoint or not coverage:
+        return None
+
+    def _read(window, keys):
+        text = http_get_text(build_wcs_getcoverage_url(endpoint, coverage, window, output_format), timeout_sec=timeout_sec)
+        raster = parse_ascii_grid(text)
+        return dict(
+            (key, raster_value_at(raster, key[0], key[1]))
+            for key in keys
+            if raster_contains(raster, key[0], key[1])
+        )
+
+    def _fetch(keys):
+        if not cell_size_m:
+            window = raster_window_for_points(keys, max_cells_per_side)
+            return _read(window, keys) if window is not None else {}
+        def _read_quietly(window_keys):
+            try:
+                return _read(window_keys[0], window_keys[1])
+            except Exception:
+                return {}
+
+        windows = raster_windows_at_resolution(keys, cell_size_m, max_cells_per_side)
+        values = {}
+        if ThreadPoolExecutor is not None and len(windows) > 1:
+            with ThreadPoolExecutor(max_workers=min(DEFAULT_HOST_LIMIT, len(windows))) as executor:
+                for window_values in executor.map(_read_quietly, windows):
+                    values.update(window_values)
+        else:
+            for window_keys in windows:
+                values.update(_read_quietly(window_keys))
+        return values
+
+    return _fetch
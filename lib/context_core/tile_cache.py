@@ -0,0 +1,319 @@
+import glob
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import time
+
+
+DEFAULT_RESOLUTION_DEG = 1e-6
+DEFAULT_MAX_ENTRIES = 500000
+TOUCH_INTERVAL_SEC = 86400
+COMPACT_MIN_RECORDS = 4096
+MIGRATION_MARKER_SUFFIX = ".migrated"
+
+_MAGIC = b"WWPTPC01"
+_HEADER = struct.Struct("<8sd")
+_RECORD = struct.Struct("<QqqdI")
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+_MIGRATED_PATHS = set()
+
+
+def namespace_id(*parts):
+    normalized = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=True)
+    return struct.unpack("<Q", hashlib.sha256(normalized.encode("utf-8")).digest()[:8])[0]
+
+
+def _now():
+    return int(time.time())
+
+
+def _iter_records(data, offset):
+    usable = offset + (((len(data) - offset) // _RECORD.size) * _RECORD.size)
+    iter_unpack = getattr(_RECORD, "iter_unpack", None)
+    if iter_unpack is not None:
+        for record in iter_unpack(data[offset:usable]):
+            yield record
+        return
+    for position in range(offset, usable, _RECORD.size):
+        yield _RECORD.unpack_from(data, position)
+
+
+def read_store_resolution(path):
+    """Resolution a store file was written at, or None when it is missing or not a store file."""
+    try:
+        with open(path, "rb") as store_file:
+            data = store_file.read(_HEADER.size)
+    except Exception:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, resolution = _HEADER.unpack_from(data, 0)
+    return resolution if magic == _MAGIC else None
+
+
+class TerrainPointStore(object):
+    """Append-only elevation cache with an in-memory index.
+
+    Points are quantised to resolution_deg cells and keyed by a 64-bit
+    namespace (service, layer, sample window). Later records win, so hits only
+    append a touch record when the stored timestamp is a day old; compaction
+    rewrites the file keeping the most recently used max_entries cells.
+    """
+
+    def __init__(self, path, resolution_deg=DEFAULT_RESOLUTION_DEG, max_entries=DEFAULT_MAX_ENTRIES):
+        self._path = path
+        self._resolution = float(resolution_deg)
+        self._max_entries = int(max_entries) if max_entries else 0
+        self._index = {}
+        self._pending = {}
+        self._record_count = 0
+        self._lock = threading.RLock()
+        self._load()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def resolution_deg(self):
+        return self._resolution
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def mismatched(self):
+        """True when the file on disk has another layout or resolution and will be replaced on flush."""
+        return self._record_count < 0
+
+    def _quantise(self, lat, lon):
+        return int(round(float(lat) / self._resolution)), int(round(float(lon) / self._resolution))
+
+    def _load(self):
+        if not os.path.isfile(self._path):
+            return
+        try:
+            with open(self._path, "rb") as store_file:
+                data = store_file.read()
+        except Exception:
+            return
+
+        if len(data) < _HEADER.size:
+            return
+        magic, resolution = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or abs(resolution - self._resolution) > 1e-15:
+            # Written with another layout or resolution; start over on first flush.
+            self._record_count = -1
+            return
+
+        for namespace, qlat, qlon, value, stamp in _iter_records(data, _HEADER.size):
+            self._index[(namespace, qlat, qlon)] = [value, stamp, stamp]
+            self._record_count += 1
+
+    def get_many(self, namespace, points):
+        found = {}
+        now = _now()
+        with self._lock:
+            for point in points or []:
+                cell = (namespace,) + self._quantise(point[0], point[1])
+                entry = self._index.get(cell)
+                if entry is None:
+                    continue
+                found[point] = entry[0]
+                entry[1] = now
+                if now - entry[2] >= TOUCH_INTERVAL_SEC:
+                    self._pending[cell] = entry
+        return found
+
+    def put_many(self, namespace, values):
+        now = _now()
+        with self._lock:
+            for point, value in (values or {}).items():
+                if value is None:
+                    continue
+                cell = (namespace,) + self._quantise(point[0], point[1])
+                entry = [float(value), now, now]
+                self._index[cell] = entry
+                self._pending[cell] = entry
+
+    def get(self, namespace, lat, lon):
+        return self.get_many(namespace, [(lat, lon)]).get((lat, lon))
+
+    def put(self, namespace, lat, lon, value):
+        self.put_many(namespace, {(lat, lon): value})
+
+    def flush(self):
+        with self._lock:
+            if self._record_count < 0:
+                self._pending = {}
+                self._write_all(self._index)
+                return
+            if not self._pending:
+                return
+
+            if self._max_entries and len(self._index) > self._max_entries:
+                self.compact()
+                return
+
+            try:
+                self._ensure_parent()
+                is_new = not os.path.isfile(self._path)
+                with open(self._path, "ab") as store_file:
+                    if is_new:
+                        store_file.write(_HEADER.pack(_MAGIC, self._resolution))
+                    chunks = []
+                    for cell, entry in self._pending.items():
+                        chunks.append(_RECORD.pack(cell[0], cell[1], cell[2], entry[0], entry[1]))
+                        entry[2] = entry[1]
+                    store_file.write(b"".join(chunks))
+                self._record_count += len(self._pending)
+            except Exception:
+                return
+            finally:
+                self._pending = {}
+
+            if self._record_count > max(COMPACT_MIN_RECORDS, len(self._index) * 2):
+                self.compact()
+
+    def compact(self, max_entries=None):
+        with self._lock:
+            limit = int(max_entries) if max_entries else self._max_entries
+            items = list(self._index.items())
+            if limit and len(items) > limit:
+                items.sort(key=lambda item: item[1][1], reverse=True)
+                items = items[:limit]
+            self._index = dict(items)
+            self._pending = {}
+            self._write_all(self._index)
+            return len(self._index)
+
+    def prune(self, max_entries=None, max_age_days=None):
+        with self._lock:
+            if self.mismatched:
+                raise ValueError("{} was written with another layout or resolution; not pruning it.".format(self._path))
+            before = len(self._index)
+            if max_age_days is not None:
+                cutoff = _now() - int(float(max_age_days) * 86400)
+                self._index = {cell: entry for cell, entry in self._index.items() if entry[1] >= cutoff}
+            kept = self.compact(max_entries)
+            return kept, before - kept
+
+    def _ensure_parent(self):
+        parent = os.path.dirname(self._path)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+
+    def _write_all(self, index):
+        try:
+            self._ensure_parent()
+            temp_path = self._path + ".tmp"
+            with open(temp_path, "wb") as store_file:
+                store_file.write(_HEADER.pack(_MAGIC, self._resolution))
+                chunks = []
+                for cell, entry in index.items():
+                    chunks.append(_RECORD.pack(cell[0], cell[1], cell[2], entry[0], entry[1]))
+                    entry[2] = entry[1]
+                store_file.write(b"".join(chunks))
+            if os.path.isfile(self._path):
+                os.remove(self._path)
+            os.rename(temp_path, self._path)
+            self._record_count = len(index)
+        except Exception:
+            pass
+
+
+def open_store(path, resolution_deg=DEFAULT_RESOLUTION_DEG, max_entries=DEFAULT_MAX_ENTRIES):
+    key = (os.path.abspath(path), float(resolution_deg))
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = TerrainPointStore(path, resolution_deg, max_entries)
+            _STORES[key] = store
+    return store
+
+
+def migrate_legacy_json_cache(store, namespace, cache_root, grid_bucket="terrain_grid"):
+    """One-time import of the old per-file JSON terrain caches.
+
+    Legacy point files are keyed by an irreversible hash and hold no
+    coordinates, so only the cached terrain grids can be imported. The point
+    files are left in place: they also hold DSM and other-service samples
+    this namespace cannot claim.
+    """
+    marker_path = store.path + MIGRATION_MARKER_SUFFIX
+    if marker_path in _MIGRATED_PATHS:
+        return 0
+    if os.path.isfile(marker_path):
+        _MIGRATED_PATHS.add(marker_path)
+        return 0
+
+    imported = {}
+    for grid_path in glob.glob(os.path.join(cache_root, grid_bucket, "*.json")):
+        try:
+            with open(grid_path, "r") as grid_file:
+                grid = json.load(grid_file)
+        except Exception:
+            continue
+        for point in (grid or {}).get("points") or []:
+            try:
+                imported[(float(point["lat"]), float(point["lon"]))] = float(point["elevation_m"])
+            except Exception:
+                continue
+
+    if imported:
+        store.put_many(namespace, imported)
+        store.flush()
+
+    try:
+        with open(marker_path, "w") as marker_file:
+            marker_file.write(str(len(imported)))
+    except Exception:
+        pass
+    _MIGRATED_PATHS.add(marker_path)
+    return len(imported)
+
+
+def _main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="context_core.tile_cache", description="Maintain context builder terrain point caches.")
+    subparsers = parser.add_subparsers(dest="command")
+    prune_parser = subparsers.add_parser("prune", help="Compact a cache file and drop least recently used points.")
+    prune_parser.add_argument("path")
+    prune_parser.add_argument("--max-entries", type=int, default=DEFAULT_MAX_ENTRIES)
+    prune_parser.add_argument("--max-age-days", type=float, default=None)
+    prune_parser.add_argument("--resolution-deg", type=float, default=None, help="Expected resolution; defaults to the one in the file header.")
+    stats_parser = subparsers.add_parser("stats", help="Print entry count and file size.")
+    stats_parser.add_argument("path")
+    stats_parser.add_argument("--resolution-deg", type=float, default=None, help="Expected resolution; defaults to the one in the file header.")
+    args = parser.parse_args(argv)
+    if args.command not in ("prune", "stats"):
+        parser.print_help()
+        return 1
+
+    # Maintenance never rewrites a file it cannot read as written.
+    resolution = read_store_resolution(args.path)
+    if resolution is None:
+        print("{} is missing or is not a terrain point cache.".format(args.path))
+        return 1
+    if args.resolution_deg is not None and abs(args.resolution_deg - resolution) > 1e-15:
+        print("{} was written at {} degrees, not {}.".format(args.path, resolution, args.resolution_deg))
+        return 1
+
+    if args.command == "prune":
+        store = TerrainPointStore(args.path, resolution, args.max_entries)
+        kept, removed = store.prune(args.max_entries, args.max_age_days)
+        print("Kept {} points, removed {}.".format(kept, removed))
+        return 0
+    store = TerrainPointStore(args.path, resolution, 0)
+    print("{} points at {} degrees, {} bytes".format(len(store), resolution, os.path.getsize(args.path)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
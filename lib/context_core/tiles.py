@@ -0,0 +1,41 @@
+import math
+
+
+def latlon_to_tile(lat, lon, zoom):
+    tile_count = 2 ** int(zoom)
+    lat = max(-85.05112878, min(85.05112878, float(lat)))
+    lat_rad = math.radians(lat)
+    x = int(math.floor(((float(lon) + 180.0) / 360.0) * tile_count))
+    y = int(math.floor((1.0 - (math.log(math.tan(lat_rad) + (1.0 / math.cos(lat_rad))) / math.pi)) / 2.0 * tile_count))
+    return max(0, min(tile_count - 1, x)), max(0, min(tile_count - 1, y))
+
+
+def tile_bounds(zoom, x, y):
+    """Return (south, west, north, east) of a slippy-map tile."""
+    tile_count = float(2 ** int(zoom))
+
+    def _lat(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1.0 - (2.0 * tile_y / tile_count)))))
+
+    return _lat(y + 1), (x / tile_count * 360.0) - 180.0, _lat(y), ((x + 1) / tile_count * 360.0) - 180.0
+
+
+def tiles_for_bounds(bounds, zoom):
+    """Return (zoom, x, y) for every tile touching a (south, west, north, east) box."""
+    south, west, north, east = bounds
+    min_x, max_y = latlon_to_tile(south, west, zoom)
+    max_x, min_y = latlon_to_tile(north, east, zoom)
+    return [
+        (int(zoom), x, y)
+        for y in range(min_y, max_y + 1)
+        for x in range(min_x, max_x + 1)
+    ]
+
+
+def bounds_intersect(bounds_a, bounds_b):
+    return not (
+        bounds_a[2] < bounds_b[0]
+        or bounds_a[0] > bounds_b[2]
+        or bounds_a[3] < bounds_b[1]
+        or bounds_a[1] > bounds_b[3]
+    )
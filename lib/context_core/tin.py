@@ -0,0 +1,211 @@
+import heapq
+
+
+DEFAULT_TOLERANCE_M = 0.25
+SUPER_TRIANGLE_SCALE = 100.0
+BARYCENTRIC_EPSILON = 1e-9
+
+
+def _cross(o, a, b):
+    return ((a[0] - o[0]) * (b[1] - o[1])) - ((a[1] - o[1]) * (b[0] - o[0]))
+
+
+def convex_hull_indices(points):
+    """Indices of the convex hull of points[i] -> (x, y, ...), counter-clockwise, no collinear points."""
+    order = sorted(range(len(points)), key=lambda index: (points[index][0], points[index][1]))
+    if len(order) < 3:
+        return order
+
+    def _half(indices):
+        chain = []
+        for index in indices:
+            while len(chain) >= 2 and _cross(points[chain[-2]], points[chain[-1]], points[index]) <= 0:
+                chain.pop()
+            chain.append(index)
+        return chain
+
+    lower = _half(order)
+    upper = _half(reversed(order))
+    return lower[:-1] + upper[:-1]
+
+
+class _Triangulation(object):
+    """Incremental Delaunay triangulation (Bowyer-Watson) that tracks which
+    not-yet-inserted points fall in each triangle and how far each one sits
+    from the triangle's plane."""
+
+    def __init__(self, points):
+        self.vertices = [(float(point[0]), float(point[1]), float(point[2])) for point in points]
+        self.point_count = len(self.vertices)
+        min_x = min(vertex[0] for vertex in self.vertices)
+        min_y = min(vertex[1] for vertex in self.vertices)
+        max_x = max(vertex[0] for vertex in self.vertices)
+        max_y = max(vertex[1] for vertex in self.vertices)
+        span = max(max_x - min_x, max_y - min_y, 1.0) * SUPER_TRIANGLE_SCALE
+        mid_x = (min_x + max_x) / 2.0
+        mid_y = (min_y + max_y) / 2.0
+        self.vertices.extend([(mid_x - span, mid_y - span, None), (mid_x + span, mid_y - span, None), (mid_x, mid_y + span, None)])
+
+        self.triangles = {}
+        self.circles = {}
+        self.members = {}
+        self.edges = {}
+        self.errors = [None] * self.point_count
+        self.heap = []
+        self._next_id = 0
+        super_ids = (self.point_count, self.point_count + 1, self.point_count + 2)
+        self._add_triangles([super_ids], list(range(self.point_count)))
+
+    def _circumcircle(self, a, b, c):
+        ax, ay = self.vertices[a][0], self.vertices[a][1]
+        bx, by = self.vertices[b][0], self.vertices[b][1]
+        cx, cy = self.vertices[c][0], self.vertices[c][1]
+        d = 2.0 * ((ax * (by - cy)) + (bx * (cy - ay)) + (cx * (ay - by)))
+        if abs(d) <= 1e-18:
+            return ax, ay, float("inf")
+        a2 = (ax * ax) + (ay * ay)
+        b2 = (bx * bx) + (by * by)
+        c2 = (cx * cx) + (cy * cy)
+        ux = ((a2 * (by - cy)) + (b2 * (cy - ay)) + (c2 * (ay - by))) / d
+        uy = ((a2 * (cx - bx)) + (b2 * (ax - cx)) + (c2 * (bx - ax))) / d
+        return ux, uy, ((ax - ux) ** 2) + ((ay - uy) ** 2)
+
+    def _in_circle(self, triangle_id, point):
+        ux, uy, radius2 = self.circles[triangle_id]
+        return ((point[0] - ux) ** 2) + ((point[1] - uy) ** 2) < radius2
+
+    def _barycentric(self, triangle, point):
+        a, b, c = [self.vertices[index] for index in triangle]
+        area = _cross(a, b, c)
+        if abs(area) <= 1e-18:
+            return None
+        return _cross(point, b, c) / area, _cross(a, point, c) / area, _cross(a, b, point) / area
+
+    def _deviation(self, triangle, weights, point):
+        z_values = [self.vertices[index][2] for index in triangle]
+        if weights is None or None in z_values:
+            return float("inf")
+        return abs(point[2] - sum(weight * z for weight, z in zip(weights, z_values)))
+
+    def _add_triangles(self, triangles, candidates):
+        new_ids = []
+        for triangle in triangles:
+            triangle_id = self._next_id
+            self._next_id += 1
+            self.triangles[triangle_id] = triangle
+            self.circles[triangle_id] = self._circumcircle(*triangle)
+            self.members[triangle_id] = []
+            for start, end in ((triangle[0], triangle[1]), (triangle[1], triangle[2]), (triangle[2], triangle[0])):
+                self.edges[(start, end)] = triangle_id
+            new_ids.append(triangle_id)
+        # Prefer real triangles so points on the hull are not charged to the super triangle.
+        new_ids.sort(key=lambda triangle_id: max(self.triangles[triangle_id]) >= self.point_count)
+
+        for index in candidates:
+            point = self.vertices[index]
+            best = None
+            for triangle_id in new_ids:
+                weights = self._barycentric(self.triangles[triangle_id], point)
+                if weights is None:
+                    continue
+                smallest = min(weights)
+                if smallest >= -BARYCENTRIC_EPSILON:
+                    best = (smallest, triangle_id, weights)
+                    break
+                if best is None or smallest > best[0]:
+                    best = (smallest, triangle_id, weights)
+            if best is None:
+                continue
+            triangle_id, weights = best[1], best[2]
+            self.members[triangle_id].append(index)
+            self.errors[index] = self._deviation(self.triangles[triangle_id], weights, point)
+
+        for triangle_id in new_ids:
+            members = self.members[triangle_id]
+            if members:
+                worst = max(members, key=lambda index: self.errors[index])
+                heapq.heappush(self.heap, (-self.errors[worst], triangle_id, worst))
+
+    def locate(self, index):
+        for triangle_id, members in self.members.items():
+            if index in members:
+                return triangle_id
+        return None
+
+    def insert(self, index, triangle_id):
+        point = self.vertices[index]
+        bad = set([triangle_id])
+        stack = [triangle_id]
+        while stack:
+            current = self.triangles[stack.pop()]
+            for start, end in ((current[0], current[1]), (current[1], current[2]), (current[2], current[0])):
+                neighbour = self.edges.get((end, start))
+                if neighbour is not None and neighbour not in bad and self._in_circle(neighbour, point):
+                    bad.add(neighbour)
+                    stack.append(neighbour)
+
+        boundary = []
+        candidates = []
+        for bad_id in bad:
+            triangle = self.triangles[bad_id]
+            for start, end in ((triangle[0], triangle[1]), (triangle[1], triangle[2]), (triangle[2], triangle[0])):
+                if self.edges.get((end, start)) not in bad:
+                    boundary.append((start, end))
+            candidates.extend(member for member in self.members[bad_id] if member != index)
+
+        for bad_id in bad:
+            triangle = self.triangles.pop(bad_id)
+            del self.circles[bad_id]
+            del self.members[bad_id]
+            for start, end in ((triangle[0], triangle[1]), (triangle[1], triangle[2]), (triangle[2], triangle[0])):
+                if self.edges.get((start, end)) == bad_id:
+                    del self.edges[(start, end)]
+
+        self.errors[index] = 0.0
+        self._add_triangles([(start, end, index) for start, end in boundary], candidates)
+
+    def pop_worst(self):
+        while self.heap:
+            negative_error, triangle_id, index = heapq.heappop(self.heap)
+            members = self.members.get(triangle_id)
+            if members and index in members and self.errors[index] == -negative_error:
+                return -negative_error, triangle_id, index
+        return None
+
+
+def simplify_tin(points, tolerance_m=DEFAULT_TOLERANCE_M, max_points=None):
+    """Greedy-insertion TIN simplification of (x, y, z) points in metres.
+
+    Starts from the convex hull and keeps inserting the point furthest (in z)
+    from the current Delaunay surface until every dropped point is within
+    tolerance_m or max_points are kept. Flat ground collapses to a few large
+    triangles while breaks of slope keep their points. Returns (kept indices
+    in input order, stats) where stats reports the max and mean vertical
+    deviation of the dropped points from the simplified surface.
+    """
+    stats = {"input_count": len(points or []), "output_count": len(points or []), "max_deviation_m": 0.0, "mean_deviation_m": 0.0, "tolerance_m": tolerance_m}
+    if not points or len(points) < 4:
+        return list(range(len(points or []))), stats
+
+    triangulation = _Triangulation(points)
+    kept = set()
+    for index in convex_hull_indices(triangulation.vertices[:triangulation.point_count]):
+        triangle_id = triangulation.locate(index)
+        if triangle_id is not None:
+            triangulation.insert(index, triangle_id)
+            kept.add(index)
+
+    limit = len(points) if max_points is None else max(len(kept), int(max_points))
+    while len(kept) < limit:
+        worst = triangulation.pop_worst()
+        if worst is None or worst[0] <= tolerance_m:
+            break
+        triangulation.insert(worst[2], worst[1])
+        kept.add(worst[2])
+
+    deviations = [triangulation.errors[index] for index in range(len(points)) if index not in kept and triangulation.errors[index] is not None]
+    finite = [value for value in deviations if value != float("inf")]
+    stats["output_count"] = len(kept)
+    stats["max_deviation_m"] = max(finite) if finite else 0.0
+    stats["mean_deviation_m"] = (sum(finite) / float(len(finite))) if finite else 0.0
+    return sorted(kept), stats